@@ -1,7 +1,10 @@
-from itertools import zip_longest
-from typing import Any, Dict, List
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, zip_longest
+from typing import Any, Callable, Dict, Iterable, Iterator, List
 import random
 
+import numpy
+
 
 def group_by_count(iterable: List[Any], count: int, default_value: Any) -> List[List[Any]]:
     """
@@ -32,6 +35,41 @@ def add_noise_to_dict_values(dictionary: Dict[Any, float], noise_param: float) -
     return new_dict
 
 
+def add_noise_to_array_values(array: numpy.array, noise_param: float) -> numpy.array:
+    """
+    The array version of :func:`add_noise_to_dict_values`: returns a new float array with noise
+    added to every value in ``array``, uniformly distributed within ``noise_param`` percent of the
+    value.  This uses numpy's random number generator, not python's.
+    """
+    noise_values = array * noise_param
+    return array + numpy.random.uniform(-noise_values, noise_values)
+
+
+def map_over_shards(function: Callable,
+                    iterable: Iterable[Any],
+                    num_workers: int,
+                    *args,
+                    shard_size: int=1000) -> Iterator[Any]:
+    """
+    Splits ``iterable`` into lists of ``shard_size`` items, calls ``function(shard, *args)`` on
+    each one in a pool of ``num_workers`` processes, and yields the results in the order of the
+    shards.  We only read ahead far enough to keep ``2 * num_workers`` shards in flight, so
+    ``iterable`` can be a stream that doesn't fit in memory.  ``function`` and ``args`` get
+    pickled, so ``function`` needs to be defined at the top level of a module.
+    """
+    iterator = iter(iterable)
+    pending = []
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        while True:
+            shard = list(islice(iterator, shard_size))
+            if shard:
+                pending.append(executor.submit(function, shard, *args))
+            if not pending:
+                break
+            if not shard or len(pending) >= 2 * num_workers:
+                yield pending.pop(0).result()
+
+
 def clean_layer_name(input_name: str,
                      strip_right_of_last_backslash: bool=True,
                      strip_numerics_after_underscores: bool=True):
@@ -1,4 +1,6 @@
-from .datasets.dataset import Dataset, IndexedDataset, TextDataset
+from .datasets.dataset import Dataset, IndexedDataset, TextDataset, ColumnarIndexedDataset
+from .datasets.dataset import LazyTextDataset, LazyIndexedDataset
+from .datasets.indexed_dataset_cache import IndexedDatasetCache
 
 from .data_generator import DataGenerator
 from .data_indexer import DataIndexer
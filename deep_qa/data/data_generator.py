@@ -1,12 +1,15 @@
-from typing import List
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+import itertools
 import logging
 import random
-from copy import deepcopy
+
+import numpy
 
 from ..common.params import Params
-from ..common.util import group_by_count
-from . import IndexedDataset
-from .instances import IndexedInstance
+from . import IndexedDataset, LazyIndexedDataset
+from .tokenizers.tokenizer import Tokenizer
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
@@ -88,6 +91,30 @@ class DataGenerator:
         largest batch that you have in the data `first`, so that if you're going to run out of
         memory, you know it early, instead of waiting through the whole batch to find out at the
         end that you're going to crash.
+    prefetch_batches: int, optional (default=0)
+        If greater than zero, we will pad and convert up to this many batches `ahead` of the
+        consumer of the generator, using a pool of background workers, so that batch construction
+        overlaps with the forward and backward pass of the model.  This is the depth of the queue
+        of pending batches.  The order of the batches is identical to what you get without
+        prefetching, because batches are still grouped and shuffled (using ``random``) on the
+        calling thread; the workers only do the padding and the conversion to numpy arrays.
+    num_prefetch_workers: int, optional (default=1)
+        Only relevant if ``prefetch_batches`` is greater than zero.  The number of background
+        workers that pad and convert batches.
+    prefetch_worker_type: str, optional (default="thread")
+        Only relevant if ``prefetch_batches`` is greater than zero.  Either ``"thread"`` or
+        ``"process"``.  Threads are cheap to start and don't need to copy any data, but padding is
+        mostly python code, so they contend for the GIL with the training loop.  Processes avoid
+        that, at the cost of pickling each batch of instances (and the resulting arrays) between
+        processes.
+    shuffle_buffer_size: int, optional (default=10000)
+        Only relevant if the dataset is a :class:`~deep_qa.data.LazyIndexedDataset`, which we can't
+        hold in memory all at once.  For those datasets, we read this many instances at a time into
+        a buffer, and then sort, batch and shuffle the instances in each buffer just like we would
+        for a whole in-memory dataset.  Instances in different buffers never end up in the same
+        batch.  ``last_num_batches`` is computed from the number of instances and the (fixed)
+        batch size, so if you're using ``adaptive_batch_sizes`` with a lazy dataset, it is only an
+        estimate.
     """
     def __init__(self, text_trainer, params: Params):
         self.text_trainer = text_trainer
@@ -98,6 +125,11 @@ class DataGenerator:
         self.adaptive_memory_usage_constant = params.pop('adaptive_memory_usage_constant', False)
         self.maximum_batch_size = params.pop('maximum_batch_size', 1000000)
         self.biggest_batch_first = params.pop('biggest_batch_first', False)
+        self.prefetch_batches = params.pop('prefetch_batches', 0)
+        self.num_prefetch_workers = params.pop('num_prefetch_workers', 1)
+        self.prefetch_worker_type = params.pop_choice('prefetch_worker_type', ['thread', 'process'],
+                                                      default_to_first_choice=True)
+        self.shuffle_buffer_size = params.pop('shuffle_buffer_size', 10000)
 
         #: This field can be read after calling ``create_generator`` to get the number of steps you
         #: should take per epoch in ``model.fit_generator`` or ``model.evaluate_generator`` for
@@ -112,31 +144,115 @@ class DataGenerator:
         if batch_size is None:
             batch_size = self.text_trainer.batch_size
 
-        grouped_instances = self.__create_batches(dataset, batch_size)
-        self.last_num_batches = len(grouped_instances)
+        if isinstance(dataset, LazyIndexedDataset):
+            self.last_num_batches = self.__num_streaming_batches(len(dataset), batch_size)
+            group_generator = self.__stream_groups(dataset, batch_size)
+        else:
+            grouped_positions = self.__create_batches(dataset, batch_size)
+            self.last_num_batches = len(grouped_positions)
+            group_generator = self.__groups(dataset, batch_size, grouped_positions)
+        if self.prefetch_batches > 0:
+            return self.__prefetch(group_generator)
         def generator():
-            while True:
-                if self.sort_every_epoch:
-                    unpadded_dataset = deepcopy(dataset)
-                    groups = self.__create_batches(unpadded_dataset, batch_size)
-                else:
-                    groups = grouped_instances
-                for group in groups:
-                    batch = IndexedDataset(group)
-                    batch.pad_instances(self.text_trainer.get_padding_lengths(), verbose=False)
-                    yield batch.as_training_data()
+            for group in group_generator:
+                yield _pad_and_convert(group, self.text_trainer.get_padding_lengths(), *self.__word_masking())
         return generator()
 
-    def __create_batches(self, dataset: IndexedDataset, batch_size: int) -> List[List[IndexedInstance]]:
+    def __groups(self,
+                 dataset: IndexedDataset,
+                 batch_size: int,
+                 grouped_positions: List[numpy.array]) -> Iterator[IndexedDataset]:
+        """
+        Yields batches of instances from an in-memory dataset, forever, calling
+        ``dataset.start_epoch()`` before every epoch, and re-sorting and re-grouping the dataset
+        every epoch if ``self.sort_every_epoch`` is set.
+        """
+        while True:
+            dataset.start_epoch()
+            if self.sort_every_epoch:
+                # Padding never modifies the instances (see ``_pad_and_convert``), so we can
+                # just re-sort and re-group the same dataset, without copying it.
+                groups = self.__create_batches(dataset, batch_size)
+            else:
+                groups = grouped_positions
+            for group in groups:
+                # We select the batch here, before the dataset can be re-sorted for the next
+                # epoch, as the positions in ``group`` refer to the current sorted order.
+                yield dataset.select(group)
+
+    def __stream_groups(self, dataset: LazyIndexedDataset, batch_size: int) -> Iterator[IndexedDataset]:
+        """
+        Yields batches of instances from a lazy dataset, forever.  Each epoch is a pass over the
+        dataset, reading ``self.shuffle_buffer_size`` instances at a time into an in-memory
+        ``IndexedDataset``, which we batch the same way as a whole in-memory dataset.
+        """
+        while True:
+            instances = iter(dataset.instances)
+            while True:
+                buffer = IndexedDataset(list(itertools.islice(instances, self.shuffle_buffer_size)))
+                if len(buffer) == 0:
+                    break
+                for group in self.__create_batches(buffer, batch_size):
+                    yield buffer.select(group)
+
+    def __num_streaming_batches(self, num_instances: int, batch_size: int) -> int:
+        num_full_buffers, last_buffer_size = divmod(num_instances, self.shuffle_buffer_size)
+        batches_per_full_buffer = -(-self.shuffle_buffer_size // batch_size)
+        return num_full_buffers * batches_per_full_buffer + -(-last_buffer_size // batch_size)
+
+    def __prefetch(self, groups: Iterator[IndexedDataset]):
+        """
+        Hands each batch of instances off to a pool of workers to be padded and converted into
+        arrays, keeping at most ``self.prefetch_batches`` batches in flight.  We yield results in
+        the order the groups were submitted, not the order the workers finish them, so batch order
+        is the same as without prefetching.
+        """
+        if self.prefetch_worker_type == 'process':
+            executor = ProcessPoolExecutor(max_workers=self.num_prefetch_workers)
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.num_prefetch_workers)
+        pending = deque()
+        try:
+            for group in groups:
+                padding_lengths = self.text_trainer.get_padding_lengths()
+                pending.append(executor.submit(_pad_and_convert, group, padding_lengths, *self.__word_masking()))
+                if len(pending) >= self.prefetch_batches:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # If the generator was closed (or garbage collected) before we got to the end, there
+            # can still be batches in flight; we cancel them, so the workers stop making batches
+            # nobody will use.
+            while pending:
+                pending.popleft().cancel()
+            executor.shutdown(wait=False)
+
+    def __word_masking(self) -> Tuple[Tokenizer, numpy.array]:
+        """
+        Returns the tokenizer and word mask that ``_pad_and_convert`` should use to mask words out
+        of each batch (see :func:`~deep_qa.training.TextTrainer.get_input_word_mask`), or
+        ``(None, None)`` if we shouldn't mask anything, or if ``text_trainer`` doesn't know how to
+        mask words.
+        """
+        word_mask = getattr(self.text_trainer, 'get_input_word_mask', lambda: None)()
+        if word_mask is None:
+            return None, None
+        return self.text_trainer.tokenizer, word_mask
+
+    def __create_batches(self, dataset: IndexedDataset, batch_size: int) -> List[numpy.array]:
+        """
+        Sorts the dataset (if we're doing dynamic padding) and groups it into batches.  Each batch
+        is an array of positions in the (sorted) dataset, to be passed to ``dataset.select()``.
+        """
         if self.dynamic_padding:
             dataset.sort_by_padding(self.text_trainer.get_instance_sorting_keys(), self.padding_noise)
-        instances = dataset.instances
         if self.adaptive_batch_sizes:
-            grouped_instances = self.__adaptive_grouping(instances)
+            grouped_instances = self.__adaptive_grouping(dataset)
         else:
-            grouped_instances = group_by_count(instances, batch_size, None)
-            grouped_instances[-1] = [instance for instance in grouped_instances[-1] if instance is not None]
-        if self.biggest_batch_first:
+            positions = numpy.arange(len(dataset))
+            grouped_instances = numpy.split(positions, range(batch_size, len(dataset), batch_size))
+        if self.biggest_batch_first and len(grouped_instances) > 1:
             # We'll actually pop the last _two_ batches, because the last one might not
             # be full.
             last_batch = grouped_instances.pop()
@@ -148,28 +264,79 @@ class DataGenerator:
             random.shuffle(grouped_instances)
         return grouped_instances
 
-    def __adaptive_grouping(self, instances: List[IndexedInstance]):
-        batches = []
-        current_batch = []
-        current_lengths = {}
+    def __adaptive_grouping(self, dataset: IndexedDataset) -> List[numpy.array]:
+        """
+        Greedily groups the (sorted) dataset into the largest batches we can, such that
+        ``batch_size * get_padding_memory_scaling(batch_padding_lengths)`` stays under
+        ``self.adaptive_memory_usage_constant``, and ``batch_size`` stays under
+        ``self.maximum_batch_size``.  Every batch has at least one instance.
+
+        Instead of adding instances one at a time, we look at a window of candidate instances
+        following the start of the batch, take running maxima of the padding length arrays over
+        that window, and evaluate the memory scaling function on all of those running maxima at
+        once.  The first position that goes over the memory limit ends the batch.  If nothing in
+        the window goes over the limit, we double the window and try again; the window for the next
+        batch starts at twice the size of this one, so most batches only need one evaluation.
+        """
+        length_arrays = dataset.padding_length_arrays()
+        num_instances = len(dataset)
         logger.debug("Creating adatpive groups")
-        for instance in instances:
-            current_batch.append(instance)
-            instance_lengths = instance.get_padding_lengths()
-            for key in instance_lengths:
-                current_lengths[key] = max(instance_lengths[key], current_lengths.get(key, -1))
-            big_o_memory_constant = self.text_trainer.get_padding_memory_scaling(current_lengths)
-            if (len(current_batch) * big_o_memory_constant > self.adaptive_memory_usage_constant
-                        or len(current_batch) > self.maximum_batch_size):
-                current_batch.pop()
-                if logger.getEffectiveLevel() <= logging.DEBUG:
-                    padding_lengths = IndexedDataset(current_batch).padding_lengths()
-                    logger.debug("Batch size: %d; padding: %s", len(current_batch), padding_lengths)
-                batches.append(current_batch)
-                current_batch = [instance]
-                current_lengths = instance_lengths
-        if logger.getEffectiveLevel() <= logging.DEBUG:
-            padding_lengths = IndexedDataset(current_batch).padding_lengths()
-            logger.debug("Batch size: %d; padding: %s", len(current_batch), padding_lengths)
-        batches.append(current_batch)
+        batches = []
+        batch_start = 0
+        window_size = 1
+        while batch_start < num_instances:
+            largest_batch_size = min(self.maximum_batch_size, num_instances - batch_start)
+            while True:
+                window_size = min(window_size, largest_batch_size)
+                memory_costs = self.__batch_memory_costs(length_arrays, batch_start, window_size)
+                over_limit = numpy.flatnonzero(memory_costs > self.adaptive_memory_usage_constant)
+                if len(over_limit) > 0:
+                    batch_size = max(int(over_limit[0]), 1)
+                    break
+                if window_size == largest_batch_size:
+                    batch_size = window_size
+                    break
+                window_size *= 2
+            batch = numpy.arange(batch_start, batch_start + batch_size)
+            if logger.getEffectiveLevel() <= logging.DEBUG:
+                padding_lengths = dataset.select(batch).padding_lengths()
+                logger.debug("Batch size: %d; padding: %s", batch_size, padding_lengths)
+            batches.append(batch)
+            batch_start += batch_size
+            window_size = 2 * batch_size
         return batches
+
+    def __batch_memory_costs(self,
+                             length_arrays: Dict[str, numpy.array],
+                             batch_start: int,
+                             window_size: int) -> numpy.array:
+        """
+        Returns an array whose ``i``-th entry is the memory cost (as used by
+        :func:`__adaptive_grouping`) of a batch containing the ``i + 1`` instances starting at
+        ``batch_start``.  This passes arrays of padding lengths to
+        :func:`~deep_qa.training.TextTrainer.get_padding_memory_scaling`, so that method needs to
+        be written using element-wise arithmetic.
+        """
+        window = slice(batch_start, batch_start + window_size)
+        running_maxima = {key: numpy.maximum.accumulate(lengths[window].astype('int64'))
+                          for key, lengths in length_arrays.items()}
+        memory_scaling = self.text_trainer.get_padding_memory_scaling(running_maxima)
+        return numpy.arange(1, window_size + 1) * memory_scaling
+
+def _pad_and_convert(batch: IndexedDataset,
+                     padding_lengths: Dict[str, int],
+                     tokenizer: Tokenizer=None,
+                     word_mask: numpy.array=None) -> Tuple[numpy.array, numpy.array]:
+    """
+    Pads a single batch of instances and converts it into (inputs, labels) arrays.  The padded
+    arrays are built fresh for each batch; the instances themselves are left unpadded, so they can
+    be re-batched with different padding lengths in the next epoch.  This is a module-level
+    function, instead of a method on ``DataGenerator``, so that it can be pickled and sent to a
+    worker process when prefetching with ``prefetch_worker_type="process"``.  If ``word_mask`` is
+    given, we use ``tokenizer`` to mask those words out of the inputs.
+    """
+    batch.pad_instances(padding_lengths, verbose=False)
+    inputs, labels = batch.as_training_data()
+    if word_mask is not None:
+        inputs = tokenizer.mask_words(inputs, word_mask)
+    return inputs, labels
@@ -1,9 +1,15 @@
-from collections import defaultdict
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Tuple
 import codecs
+import hashlib
+import json
 import logging
 
+import numpy
 import tqdm
 
+from ..common.util import map_over_shards
+
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
 
@@ -19,32 +25,119 @@ class DataIndexer:
     for 'a' as a word, and 'a' as a character, for instance.  Most of the methods on this class
     allow you to pass in a namespace; by default we use the 'words' namespace, and you can omit the
     namespace argument everywhere and just use the default.
+
+    Parameters
+    ----------
+    padding_token: str, optional (default="@@PADDING@@")
+        The token at index 0 of every namespace.
+    oov_token: str, optional (default="@@UNKOWN@@")
+        The token at index 1 of every namespace, which we map out-of-vocabulary words to.
+    finalized: bool, optional (default=False)
+        Whether the vocabulary is fixed already; see :func:`finalize`.  This is mostly for
+        :func:`load_from_file`.
     """
-    def __init__(self):
+    def __init__(self,
+                 padding_token: str="@@PADDING@@",
+                 oov_token: str="@@UNKOWN@@",
+                 finalized: bool=False):
         # Typically all input words to this code are lower-cased, so we could simply use "PADDING"
         # for this.  But doing it this way, with special characters, future-proofs the code in case
         # it is used later in a setting where not all input is lowercase.
-        self._padding_token = "@@PADDING@@"
-        self._oov_token = "@@UNKOWN@@"
-        self.word_indices = defaultdict(lambda: {self._padding_token: 0, self._oov_token: 1})
-        self.reverse_word_indices = defaultdict(lambda: {0: self._padding_token, 1: self._oov_token})
-        self._finalized = False
+        self._padding_token = padding_token
+        self._oov_token = oov_token
+        # For each namespace, ``word_indices`` maps words to their indices, and
+        # ``reverse_word_indices`` is the list of words in index order, so that both directions are
+        # a single lookup.  Namespaces are created (with the padding and OOV tokens) the first
+        # time they're used; see ``_get_namespace``.
+        self.word_indices = {}  # type: Dict[str, Dict[str, int]]
+        self.reverse_word_indices = {}  # type: Dict[str, List[str]]
+        # For each namespace, how many times each word was seen by ``fit_word_dictionary``.
+        self.word_counts = {}  # type: Dict[str, Dict[str, int]]
+        self._finalized = finalized
+        # For each character namespace, the character indices of each word we've indexed with
+        # ``get_character_indices``.  This is cleared whenever the namespace changes.
+        self._character_index_cache = {}  # type: Dict[str, Dict[str, Tuple[int, ...]]]
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_character_index_cache'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.word_counts = {}
+        self.__dict__.update(state)
+        self._character_index_cache = {}
+        # DataIndexers pickled by older versions of this code kept the reverse indices as
+        # dictionaries (in a ``defaultdict``); we convert those to lists.
+        self.word_indices = dict(self.word_indices)
+        self.reverse_word_indices = {namespace: self._reverse_index_list(words)
+                                     for namespace, words in self.reverse_word_indices.items()}
+
+    @staticmethod
+    def _reverse_index_list(words) -> List[str]:
+        if isinstance(words, dict):
+            return [words[index] for index in range(len(words))]
+        return list(words)
+
+    def _get_namespace(self, namespace: str) -> Dict[str, int]:
+        """
+        Returns the word indices for ``namespace``, creating the namespace if we haven't seen it
+        before.
+        """
+        word_indices = self.word_indices.get(namespace)
+        if word_indices is None:
+            word_indices = {self._padding_token: 0, self._oov_token: 1}
+            self.word_indices[namespace] = word_indices
+            self.reverse_word_indices[namespace] = [self._padding_token, self._oov_token]
+        return word_indices
+
+    def save_to_file(self, filename: str):
+        """
+        Saves this ``DataIndexer`` as JSON, storing just the list of words in each namespace (and
+        the word counts).  This is much smaller, and much faster to load with
+        :func:`load_from_file`, than a pickle of the whole object.
+        """
+        state = {
+                'padding_token': self._padding_token,
+                'oov_token': self._oov_token,
+                'finalized': self._finalized,
+                'namespaces': self.reverse_word_indices,
+                'word_counts': self.word_counts,
+                }
+        with codecs.open(filename, 'w', 'utf-8') as output_file:
+            json.dump(state, output_file, ensure_ascii=False)
+
+    @classmethod
+    def load_from_file(cls, filename: str) -> 'DataIndexer':
+        """
+        Loads a ``DataIndexer`` saved with :func:`save_to_file`.
+        """
+        with codecs.open(filename, 'r', 'utf-8') as input_file:
+            state = json.load(input_file)
+        data_indexer = cls(padding_token=state['padding_token'],
+                           oov_token=state['oov_token'],
+                           finalized=state['finalized'])
+        for namespace, words in state['namespaces'].items():
+            data_indexer.word_indices[namespace] = dict(zip(words, range(len(words))))
+            data_indexer.reverse_word_indices[namespace] = words
+        data_indexer.word_counts = state.get('word_counts', {})
+        return data_indexer
 
     def set_from_file(self, filename: str, oov_token: str="@@UNKNOWN@@", namespace: str="words"):
         self._oov_token = oov_token
-        self.word_indices[namespace] = {self._padding_token: 0}
-        self.reverse_word_indices[namespace] = {0: self._padding_token}
+        words = [self._padding_token]
         with codecs.open(filename, 'r', 'utf-8') as input_file:
-            for i, line in enumerate(input_file.readlines()):
-                token = line[:-1]  # remove the newline
-                self.word_indices[namespace][token] = i + 1
-                self.reverse_word_indices[namespace][i + 1] = token
+            for line in input_file:
+                words.append(line[:-1])  # remove the newline
+        self.word_indices[namespace] = dict(zip(words, range(len(words))))
+        self.reverse_word_indices[namespace] = words
+        self._character_index_cache.pop(namespace, None)
 
     def finalize(self):
         logger.info("Finalizing data indexer")
         self._finalized = True
 
-    def fit_word_dictionary(self, dataset, min_count: int=1):
+    def fit_word_dictionary(self, dataset, min_count: int=1, num_workers: int=1):
         """
         Given a ``Dataset``, this method decides which words are given an index, and which ones are
         mapped to an OOV token (in this case "UNK").  This method must be called before any dataset
@@ -52,7 +145,8 @@ class DataIndexer:
         basically map every token onto "UNK".
 
         We call ``instance.words()`` for each instance in the dataset, and then keep all words that
-        appear at least ``min_count`` times.
+        appear at least ``min_count`` times.  We also remember how many times we saw each word we
+        kept (see :func:`get_word_count`).
 
         Parameters
         ----------
@@ -62,6 +156,11 @@ class DataIndexer:
         min_count: int, optional (default=1)
             The minimum number of occurences a word must have in the dataset
             in order to be assigned an index.
+
+        num_workers: int, optional (default=1)
+            If greater than one, we tokenize and count the words in the dataset in this many
+            worker processes, a shard of instances at a time, and merge the counts.  The resulting
+            vocabulary (including the order of the indices) is the same as with one worker.
         """
         logger.info("Fitting word dictionary with min count of %d, finalized is %s",
                     min_count, self._finalized)
@@ -69,16 +168,22 @@ class DataIndexer:
             logger.warning("Trying to fit a finalized DataIndexer.  This is a no-op.  Did you "
                            "really want to do this?")
             return
-        namespace_word_counts = defaultdict(lambda: defaultdict(int))
-        for instance in tqdm.tqdm(dataset.instances):
-            namespace_dict = instance.words()
-            for namespace in namespace_dict:
-                for word in namespace_dict[namespace]:
-                    namespace_word_counts[namespace][word] += 1
+        if num_workers > 1:
+            namespace_word_counts = defaultdict(Counter)
+            # Importing this at the top of the module would be circular.
+            from .instances.instance import TextInstance
+            tokenizer = TextInstance.tokenizer
+            for shard_counts in map_over_shards(_count_words, dataset.instances, num_workers, tokenizer):
+                for namespace, word_counts in shard_counts.items():
+                    namespace_word_counts[namespace].update(word_counts)
+        else:
+            namespace_word_counts = _count_words(tqdm.tqdm(dataset.instances))
         for namespace in tqdm.tqdm(namespace_word_counts):
+            kept_word_counts = self.word_counts.setdefault(namespace, {})
             for word, count in namespace_word_counts[namespace].items():
                 if count >= min_count:
                     self.add_word_to_index(word, namespace)
+                    kept_word_counts[word] = kept_word_counts.get(word, 0) + count
 
     def add_word_to_index(self, word: str, namespace: str='words') -> int:
         """
@@ -88,26 +193,115 @@ class DataIndexer:
         if self._finalized:
             logger.warning("Trying to add a word to a finalized DataIndexer.  This is a no-op.  "
                            "Did you really want to do this?")
-            return self.word_indices[namespace].get(word, -1)
-        if word not in self.word_indices[namespace]:
-            index = len(self.word_indices[namespace])
-            self.word_indices[namespace][word] = index
-            self.reverse_word_indices[namespace][index] = word
-            return index
-        else:
-            return self.word_indices[namespace][word]
+            return self._get_namespace(namespace).get(word, -1)
+        word_indices = self._get_namespace(namespace)
+        index = word_indices.get(word)
+        if index is None:
+            index = len(word_indices)
+            word_indices[word] = index
+            self.reverse_word_indices[namespace].append(word)
+            self._character_index_cache.pop(namespace, None)
+        return index
 
-    def words_in_index(self, namespace: str='words'):
-        return self.word_indices[namespace].keys()
+    def words_in_index(self, namespace: str='words') -> List[str]:
+        """
+        Returns the words in ``namespace``, in index order.  This is the ``DataIndexer``'s own
+        list, so don't modify it.
+        """
+        self._get_namespace(namespace)
+        return self.reverse_word_indices[namespace]
 
     def get_word_index(self, word: str, namespace: str='words'):
-        if word in self.word_indices[namespace]:
-            return self.word_indices[namespace][word]
-        else:
-            return self.word_indices[namespace][self._oov_token]
+        word_indices = self._get_namespace(namespace)
+        index = word_indices.get(word)
+        if index is None:
+            return word_indices[self._oov_token]
+        return index
+
+    def get_word_indices(self, words: List[str], namespace: str='words') -> numpy.array:
+        """
+        Like :func:`get_word_index`, but for a whole list of words at once, returning an ``int32``
+        array.  This is a lot faster than calling ``get_word_index`` for each word.
+        """
+        word_indices = self._get_namespace(namespace)
+        oov_index = word_indices.get(self._oov_token)
+        get_index = word_indices.get
+        return numpy.fromiter((get_index(word, oov_index) for word in words), dtype='int32', count=len(words))
+
+    def get_character_indices(self, words: List[str], namespace: str='characters') -> List[Tuple[int, ...]]:
+        """
+        Returns, for each of the given words, the indices of its characters in ``namespace``.  We
+        cache the result for each distinct word, so the characters of a word only get looked up the
+        first time we see it, not every time it occurs.
+        """
+        cache = self._character_index_cache.get(namespace)
+        if cache is None:
+            cache = self._character_index_cache[namespace] = {}
+        character_indices = []
+        for word in words:
+            indices = cache.get(word)
+            if indices is None:
+                indices = cache[word] = tuple(self.get_word_indices(list(word), namespace).tolist())
+            character_indices.append(indices)
+        return character_indices
+
+    def get_word_count(self, word: str, namespace: str='words') -> int:
+        """
+        Returns the number of times ``word`` was seen when fitting the word dictionary, or 0 if it
+        wasn't (e.g., if it was added with :func:`add_word_to_index` or :func:`set_from_file`).
+        """
+        return self.word_counts.get(namespace, {}).get(word, 0)
 
     def get_word_from_index(self, index: int, namespace: str='words'):
+        self._get_namespace(namespace)
         return self.reverse_word_indices[namespace][index]
 
     def get_vocab_size(self, namespace: str='words'):
-        return len(self.word_indices[namespace])
+        self._get_namespace(namespace)
+        return len(self.reverse_word_indices[namespace])
+
+    def get_word_mask(self, words: Iterable[str], namespace: str='words') -> numpy.array:
+        """
+        Returns a boolean array with one entry per index in ``namespace``, which is ``True`` for the
+        indices of the given words (words that aren't in the vocabulary are ignored).  You can
+        index this array with an array of word indices to find, in one vectorized operation, which
+        of them are in ``words``.
+        """
+        mask = numpy.zeros(self.get_vocab_size(namespace), dtype='bool')
+        word_indices = self._get_namespace(namespace)
+        for word in words:
+            if word in word_indices:
+                mask[word_indices[word]] = True
+        return mask
+
+    def fingerprint(self) -> str:
+        """
+        Returns a hash of the current state of this ``DataIndexer`` (every namespace, and the
+        words in it in index order).  Two ``DataIndexers`` with the same fingerprint index any
+        dataset the same way, so you can use this as part of a cache key for indexed data.
+        """
+        hasher = hashlib.sha1()
+        hasher.update(("%s\0%s\0%s\0" % (self._padding_token, self._oov_token, self._finalized)).encode('utf-8'))
+        for namespace in sorted(self.word_indices):
+            hasher.update(("%s\0" % namespace).encode('utf-8'))
+            for index, word in enumerate(self.reverse_word_indices[namespace]):
+                hasher.update(("%s\0%d\0" % (word, index)).encode('utf-8'))
+        return hasher.hexdigest()
+
+
+def _count_words(instances: Iterable, tokenizer=None) -> Dict[str, Counter]:
+    """
+    Counts the words in each namespace of the given ``TextInstances``.  If ``tokenizer`` is given,
+    we set it as the ``TextInstance`` tokenizer first, because a worker process might not have the
+    tokenizer that the main process set up.
+    """
+    # Importing this at the top of the module would be circular.
+    from .instances.instance import TextInstance
+    if tokenizer is not None:
+        TextInstance.tokenizer = tokenizer
+    namespace_word_counts = defaultdict(Counter)
+    for instance in TextInstance.tokenize_in_batches(instances):
+        for namespace, words in instance.words().items():
+            namespace_word_counts[namespace].update(words)
+    return namespace_word_counts
+
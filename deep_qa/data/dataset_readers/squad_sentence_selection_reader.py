@@ -1,14 +1,18 @@
 import argparse
+import bisect
 from collections import Counter
+import itertools
 import json
 import logging
 import os
 import random
-from typing import List, Tuple
+from typing import Any, Dict, Iterable, List, Tuple
 
 import numpy
 from tqdm import tqdm
 
+from ...common.util import map_over_shards
+
 logger = logging.getLogger(__name__) # pylint: disable=invalid-name
 
 random.seed(2157)
@@ -24,8 +28,9 @@ def main():
     parser.add_argument('--output_directory',
                         help='Output directory. Make sure to end the string with a /')
     parser.add_argument('--negatives', default='paragraph', help="See class docstring")
+    parser.add_argument('--num_workers', type=int, default=1, help="See class docstring")
     args = parser.parse_args()
-    reader = SquadSentenceSelectionReader(args.output_directory, args.negatives)
+    reader = SquadSentenceSelectionReader(args.output_directory, args.negatives, args.num_workers)
     reader.read_file(args.input_filename)
 
 
@@ -54,76 +59,109 @@ class SquadSentenceSelectionReader():
             example; we don't filter out that case).
 
         We will process these options in order, so the "pad-to-[int]" option mostly only makes
-        sense as the last option.
+        sense as the last option.  The random options draw their sentences (or questions) for all
+        of the questions in the file at once.
+    num_workers: int, optional (default=1)
+        If greater than one, we split the paragraphs of the input file into sentences in this many
+        worker processes, a few articles at a time.  The output is the same as with one process.
     """
-    def __init__(self, output_directory: str=None, negative_sentence_selection: str="paragraph"):
+    def __init__(self,
+                 output_directory: str=None,
+                 negative_sentence_selection: str="paragraph",
+                 num_workers: int=1):
         self.output_directory = output_directory
         self.negative_sentence_selection_methods = negative_sentence_selection.split(",")
+        self.num_workers = num_workers
 
         # Initializing some data structures here that will be useful when reading a file.
-        # Maps sentence strings to sentence indices
-        self.sentence_to_id = {}
-        # Maps sentence indices to sentence strings
-        self.id_to_sentence = {}
-        # Maps paragraph ids to lists of contained sentence ids
-        self.paragraph_sentences = {}
+        # Maps sentence indices to sentence strings.  The sentences of each paragraph get
+        # consecutive indices.
+        self.id_to_sentence = []
+        # Paragraph ``i`` holds the sentences with ids in ``[paragraph_offsets[i],
+        # paragraph_offsets[i + 1])``.
+        self.paragraph_offsets = numpy.zeros(1, dtype='int64')
         # Maps sentence ids to the containing paragraph id.
-        self.sentence_paragraph_map = {}
-        # Maps question strings to question indices
-        self.question_to_id = {}
+        self.sentence_paragraph_map = numpy.zeros(0, dtype='int64')
         # Maps question indices to question strings
-        self.id_to_question = {}
+        self.id_to_question = []
 
     def _clear_state(self):
-        self.sentence_to_id.clear()
-        self.id_to_sentence.clear()
-        self.paragraph_sentences.clear()
-        self.sentence_paragraph_map.clear()
-        self.question_to_id.clear()
-        self.id_to_question.clear()
-
-    def _get_sentence_choices(self, question_id: int, answer_id: int) -> Tuple[List[str], int]:
+        self.id_to_sentence = []
+        self.paragraph_offsets = numpy.zeros(1, dtype='int64')
+        self.sentence_paragraph_map = numpy.zeros(0, dtype='int64')
+        self.id_to_question = []
+
+    def _sample_negatives(self, num_questions: int) -> Dict[str, numpy.array]:
+        """
+        Draws the random sentences (or questions) for every question at once, for each of the
+        random negative sentence selection methods, so we don't have to call
+        ``numpy.random.choice`` (which shuffles the whole population) once per question.  Returns
+        a mapping from selection method to a ``(num_questions, num_to_pick)`` array of ids.
+        """
+        num_sentences = len(self.id_to_sentence)
+        sampled_ids = {}
+        for selection_method in self.negative_sentence_selection_methods:
+            if selection_method.startswith("random-"):
+                num_to_pick = int(selection_method.split('-')[1])
+                sampled_ids[selection_method] = _sample_distinct(num_sentences, num_questions, num_to_pick)
+            elif selection_method.startswith("pad-to-"):
+                desired_num_sentences = int(selection_method.split('-')[2])
+                if desired_num_sentences >= num_sentences:
+                    raise RuntimeError("Not enough sentences to pick from")
+                # These are candidates; we take them in order, skipping the answer and sentences
+                # we've already picked, until we have enough (see ``_get_sentence_choices``).
+                num_candidates = min(num_sentences, 2 * desired_num_sentences + 1)
+                sampled_ids[selection_method] = _sample_distinct(num_sentences, num_questions, num_candidates)
+            elif selection_method.startswith("questions-random-"):
+                num_to_pick = int(selection_method.split('-')[2])
+                sampled_ids[selection_method] = _sample_distinct(len(self.id_to_question),
+                                                                 num_questions,
+                                                                 num_to_pick)
+        return sampled_ids
+
+    def _get_sentence_choices(self,
+                              question_id: int,
+                              answer_id: int,
+                              sampled_ids: Dict[str, numpy.array]) -> Tuple[List[str], int]:
         # Because sentences and questions have different indices, we need this to hold tuples of
         # ("sentence", id) or ("question", id), instead of just single ids.
         negative_sentences = set()
         for selection_method in self.negative_sentence_selection_methods:
             if selection_method == 'paragraph':
                 paragraph_id = self.sentence_paragraph_map[answer_id]
-                paragraph_sentences = self.paragraph_sentences[paragraph_id]
+                paragraph_sentences = range(self.paragraph_offsets[paragraph_id],
+                                            self.paragraph_offsets[paragraph_id + 1])
                 negative_sentences.update(("sentence", sentence_id)
                                           for sentence_id in paragraph_sentences
                                           if sentence_id != answer_id)
             elif selection_method.startswith("random-"):
-                num_to_pick = int(selection_method.split('-')[1])
-                num_sentences = len(self.sentence_to_id)
                 # We'll ignore here the small probability that we pick `answer_id`, or a
                 # sentence we've chosen previously.
-                selected_ids = numpy.random.choice(num_sentences, (num_to_pick,), replace=False)
                 negative_sentences.update(("sentence", sentence_id)
-                                          for sentence_id in selected_ids
+                                          for sentence_id in sampled_ids[selection_method][question_id]
                                           if sentence_id != answer_id)
             elif selection_method.startswith("pad-to-"):
                 desired_num_sentences = int(selection_method.split('-')[2])
-                # Because we want to pad to a specific number of sentences, we'll do the choice
-                # logic in a loop, to be sure we actually get to the right number.
+                for sentence_id in sampled_ids[selection_method][question_id]:
+                    if desired_num_sentences <= len(negative_sentences):
+                        break
+                    if sentence_id != answer_id:
+                        negative_sentences.add(("sentence", sentence_id))
+                # If most of the candidates were already picked, we fall back to sampling from
+                # everything until we have enough.  This is rare.
                 while desired_num_sentences > len(negative_sentences):
                     num_to_pick = desired_num_sentences - len(negative_sentences)
-                    num_sentences = len(self.sentence_to_id)
-                    if num_to_pick > num_sentences:
-                        raise RuntimeError("Not enough sentences to pick from")
-                    selected_ids = numpy.random.choice(num_sentences, (num_to_pick,), replace=False)
+                    selected_ids = numpy.random.choice(len(self.id_to_sentence), (num_to_pick,), replace=False)
                     negative_sentences.update(("sentence", sentence_id)
                                               for sentence_id in selected_ids
                                               if sentence_id != answer_id)
             elif selection_method == "question":
                 negative_sentences.add(("question", question_id))
             elif selection_method.startswith("questions-random-"):
-                num_to_pick = int(selection_method.split('-')[2])
-                num_questions = len(self.question_to_id)
                 # We'll ignore here the small probability that we pick `question_id`, or a
                 # question we've chosen previously.
-                selected_ids = numpy.random.choice(num_questions, (num_to_pick,), replace=False)
-                negative_sentences.update(("question", q_id) for q_id in selected_ids)
+                negative_sentences.update(("question", q_id)
+                                          for q_id in sampled_ids[selection_method][question_id])
             else:
                 raise RuntimeError("Unrecognized selection method:", selection_method)
         choices = list(negative_sentences) + [("sentence", answer_id)]
@@ -138,82 +176,43 @@ class SquadSentenceSelectionReader():
         return sentence_choices, correct_choice
 
     def read_file(self, input_filepath: str):
-        # Import is here, since it isn't necessary by default.
-        import nltk
         self._clear_state()
 
-        # Holds tuples of (question_text, answer_sentence_id)
-        questions = []
         logger.info("Reading file at %s", input_filepath)
         with open(input_filepath) as dataset_file:
             dataset_json = json.load(dataset_file)
             dataset = dataset_json['data']
         logger.info("Reading the dataset")
-        for article in tqdm(dataset):
-            for paragraph in article['paragraphs']:
-                paragraph_id = len(self.paragraph_sentences)
-                self.paragraph_sentences[paragraph_id] = []
-
-                context_article = paragraph["context"]
-                # replace newlines in the context article
-                cleaned_context_article = context_article.replace("\n", "")
-
-                # Split the cleaned_context_article into a list of sentences.
-                sentences = nltk.sent_tokenize(cleaned_context_article)
-
-                # Make a dict from span indices to sentence. The end span is
-                # exclusive, and the start span is inclusive.
-                span_to_sentence_index = {}
-                current_index = 0
-                for sentence in sentences:
-                    sentence_id = len(self.sentence_to_id)
-                    self.sentence_to_id[sentence] = sentence_id
-                    self.id_to_sentence[sentence_id] = sentence
-                    self.sentence_paragraph_map[sentence_id] = paragraph_id
-                    self.paragraph_sentences[paragraph_id].append(sentence_id)
-
-                    sentence_len = len(sentence)
-                    # Need to add one to the end index to account for the
-                    # trailing space after punctuation that is stripped by NLTK.
-                    span_to_sentence_index[(current_index,
-                                            current_index + sentence_len + 1)] = sentence
-                    current_index += sentence_len + 1
-                for question_answer in paragraph['qas']:
-                    question_text = question_answer["question"].strip()
-                    question_id = len(self.question_to_id)
-                    self.question_to_id[question_text] = question_id
-                    self.id_to_question[question_id] = question_text
-
-                    # There may be multiple answer annotations, so pick the one
-                    # that occurs the most.
-                    candidate_answer_start_indices = Counter()
-                    for answer in question_answer["answers"]:
-                        candidate_answer_start_indices[answer["answer_start"]] += 1
-                    answer_start_index, _ = candidate_answer_start_indices.most_common(1)[0]
-
-                    # Get the full sentence corresponding to the answer.
-                    answer_sentence = None
-                    for span_tuple in span_to_sentence_index:
-                        start_span, end_span = span_tuple
-                        if start_span <= answer_start_index and answer_start_index < end_span:
-                            answer_sentence = span_to_sentence_index[span_tuple]
-                            break
-                    else:  # no break
-                        raise ValueError("Index of answer start was out of bounds. "
-                                         "This should never happen, please raise "
-                                         "an issue on GitHub.")
-
-                    # Now that we have the string of the full sentence, we need to
-                    # search for it in our shuffled list to get the index.
-                    answer_id = self.sentence_to_id[answer_sentence]
-
-                    # Now we can make the string representation and add this
-                    # to the list of processed_rows.
-                    questions.append((question_id, answer_id))
+        if self.num_workers > 1:
+            # Sentence splitting is most of the work here, so we split the articles in a pool of
+            # worker processes, and only assign ids to the sentences and questions in this one.
+            paragraphs = itertools.chain.from_iterable(tqdm(map_over_shards(_split_paragraphs,
+                                                                            dataset,
+                                                                            self.num_workers,
+                                                                            shard_size=10)))
+        else:
+            paragraphs = _split_paragraphs(tqdm(dataset))
+
+        # Holds the answer sentence id of each question.
+        answer_ids = []
+        paragraph_lengths = []
+        for sentences, questions in paragraphs:
+            sentence_offset = len(self.id_to_sentence)
+            self.id_to_sentence.extend(sentences)
+            paragraph_lengths.append(len(sentences))
+            for question_text, answer_index in questions:
+                self.id_to_question.append(question_text)
+                answer_ids.append(sentence_offset + answer_index)
+        paragraph_lengths = numpy.asarray(paragraph_lengths, dtype='int64')
+        self.paragraph_offsets = numpy.concatenate([[0], numpy.cumsum(paragraph_lengths)])
+        self.sentence_paragraph_map = numpy.repeat(numpy.arange(len(paragraph_lengths)), paragraph_lengths)
+
+        logger.info("Sampling negative sentences")
+        sampled_ids = self._sample_negatives(len(answer_ids))
         processed_rows = []
         logger.info("Processing questions into training instances")
-        for question_id, answer_id in tqdm(questions):
-            sentence_choices, correct_choice = self._get_sentence_choices(question_id, answer_id)
+        for question_id, answer_id in enumerate(tqdm(answer_ids)):
+            sentence_choices, correct_choice = self._get_sentence_choices(question_id, answer_id, sampled_ids)
             question_text = self.id_to_question[question_id]
             row_text = (question_text + "\t" + '###'.join(sentence_choices) +
                         "\t" + str(correct_choice))
@@ -238,5 +237,69 @@ class SquadSentenceSelectionReader():
         logger.info("Wrote output to %s", output_filepath)
         return output_filepath
 
+def _sample_distinct(population_size: int, num_rows: int, num_samples: int) -> numpy.array:
+    """
+    Returns a ``(num_rows, num_samples)`` array where each row holds ``num_samples`` distinct
+    integers drawn uniformly from ``[0, population_size)``.  We draw all of the rows at once, with
+    replacement, and then redraw only the rows that came out with a repeated value, without
+    replacement.  When ``num_samples`` is small compared to ``population_size`` (the usual case),
+    that's very few rows.
+    """
+    if num_samples > population_size:
+        raise RuntimeError("Not enough sentences to pick from")
+    samples = numpy.random.randint(population_size, size=(num_rows, num_samples))
+    sorted_samples = numpy.sort(samples, axis=1)
+    repeated_rows = numpy.flatnonzero((sorted_samples[:, 1:] == sorted_samples[:, :-1]).any(axis=1))
+    for row in repeated_rows:
+        samples[row] = numpy.random.choice(population_size, (num_samples,), replace=False)
+    return samples
+
+
+def _split_paragraphs(articles: Iterable[Dict[str, Any]]) -> List[Tuple[List[str], List[Tuple[str, int]]]]:
+    """
+    Splits the context of every paragraph in ``articles`` into sentences, and finds the sentence
+    that contains the answer to each of its questions.  Returns, for each paragraph in order, its
+    sentences and a list of ``(question_text, answer_sentence_index)`` pairs, where the index is
+    into the paragraph's sentences.  This is a module-level function so that it can be sent to
+    worker processes with :func:`~deep_qa.common.util.map_over_shards`.
+    """
+    # Import is here, since it isn't necessary by default.
+    import nltk
+    paragraphs = []
+    for article in articles:
+        for paragraph in article['paragraphs']:
+            context_article = paragraph["context"]
+            # replace newlines in the context article
+            cleaned_context_article = context_article.replace("\n", "")
+
+            # Split the cleaned_context_article into a list of sentences.
+            sentences = nltk.sent_tokenize(cleaned_context_article)
+
+            # The (exclusive) character offset where each sentence ends; the next one starts
+            # there.  We need to add one to each length to account for the trailing space after
+            # punctuation that is stripped by NLTK.
+            sentence_ends = list(itertools.accumulate(len(sentence) + 1 for sentence in sentences))
+            questions = []
+            for question_answer in paragraph['qas']:
+                question_text = question_answer["question"].strip()
+
+                # There may be multiple answer annotations, so pick the one
+                # that occurs the most.
+                candidate_answer_start_indices = Counter()
+                for answer in question_answer["answers"]:
+                    candidate_answer_start_indices[answer["answer_start"]] += 1
+                answer_start_index, _ = candidate_answer_start_indices.most_common(1)[0]
+
+                # Get the index of the sentence containing the answer.
+                answer_index = bisect.bisect_right(sentence_ends, answer_start_index)
+                if answer_start_index < 0 or answer_index == len(sentences):
+                    raise ValueError("Index of answer start was out of bounds. "
+                                     "This should never happen, please raise "
+                                     "an issue on GitHub.")
+                questions.append((question_text, answer_index))
+            paragraphs.append((sentences, questions))
+    return paragraphs
+
+
 if __name__ == '__main__':
     main()
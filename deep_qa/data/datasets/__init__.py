@@ -1,11 +1,14 @@
 from collections import OrderedDict
 
 from .entailment.snli_dataset import SnliDataset
-from .language_modeling.language_modeling_dataset import LanguageModelingDataset
-from .dataset import Dataset, TextDataset, IndexedDataset
+from .language_modeling.language_modeling_dataset import LanguageModelingDataset, IndexedLanguageModelingDataset
+from .dataset import Dataset, TextDataset, IndexedDataset, ColumnarIndexedDataset
+from .dataset import LazyTextDataset, LazyIndexedDataset
+from .indexed_dataset_cache import IndexedDatasetCache
 
 
 concrete_datasets = OrderedDict()  # pylint: disable=invalid-name
 concrete_datasets["text"] = TextDataset
+concrete_datasets["lazy text"] = LazyTextDataset
 concrete_datasets["language_modeling"] = LanguageModelingDataset
 concrete_datasets["snli"] = SnliDataset
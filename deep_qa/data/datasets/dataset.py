@@ -1,12 +1,13 @@
 import codecs
 import itertools
 import logging
-from typing import Dict, List
+from typing import Any, Callable, Dict, Iterable, Iterator, List
 
 import numpy
+from overrides import overrides
 import tqdm
 
-from ...common.util import add_noise_to_dict_values
+from ...common.util import add_noise_to_array_values, map_over_shards
 from ...common.params import Params
 from ..data_indexer import DataIndexer
 from ..instances.instance import Instance, TextInstance, IndexedInstance
@@ -40,6 +41,9 @@ class Dataset:
         """
         self.instances = instances
 
+    def __len__(self):
+        return len(self.instances)
+
     def merge(self, other: 'Dataset') -> 'Dataset':
         """
         Combine two datasets.  If you call try to merge two Datasets of the same subtype, you will
@@ -77,26 +81,149 @@ class TextDataset(Dataset):
             params.assert_empty("TextDataset")
         super(TextDataset, self).__init__(instances)
 
-    def to_indexed_dataset(self, data_indexer: DataIndexer) -> 'IndexedDataset':
+    def to_indexed_dataset(self,
+                           data_indexer: DataIndexer,
+                           columnar: bool=False,
+                           num_workers: int=1) -> 'IndexedDataset':
         '''
-        Converts the Dataset into an IndexedDataset, given a DataIndexer.
+        Converts the Dataset into an IndexedDataset, given a DataIndexer.  If ``columnar`` is
+        ``True``, we return a :class:`ColumnarIndexedDataset` instead, indexing the instances a
+        chunk at a time so that we never hold all of the ``IndexedInstance`` objects in memory.
+
+        If ``num_workers`` is greater than one, we index shards of instances in that many worker
+        processes, each with its own copy of ``data_indexer``.  With ``columnar=True``, each worker
+        sends back its shard as a ``ColumnarIndexedDataset``, which is a lot cheaper to pickle than
+        a list of ``IndexedInstances``.
         '''
-        indexed_instances = [instance.to_indexed_instance(data_indexer) for instance in tqdm.tqdm(self.instances)]
-        return IndexedDataset(indexed_instances)
+        return _index_instances(self.instances, data_indexer, columnar, num_workers)
 
     @staticmethod
     def read_from_file(filename: str, instance_class, params: Params=None):
-        with codecs.open(filename, 'r', 'utf-8') as input_file:
-            lines = [x.strip() for x in tqdm.tqdm(input_file.readlines())]
-            return TextDataset.read_from_lines(lines, instance_class, params)
+        return TextDataset.read_from_lines(read_lines(filename), instance_class, params)
 
     @staticmethod
-    def read_from_lines(lines: List[str], instance_class, params: Params=None):
+    def read_from_lines(lines: Iterable[str], instance_class, params: Params=None):
         instances = [instance_class.read_from_line(x) for x in lines]
         log_label_counts(instances)
         return TextDataset(instances, params)
 
 
+class LazyTextDataset(TextDataset):
+    """
+    A ``TextDataset`` that never holds all of its instances in memory.  Instead of a list of
+    instances, it takes a function that returns a fresh iterator over them (typically by reading
+    through a file, see :func:`read_from_file`), and ``self.instances`` is a new pass over that
+    iterator every time you access it.  Anything that just loops over ``dataset.instances``, like
+    :func:`DataIndexer.fit_word_dictionary`, works unchanged.
+
+    To index the data, use :func:`to_indexed_dataset`.  Passing ``lazy=True`` there gives you a
+    :class:`LazyIndexedDataset`, which indexes instances as they are read, and which
+    :class:`~deep_qa.data.DataGenerator` streams through a bounded shuffle buffer, so you can train
+    on corpora that don't fit in memory.
+
+    Parameters
+    ----------
+    instance_generator: Callable[[], Iterator[TextInstance]]
+        A function that returns a new iterator over all of the instances in the dataset.
+    params: Params, optional (default=None)
+        Passed to :class:`TextDataset`.
+    max_instances: int, optional (default=None)
+        If not ``None``, we stop every pass over the data after this many instances.
+    """
+    def __init__(self,
+                 instance_generator: Callable[[], Iterator[TextInstance]],
+                 params: Params=None,
+                 max_instances: int=None):
+        # pylint: disable=super-init-not-called
+        # We don't call the superclass constructor, because we don't have a list of instances.
+        if params is not None:
+            params.assert_empty("LazyTextDataset")
+        self.instance_generator = instance_generator
+        self.max_instances = max_instances
+        self._num_instances = None
+
+    @property
+    def instances(self) -> Iterator[TextInstance]:
+        return itertools.islice(self.instance_generator(), self.max_instances)
+
+    @overrides
+    def __len__(self):
+        # Counting the instances takes a pass over the data, so we only do it once.
+        if self._num_instances is None:
+            self._num_instances = sum(1 for _ in self.instances)
+        return self._num_instances
+
+    @overrides
+    def merge(self, other: 'Dataset') -> 'LazyTextDataset':
+        if type(self) is not type(other):
+            raise RuntimeError("Cannot merge datasets with different types")
+        return LazyTextDataset(lambda: itertools.chain(self.instances, other.instances))
+
+    @overrides
+    def truncate(self, max_instances: int) -> 'LazyTextDataset':
+        if self.max_instances is not None:
+            max_instances = min(max_instances, self.max_instances)
+        return LazyTextDataset(self.instance_generator, max_instances=max_instances)
+
+    @overrides
+    def to_indexed_dataset(self,
+                           data_indexer: DataIndexer,
+                           columnar: bool=False,
+                           num_workers: int=1,
+                           lazy: bool=False,
+                           fit_data_indexer: bool=False) -> 'IndexedDataset':
+        """
+        Converts this dataset into an ``IndexedDataset``, in a single pass over the data.
+
+        Parameters
+        ----------
+        data_indexer: DataIndexer
+            The ``DataIndexer`` to index the instances with.
+        columnar: bool, optional (default=False)
+            If ``True``, we return a :class:`ColumnarIndexedDataset`, which stores the indexed data
+            compactly.  See :func:`TextDataset.to_indexed_dataset`.
+        num_workers: int, optional (default=1)
+            The number of worker processes to index the data with.  See
+            :func:`TextDataset.to_indexed_dataset`.  This is ignored if ``lazy`` or
+            ``fit_data_indexer`` is ``True``.
+        lazy: bool, optional (default=False)
+            If ``True``, we don't index anything now, and instead return a
+            :class:`LazyIndexedDataset` that indexes instances each time it reads them.
+        fit_data_indexer: bool, optional (default=False)
+            If ``True``, we add every word of each instance to ``data_indexer`` right before we
+            index it, so that fitting the vocabulary and indexing take one pass over the data,
+            instead of one pass for :func:`DataIndexer.fit_word_dictionary` and another one here.
+            This gives the same vocabulary as ``fit_word_dictionary`` with ``min_count=1``
+            (though words may get different indices).  This can't be combined with ``lazy``, as
+            the vocabulary has to be fixed before we build a model.
+        """
+        if lazy:
+            if fit_data_indexer:
+                raise RuntimeError("Can't fit a DataIndexer while lazily indexing a dataset")
+            return LazyIndexedDataset(self, data_indexer)
+        if not fit_data_indexer:
+            return _index_instances(self.instances, data_indexer, columnar, num_workers)
+        def indexed_instances():
+            # See TextInstance.index_in_batches; we can't use it here, as we have to fit each
+            # instance's words before indexing it.
+            passage_table = {}
+            for instance in TextInstance.tokenize_in_batches(tqdm.tqdm(self.instances)):
+                for namespace, words in instance.words().items():
+                    for word in words:
+                        data_indexer.add_word_to_index(word, namespace)
+                yield instance.index_with_passage_table(data_indexer, passage_table)
+        if columnar:
+            return ColumnarIndexedDataset.from_instances(indexed_instances())
+        return IndexedDataset(list(indexed_instances()))
+
+    @staticmethod
+    @overrides
+    def read_from_file(filename: str, instance_class, params: Params=None):
+        def instance_generator():
+            return (instance_class.read_from_line(line) for line in read_lines(filename))
+        return LazyTextDataset(instance_generator, params)
+
+
 class IndexedDataset(Dataset):
     """
     A Dataset of IndexedInstances, with some helper methods.
@@ -106,30 +233,70 @@ class IndexedDataset(Dataset):
     """
     def __init__(self, instances: List[IndexedInstance]):
         super(IndexedDataset, self).__init__(instances)
+        # Set by `pad_instances()`; the padding itself happens in `as_training_data()`.
+        self._lengths_to_use = None
+        # A cache for `padding_length_arrays()`, along with the instance list it was computed for.
+        self._length_arrays = None
+        self._length_arrays_instances = None
 
     def sort_by_padding(self, sorting_keys: List[str], padding_noise: float=0.0):
         """
         Sorts the ``Instances`` in this ``Dataset`` by their padding lengths, using the keys in
         ``sorting_keys`` (in the order in which they are provided).
+
+        The padding lengths come from :func:`padding_length_arrays`, so we only call
+        ``get_padding_lengths()`` on the instances the first time we sort, and the sort itself is a
+        single ``numpy.lexsort``.
+        """
+        length_arrays = self.padding_length_arrays()
+        order = padding_sort_order(length_arrays, sorting_keys, padding_noise)
+        self.instances = [self.instances[i] for i in order]
+        self._length_arrays = {key: lengths[order] for key, lengths in length_arrays.items()}
+        self._length_arrays_instances = self.instances
+
+    def padding_length_arrays(self) -> Dict[str, numpy.array]:
+        """
+        Returns the padding lengths of every instance in this dataset, in order, as one ``int32``
+        array per padding key (using the keys of the first instance, with zeros for instances that
+        don't have a key).
+
+        We cache these, and keep them in sync with the instances when we sort them.  If you assign
+        a new list to ``self.instances``, the cache is recomputed; if you modify the list in place,
+        you need to set ``self._length_arrays`` to ``None`` yourself.
+        """
+        if self._length_arrays is None or self._length_arrays_instances is not self.instances:
+            lengths = self.instance_padding_lengths()
+            keys = lengths[0].keys() if lengths else []
+            self._length_arrays = {key: numpy.fromiter((x.get(key, 0) for x in lengths),
+                                                       dtype='int32', count=len(lengths))
+                                   for key in keys}
+            self._length_arrays_instances = self.instances
+        return self._length_arrays
+
+    def select(self, positions: List[int]) -> 'IndexedDataset':
+        """
+        Returns a new dataset containing the instances at the given ``positions`` (in the current
+        order of this dataset), in the order given.  The instances are shared, not copied.
         """
-        instances_with_lengths = []
-        for instance in self.instances:
-            padding_lengths = instance.get_padding_lengths()
-            if padding_noise > 0.0:
-                padding_lengths = add_noise_to_dict_values(padding_lengths, padding_noise)
-            instance_with_lengths = [padding_lengths[key] for key in sorting_keys] + [instance]
-            instances_with_lengths.append(instance_with_lengths)
-        instances_with_lengths.sort(key=lambda x: x[:-1])
-        self.instances = [instance_with_lengths[-1] for instance_with_lengths in instances_with_lengths]
+        return self.__class__([self.instances[position] for position in positions])
+
+    def start_epoch(self):
+        """
+        Called by :class:`~deep_qa.data.DataGenerator` before every pass it makes over this
+        dataset.  This does nothing by default; datasets whose instances change from epoch to epoch
+        (like the random window offsets of an
+        :class:`~deep_qa.data.datasets.IndexedLanguageModelingDataset`) override it.
+        """
+        pass
+
+    def instance_padding_lengths(self) -> List[Dict[str, int]]:
+        """
+        Returns the padding lengths of every instance in this dataset, in order.
+        """
+        return [instance.get_padding_lengths() for instance in self.instances]
 
     def padding_lengths(self):
-        padding_lengths = {}
-        lengths = [instance.get_padding_lengths() for instance in self.instances]
-        if not lengths:
-            return padding_lengths
-        for key in lengths[0]:
-            padding_lengths[key] = max(x[key] if key in x else 0 for x in lengths)
-        return padding_lengths
+        return {key: int(lengths.max()) for key, lengths in self.padding_length_arrays().items()}
 
     def pad_instances(self, padding_lengths: Dict[str, int]=None, verbose: bool=True):
         """
@@ -142,13 +309,15 @@ class IndexedDataset(Dataset):
         Given that, this method does two things: (1) it asks each of the ``Instances`` what their
         padding lengths are, and takes a max (using :func:`~IndexedDataset.padding_lengths()`).  It
         then reconciles those values with the ``padding_lengths`` we were passed as an argument to
-        this method, and pads the instances with :func:`IndexedInstance.pad()`.  If
-        ``padding_lengths`` has a particular key specified with a value, that value takes
-        precedence over whatever we computed in our data.  TODO(matt): with dynamic padding, we
-        should probably have this be a max padding length, not a hard setting, but that requires
-        some API changes.
+        this method, and (2) records the result as the lengths to pad to.  If ``padding_lengths``
+        has a particular key specified with a value, that value takes precedence over whatever we
+        computed in our data.  TODO(matt): with dynamic padding, we should probably have this be a
+        max padding length, not a hard setting, but that requires some API changes.
 
-        This method `modifies` the current object, it does not return a new ``IndexedDataset``.
+        The actual padding happens in :func:`as_training_data`, which writes all of the instances
+        into preallocated batch arrays at once, using
+        :func:`IndexedInstance.batch_as_training_data`.  The ``Instances`` themselves are never
+        modified.
 
         Parameters
         ----------
@@ -168,7 +337,7 @@ class IndexedDataset(Dataset):
         # given a max length for a particular dimension.  If we were, we use that instead of the
         # instance-based one.
         if verbose:
-            logger.info("Padding dataset of size %d to lengths %s", len(self.instances), str(padding_lengths))
+            logger.info("Padding dataset of size %d to lengths %s", len(self), str(padding_lengths))
             logger.info("Getting max lengths from instances")
         instance_padding_lengths = self.padding_lengths()
         if verbose:
@@ -180,33 +349,604 @@ class IndexedDataset(Dataset):
             else:
                 lengths_to_use[key] = instance_padding_lengths[key]
         if verbose:
-            logger.info("Now actually padding instances to length: %s", str(lengths_to_use))
-            for instance in tqdm.tqdm(self.instances):
-                instance.pad(lengths_to_use)
-        else:
-            for instance in self.instances:
-                instance.pad(lengths_to_use)
+            logger.info("Instances will be padded to length: %s", str(lengths_to_use))
+        self._lengths_to_use = lengths_to_use
 
     def as_training_data(self):
         """
-        Takes each ``IndexedInstance`` and converts it into (inputs, labels), according to the
-        Instance's as_training_data() method.  Both the inputs and the labels are numpy arrays.
-        Note that if the ``Instances`` return tuples for their inputs, we convert the list of
-        tuples into a tuple of lists, before converting everything to numpy arrays.
+        Converts the ``IndexedInstances`` in this dataset into (inputs, labels) numpy arrays.
+
+        If :func:`pad_instances` has been called, we pad all of the instances to the lengths it
+        decided on and convert them in a single batch, with
+        :func:`IndexedInstance.batch_as_training_data`.  Otherwise, we take each instance's
+        ``as_training_data()`` output as-is and stack them with
+        :func:`IndexedInstance.stack_training_data`.  Note that if the ``Instances`` return tuples
+        for their inputs, we convert the list of tuples into a list of arrays.
         """
-        inputs = []
-        labels = []
-        instances = self.instances
-        for instance in instances:
-            instance_inputs, label = instance.as_training_data()
-            inputs.append(instance_inputs)
-            labels.append(label)
-        if isinstance(inputs[0], tuple):
-            inputs = [numpy.asarray(x) for x in zip(*inputs)]
-        else:
-            inputs = numpy.asarray(inputs)
-        if isinstance(labels[0], tuple):
-            labels = [numpy.asarray(x) for x in zip(*labels)]
-        else:
-            labels = numpy.asarray(labels)
+        if self._lengths_to_use is not None:
+            instance_type = type(self.instances[0])
+            return instance_type.batch_as_training_data(self.instances, self._lengths_to_use)
+        training_data = [instance.as_training_data() for instance in self.instances]
+        return IndexedInstance.stack_training_data(training_data)
+
+    def as_memory_mapped_training_data(self, filename_prefix: str, chunk_size: int=1000):
+        """
+        Like :func:`as_training_data`, but instead of building the (inputs, labels) arrays in
+        memory, we write them to ``.npy`` files (``[filename_prefix]_inputs_0.npy``, etc.) and
+        return read-only memory-mapped arrays backed by those files.  We pad and convert
+        ``chunk_size`` instances at a time, so only one chunk of padded arrays is ever in memory,
+        and slicing batches out of the result only reads those rows from disk (or the page cache).
+
+        You should call :func:`pad_instances` first, so that every chunk gets padded to the same
+        lengths.  Arrays that numpy can't memory-map (``object`` arrays, like the labels of
+        unlabeled instances) are kept in memory.
+        """
+        if len(self) == 0:
+            return self.as_training_data()
+        inputs_are_list = labels_are_list = False
+        num_inputs = 0
+        outputs = []
+        filenames = []
+        for chunk_start in range(0, len(self), chunk_size):
+            chunk = self.select(numpy.arange(chunk_start, min(chunk_start + chunk_size, len(self))))
+            chunk._lengths_to_use = self._lengths_to_use  # pylint: disable=protected-access
+            inputs, labels = chunk.as_training_data()
+            if not outputs:
+                inputs_are_list = isinstance(inputs, (list, tuple))
+                labels_are_list = isinstance(labels, (list, tuple))
+                num_inputs = len(inputs) if inputs_are_list else 1
+            arrays = (list(inputs) if inputs_are_list else [inputs]) + \
+                    (list(labels) if labels_are_list else [labels])
+            if not outputs:
+                for i, array in enumerate(arrays):
+                    shape = (len(self),) + array.shape[1:]
+                    if array.dtype == object:
+                        filenames.append(None)
+                        outputs.append(numpy.empty(shape, dtype=object))
+                    else:
+                        name = 'inputs_%d' % i if i < num_inputs else 'labels_%d' % (i - num_inputs)
+                        filenames.append('%s_%s.npy' % (filename_prefix, name))
+                        outputs.append(numpy.lib.format.open_memmap(filenames[-1], mode='w+',
+                                                                    dtype=array.dtype, shape=shape))
+            for output, array in zip(outputs, arrays):
+                output[chunk_start:chunk_start + len(array)] = array
+        for i, filename in enumerate(filenames):
+            if filename is not None:
+                outputs[i].flush()
+                outputs[i] = numpy.load(filename, mmap_mode='r')
+        inputs = outputs[:num_inputs] if inputs_are_list else outputs[0]
+        labels = outputs[num_inputs:] if labels_are_list else outputs[num_inputs]
         return inputs, labels
+
+
+class ColumnarIndexedDataset(IndexedDataset):
+    """
+    An ``IndexedDataset`` that stores its instances column by column in numpy arrays, instead of
+    as a list of ``IndexedInstance`` objects.
+
+    Every attribute of the instances that holds a (possibly nested) list of ints, like
+    ``word_indices``, or ``option_indices`` with characters, is stored as one flat ``int32`` token
+    buffer plus one offsets array per level of nesting (see :class:`RaggedColumn`).  If several
+    instances hold the `same` list object (e.g., the passage indices of the questions about one
+    SQuAD passage; see ``QuestionPassageInstance``), we store that list once, in a table of distinct
+    rows that the instances refer to by id (see :class:`SharedRaggedColumn`).  Anything else
+    (labels that aren't index lists, ``index``) is kept in a numpy object array.  We also keep the
+    padding lengths of every instance, one ``int32`` array per padding key.  This takes about four
+    bytes per token index, instead of the 30-odd bytes a python int in a python list costs, so
+    fairly large corpora fit in memory.
+
+    Sorting, computing padding lengths, truncating, merging and selecting batches all work directly
+    on these arrays.  Sorting only computes a permutation, and selecting a batch is a gather over
+    the token buffers.  ``IndexedInstance`` objects only get created (with ``__new__``, not their
+    constructors) for the instances in a batch, when :func:`as_training_data` hands them to
+    :func:`IndexedInstance.batch_as_training_data`.
+
+    You can build one of these with :func:`from_instances`, or with
+    ``TextDataset.to_indexed_dataset(data_indexer, columnar=True)``.
+
+    Parameters
+    ----------
+    instance_type: type
+        The ``IndexedInstance`` subclass of every instance in the dataset.
+    columns: Dict[str, Any]
+        A mapping from instance attribute names to either a :class:`RaggedColumn` or a numpy
+        object array, each with one entry per instance.
+    instance_lengths: Dict[str, numpy.array]
+        A mapping from padding keys, as returned by ``instance.get_padding_lengths()``, to an array
+        of that length for every instance.
+    """
+    def __init__(self,
+                 instance_type,
+                 columns: Dict[str, Any],
+                 instance_lengths: Dict[str, numpy.array]):
+        # pylint: disable=super-init-not-called
+        # We don't call the superclass constructor, because we don't have a list of instances.
+        self.instance_type = instance_type
+        self.columns = columns
+        self.instance_lengths = instance_lengths
+        self._num_instances = len(next(iter(columns.values()))) if columns else 0
+        # The order of the rows, after sorting; ``None`` means the order the instances came in.
+        self._order = None
+        self._lengths_to_use = None
+
+    @classmethod
+    def from_instances(cls,
+                       instances: Iterable[IndexedInstance],
+                       chunk_size: int=10000) -> 'ColumnarIndexedDataset':
+        """
+        Builds a ``ColumnarIndexedDataset`` from an iterable of ``IndexedInstances``, all of the
+        same type.  We read ``chunk_size`` instances at a time, so if ``instances`` is a generator,
+        at most that many instance objects are alive at once.
+        """
+        chunks = []
+        instance_iterator = iter(instances)
+        while True:
+            chunk = list(itertools.islice(instance_iterator, chunk_size))
+            if not chunk:
+                break
+            chunks.append(cls.__from_chunk(chunk))
+        return cls.concatenate(chunks)
+
+    @classmethod
+    def concatenate(cls, datasets: List['ColumnarIndexedDataset']) -> 'ColumnarIndexedDataset':
+        """
+        Concatenates any number of ``ColumnarIndexedDatasets`` (each in its current order) into a
+        new one, with a single concatenation per column, so building a dataset out of many chunks
+        copies each chunk once.
+        """
+        datasets = [dataset for dataset in datasets if len(dataset) > 0]
+        if not datasets:
+            return cls(IndexedInstance, {}, {})
+        if len(datasets) == 1:
+            return datasets[0]
+        instance_type = datasets[0].instance_type
+        for dataset in datasets[1:]:
+            if dataset.instance_type is not instance_type:
+                raise RuntimeError("Cannot merge datasets of %s and %s" % (instance_type, dataset.instance_type))
+        # Selecting everything gives us the columns in sorted order, if a dataset was sorted.
+        # pylint: disable=protected-access
+        datasets = [dataset if dataset._order is None else dataset.select(numpy.arange(len(dataset)))
+                    for dataset in datasets]
+        # pylint: enable=protected-access
+        columns = {}
+        for name in datasets[0].columns:
+            dataset_columns = [dataset.columns[name] for dataset in datasets]
+            if all(_is_ragged(column) for column in dataset_columns) and \
+                    len(set(_ragged_depth(column) for column in dataset_columns)) == 1:
+                if any(isinstance(column, SharedRaggedColumn) for column in dataset_columns):
+                    columns[name] = SharedRaggedColumn.concatenate(dataset_columns)
+                else:
+                    columns[name] = RaggedColumn.concatenate(dataset_columns)
+            else:
+                columns[name] = numpy.concatenate([_as_object_array(column) for column in dataset_columns])
+        instance_lengths = {}
+        for key in datasets[0].instance_lengths:
+            instance_lengths[key] = numpy.concatenate([
+                    dataset.instance_lengths.get(key, numpy.zeros(len(dataset), dtype='int32'))
+                    for dataset in datasets])
+        return cls(instance_type, columns, instance_lengths)
+
+    @classmethod
+    def __from_chunk(cls, instances: List[IndexedInstance]) -> 'ColumnarIndexedDataset':
+        instance_type = type(instances[0])
+        if any(instance.__class__ is not instance_type for instance in instances):
+            raise RuntimeError("ColumnarIndexedDataset needs all instances to have the same type")
+        columns = {}
+        for name in vars(instances[0]):
+            values = [getattr(instance, name) for instance in instances]
+            column = SharedRaggedColumn.from_lists(values)
+            if column is None:
+                column = RaggedColumn.from_lists(values)
+            columns[name] = column if column is not None else _object_array(values)
+        lengths = [instance.get_padding_lengths() for instance in instances]
+        instance_lengths = {key: numpy.asarray([x.get(key, 0) for x in lengths], dtype='int32')
+                            for key in lengths[0]}
+        return cls(instance_type, columns, instance_lengths)
+
+    @overrides
+    def __len__(self):
+        return self._num_instances
+
+    @property
+    def instances(self) -> List[IndexedInstance]:
+        """
+        Creates ``IndexedInstance`` objects for the `whole` dataset, in order.  This is here for
+        compatibility with code that expects an ``IndexedDataset``; it is slow and undoes the memory
+        savings of this class, so don't use it on large datasets.
+        """
+        return self.__instances_at(self.__rows(numpy.arange(len(self))))
+
+    @overrides
+    def merge(self, other: 'Dataset') -> 'ColumnarIndexedDataset':
+        if type(self) is not type(other):
+            raise RuntimeError("Cannot merge datasets with different types")
+        return ColumnarIndexedDataset.concatenate([self, other])
+
+    @overrides
+    def truncate(self, max_instances: int):
+        if len(self) <= max_instances:
+            return self
+        return self.select(numpy.arange(max_instances))
+
+    @overrides
+    def sort_by_padding(self, sorting_keys: List[str], padding_noise: float=0.0):
+        self._order = padding_sort_order(self.instance_lengths, sorting_keys, padding_noise)
+
+    @overrides
+    def padding_length_arrays(self) -> Dict[str, numpy.array]:
+        if self._order is None:
+            return self.instance_lengths
+        return {key: lengths[self._order] for key, lengths in self.instance_lengths.items()}
+
+    @overrides
+    def select(self, positions: List[int]) -> 'ColumnarIndexedDataset':
+        rows = self.__rows(numpy.asarray(positions, dtype='int64'))
+        columns = {name: column.take(rows) if _is_ragged(column) else column[rows]
+                   for name, column in self.columns.items()}
+        instance_lengths = {key: lengths[rows] for key, lengths in self.instance_lengths.items()}
+        return ColumnarIndexedDataset(self.instance_type, columns, instance_lengths)
+
+    @overrides
+    def instance_padding_lengths(self) -> List[Dict[str, int]]:
+        length_arrays = self.padding_length_arrays()
+        keys = list(length_arrays.keys())
+        columns = [length_arrays[key].tolist() for key in keys]
+        return [dict(zip(keys, lengths)) for lengths in zip(*columns)]
+
+    @overrides
+    def as_training_data(self):
+        instances = self.instances
+        if self._lengths_to_use is not None:
+            return self.instance_type.batch_as_training_data(instances, self._lengths_to_use)
+        return IndexedInstance.stack_training_data([instance.as_training_data() for instance in instances])
+
+    def __rows(self, positions: numpy.array) -> numpy.array:
+        return positions if self._order is None else self._order[positions]
+
+    def __instances_at(self, rows: numpy.array) -> List[IndexedInstance]:
+        field_values = {}
+        for name, column in self.columns.items():
+            if _is_ragged(column):
+                field_values[name] = column.take(rows).to_lists()
+            else:
+                field_values[name] = column[rows].tolist()
+        instances = []
+        for i in range(len(rows)):
+            instance = self.instance_type.__new__(self.instance_type)
+            for name, values in field_values.items():
+                setattr(instance, name, values[i])
+            instances.append(instance)
+        return instances
+
+
+class LazyIndexedDataset(IndexedDataset):
+    """
+    An ``IndexedDataset`` that indexes the instances of a :class:`LazyTextDataset` as it reads them,
+    instead of keeping indexed instances in memory.  ``self.instances`` is a new pass over the
+    data every time you access it.
+
+    You can't sort or select from this dataset, or pad all of it at once, because we never have
+    all of its instances.  Instead, :class:`~deep_qa.data.DataGenerator` reads it into a bounded
+    shuffle buffer, and sorts and batches the instances in each buffer.  :func:`padding_lengths`
+    does work, taking one pass over the data (the first time you call it).
+
+    Parameters
+    ----------
+    text_dataset: LazyTextDataset
+        The dataset to read instances from.
+    data_indexer: DataIndexer
+        The ``DataIndexer`` to index the instances with.
+    """
+    def __init__(self, text_dataset: LazyTextDataset, data_indexer: DataIndexer):
+        # pylint: disable=super-init-not-called
+        # We don't call the superclass constructor, because we don't have a list of instances.
+        self.text_dataset = text_dataset
+        self.data_indexer = data_indexer
+        self._padding_lengths = None
+        self._lengths_to_use = None
+
+    @property
+    def instances(self) -> Iterator[IndexedInstance]:
+        # Unlike TextInstance.index_in_batches, we don't share passages between instances here,
+        # as a passage table for a whole pass would hold every passage of a corpus that we're
+        # streaming because it doesn't fit in memory.
+        return (instance.to_indexed_instance(self.data_indexer)
+                for instance in TextInstance.tokenize_in_batches(self.text_dataset.instances))
+
+    @overrides
+    def __len__(self):
+        return len(self.text_dataset)
+
+    @overrides
+    def merge(self, other: 'Dataset') -> 'LazyIndexedDataset':
+        if type(self) is not type(other) or self.data_indexer is not other.data_indexer:
+            raise RuntimeError("Cannot merge datasets with different types or DataIndexers")
+        return LazyIndexedDataset(self.text_dataset.merge(other.text_dataset), self.data_indexer)
+
+    @overrides
+    def truncate(self, max_instances: int) -> 'LazyIndexedDataset':
+        return LazyIndexedDataset(self.text_dataset.truncate(max_instances), self.data_indexer)
+
+    @overrides
+    def sort_by_padding(self, sorting_keys: List[str], padding_noise: float=0.0):
+        raise RuntimeError("LazyIndexedDatasets can't be sorted; use a DataGenerator, which sorts "
+                           "the instances in each shuffle buffer")
+
+    @overrides
+    def padding_length_arrays(self) -> Dict[str, numpy.array]:
+        raise RuntimeError("LazyIndexedDatasets don't keep per-instance padding lengths")
+
+    @overrides
+    def select(self, positions: List[int]) -> 'IndexedDataset':
+        raise RuntimeError("LazyIndexedDatasets don't support random access")
+
+    @overrides
+    def instance_padding_lengths(self) -> List[Dict[str, int]]:
+        raise RuntimeError("LazyIndexedDatasets don't keep per-instance padding lengths")
+
+    @overrides
+    def padding_lengths(self):
+        if self._padding_lengths is None:
+            padding_lengths = {}
+            for instance in self.instances:
+                for key, length in instance.get_padding_lengths().items():
+                    padding_lengths[key] = max(length, padding_lengths.get(key, 0))
+            self._padding_lengths = padding_lengths
+        return self._padding_lengths
+
+    @overrides
+    def as_training_data(self):
+        raise RuntimeError("LazyIndexedDatasets can't be converted into arrays all at once; use a "
+                           "DataGenerator")
+
+
+class RaggedColumn:
+    """
+    A column of (possibly nested) lists of ints, one per instance, stored as a flat ``int32``
+    buffer of ``values`` and a list of ``int64`` ``offsets`` arrays, one per level of nesting, the
+    same way CSR sparse matrices are stored.  ``offsets[0]`` has one more entry than there are
+    instances, and the items of instance ``i`` are ``offsets[0][i]`` up to ``offsets[0][i + 1]`` in
+    the next level down, which is either ``offsets[1]`` or, at the last level, ``values``.
+
+    For example, ``[[[1, 2], [3]], [], [[4]]]`` (word indices with characters, for three
+    instances) is stored as ``values = [1, 2, 3, 4]``, ``offsets = [[0, 2, 2, 3], [0, 2, 3, 4]]``.
+    """
+    def __init__(self, values: numpy.array, offsets: List[numpy.array]):
+        self.values = values
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets[0]) - 1
+
+    @classmethod
+    def from_lists(cls, rows: List) -> 'RaggedColumn':
+        """
+        Encodes a list of nested lists of ints.  If ``rows`` is not made up entirely of lists
+        (nested to the same depth) of ints, we return ``None``.
+        """
+        offsets = []
+        level = rows
+        while level and all(isinstance(item, list) for item in level):
+            lengths = numpy.fromiter((len(item) for item in level), dtype='int64', count=len(level))
+            offsets.append(_lengths_to_offsets(lengths))
+            level = list(itertools.chain.from_iterable(level))
+        if not offsets or not all(isinstance(item, int) and not isinstance(item, bool) for item in level):
+            return None
+        return cls(numpy.asarray(level, dtype='int32'), offsets)
+
+    @classmethod
+    def concatenate(cls, columns: List['RaggedColumn']) -> 'RaggedColumn':
+        offsets = []
+        for level in range(len(columns[0].offsets)):
+            # Each column's offsets at this level point into its own next level, so they need to
+            # be shifted past the items of all of the columns before it.
+            shift = 0
+            level_offsets = [numpy.zeros(1, dtype='int64')]
+            for column in columns:
+                level_offsets.append(column.offsets[level][1:] + shift)
+                shift += column.offsets[level][-1]
+            offsets.append(numpy.concatenate(level_offsets))
+        values = numpy.concatenate([column.values for column in columns])
+        return cls(values, offsets)
+
+    def take(self, rows: numpy.array) -> 'RaggedColumn':
+        """
+        Gathers the given rows into a new ``RaggedColumn``, level by level.
+        """
+        offsets = []
+        positions = rows
+        for level_offsets in self.offsets:
+            starts = level_offsets[positions]
+            lengths = level_offsets[positions + 1] - starts
+            offsets.append(_lengths_to_offsets(lengths))
+            positions = numpy.repeat(starts - offsets[-1][:-1], lengths) + numpy.arange(offsets[-1][-1])
+        return RaggedColumn(self.values[positions], offsets)
+
+    def to_lists(self) -> List:
+        """
+        Decodes this column back into nested python lists, one per instance.
+        """
+        level = self.values.tolist()
+        for level_offsets in reversed(self.offsets):
+            bounds = level_offsets.tolist()
+            level = [level[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+        return level
+
+
+class SharedRaggedColumn:
+    """
+    A column of (possibly nested) lists of ints, in which many instances can share the same list,
+    like the passages of SQuAD questions.  We store each distinct list once, as a row of a
+    :class:`RaggedColumn` ``table``, and ``row_ids`` gives the row of ``table`` for each
+    instance.  Selecting instances only gathers ``row_ids``; the table is shared, and the rows
+    only get gathered from it (once per distinct row) when we decode them with :func:`to_lists`.
+    """
+    def __init__(self, row_ids: numpy.array, table: RaggedColumn):
+        self.row_ids = row_ids
+        self.table = table
+
+    def __len__(self):
+        return len(self.row_ids)
+
+    @classmethod
+    def from_lists(cls, rows: List) -> 'SharedRaggedColumn':
+        """
+        Encodes a list of nested lists of ints, storing lists that appear more than once in
+        ``rows`` (as the same object, not just equal lists) only once.  If no list is repeated, or
+        if ``rows`` isn't something :func:`RaggedColumn.from_lists` can encode, we return ``None``.
+        """
+        if not rows or not all(isinstance(row, list) for row in rows):
+            return None
+        row_ids_by_object = {}
+        distinct_rows = []
+        row_ids = numpy.empty(len(rows), dtype='int64')
+        for i, row in enumerate(rows):
+            row_id = row_ids_by_object.get(id(row))
+            if row_id is None:
+                row_id = row_ids_by_object[id(row)] = len(distinct_rows)
+                distinct_rows.append(row)
+            row_ids[i] = row_id
+        if len(distinct_rows) == len(rows):
+            return None
+        table = RaggedColumn.from_lists(distinct_rows)
+        if table is None:
+            return None
+        return cls(row_ids, table)
+
+    @classmethod
+    def concatenate(cls, columns: List[Any]) -> 'SharedRaggedColumn':
+        """
+        Concatenates ``SharedRaggedColumns`` and ``RaggedColumns`` (whose rows we treat as all
+        being distinct) into one ``SharedRaggedColumn``.
+        """
+        tables = []
+        row_ids = []
+        num_table_rows = 0
+        for column in columns:
+            if isinstance(column, SharedRaggedColumn):
+                tables.append(column.table)
+                row_ids.append(column.row_ids + num_table_rows)
+            else:
+                tables.append(column)
+                row_ids.append(numpy.arange(len(column), dtype='int64') + num_table_rows)
+            num_table_rows += len(tables[-1])
+        return cls(numpy.concatenate(row_ids), RaggedColumn.concatenate(tables))
+
+    def take(self, rows: numpy.array) -> 'SharedRaggedColumn':
+        return SharedRaggedColumn(self.row_ids[rows], self.table)
+
+    def to_lists(self) -> List:
+        """
+        Decodes this column into nested python lists, one per instance.  Instances that share a
+        row get the same list object.
+        """
+        distinct_ids, inverse = numpy.unique(self.row_ids, return_inverse=True)
+        distinct_lists = self.table.take(distinct_ids).to_lists()
+        return [distinct_lists[i] for i in inverse.tolist()]
+
+
+def _index_instances(instances: Iterable[TextInstance],
+                     data_indexer: DataIndexer,
+                     columnar: bool,
+                     num_workers: int) -> IndexedDataset:
+    """
+    Indexes ``instances`` into an ``IndexedDataset`` (or a ``ColumnarIndexedDataset``, if
+    ``columnar``), in ``num_workers`` processes.
+    """
+    if num_workers > 1:
+        # Every shard gets its own pickled copy of the vocabulary, so we use big shards.
+        shards = map_over_shards(_index_shard, instances, num_workers, data_indexer,
+                                 TextInstance.tokenizer, columnar, shard_size=10000)
+        if columnar:
+            return ColumnarIndexedDataset.concatenate(list(shards))
+        return IndexedDataset([instance for shard in shards for instance in shard])
+    indexed_instances = TextInstance.index_in_batches(tqdm.tqdm(instances), data_indexer)
+    if columnar:
+        return ColumnarIndexedDataset.from_instances(indexed_instances)
+    return IndexedDataset(list(indexed_instances))
+
+
+def _index_shard(instances: List[TextInstance], data_indexer: DataIndexer, tokenizer, columnar: bool):
+    """
+    Runs in a worker process for :func:`_index_instances`.  We need to set the ``TextInstance``
+    tokenizer here, because the worker might not have the one the main process set up.
+    """
+    TextInstance.tokenizer = tokenizer
+    indexed_instances = list(TextInstance.index_in_batches(instances, data_indexer))
+    if columnar:
+        return ColumnarIndexedDataset.from_instances(indexed_instances)
+    return indexed_instances
+
+
+def read_lines(filename: str) -> Iterator[str]:
+    """
+    Yields the stripped lines of a UTF-8 file one at a time, instead of reading them all at once,
+    showing a progress bar.  Datasets use this in ``read_from_file``.
+    """
+    with codecs.open(filename, 'r', 'utf-8') as input_file:
+        for line in tqdm.tqdm(input_file):
+            yield line.strip()
+
+
+def padding_sort_order(length_arrays: Dict[str, numpy.array],
+                        sorting_keys: List[str],
+                        padding_noise: float) -> numpy.array:
+    """
+    Returns the permutation that sorts instances by the given padding length arrays, using the
+    keys in ``sorting_keys`` in order, after (optionally) adding noise to the lengths.  Datasets
+    use this to implement :func:`IndexedDataset.sort_by_padding`.
+
+    Parameters
+    ----------
+    length_arrays: Dict[str, numpy.array]
+        Maps each padding key to an array with the padding length of every instance (see
+        :func:`IndexedDataset.padding_length_arrays`).
+    sorting_keys: List[str]
+        The padding keys to sort by, most significant first.  If this is empty, we keep the
+        current order.
+    padding_noise: float
+        If positive, we multiply each length by a random factor in ``[1 - padding_noise,
+        1 + padding_noise]`` before sorting (see
+        :func:`~deep_qa.common.util.add_noise_to_array_values`).
+    """
+    if not sorting_keys:
+        return numpy.arange(len(next(iter(length_arrays.values()), [])))
+    keys = []
+    for key in sorting_keys:
+        lengths = length_arrays[key].astype('float64')
+        if padding_noise > 0.0:
+            lengths = add_noise_to_array_values(lengths, padding_noise)
+        keys.append(lengths)
+    # ``lexsort`` uses the _last_ key as the primary one, and is stable, like ``list.sort``.
+    return numpy.lexsort(keys[::-1])
+
+
+def _lengths_to_offsets(lengths: numpy.array) -> numpy.array:
+    offsets = numpy.zeros(len(lengths) + 1, dtype='int64')
+    numpy.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def _object_array(values: List[Any]) -> numpy.array:
+    # We fill this in one item at a time, because numpy.asarray would turn a list of tuples (or of
+    # lists) into a 2D array.
+    array = numpy.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        array[i] = value
+    return array
+
+
+def _as_object_array(column) -> numpy.array:
+    if _is_ragged(column):
+        return _object_array(column.to_lists())
+    return column
+
+
+def _is_ragged(column) -> bool:
+    return isinstance(column, (RaggedColumn, SharedRaggedColumn))
+
+
+def _ragged_depth(column) -> int:
+    if isinstance(column, SharedRaggedColumn):
+        return len(column.table.offsets)
+    return len(column.offsets)
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Iterable, Iterator, List
 import json
 
 from overrides import overrides
@@ -17,8 +17,18 @@ class SnliDataset(TextDataset):
     @overrides
     def read_from_file(filename: str, instance_class, params: Params=None):
 
-        instances = []
-        for line in open(filename, 'r'):
+        with open(filename, 'r') as snli_file:
+            instances = list(SnliDataset.read_instances(snli_file, instance_class))
+        log_label_counts(instances)
+        return SnliDataset(instances, params)
+
+    @staticmethod
+    def read_instances(lines: Iterable[str], instance_class) -> Iterator[TextInstance]:
+        """
+        Yields one instance for each line of SNLI json in ``lines``.  This is a generator, so you
+        can use it to stream a large file, e.g. with a :class:`~..dataset.LazyTextDataset`.
+        """
+        for line in lines:
             example = json.loads(line)
 
             # TODO(mark) why does this not match snli? Fix.
@@ -30,6 +40,4 @@ class SnliDataset(TextDataset):
 
             text = example["sentence1"]
             hypothesis = example["sentence2"]
-            instances.append(instance_class(text, hypothesis, label))
-        log_label_counts(instances)
-        return SnliDataset(instances, params)
+            yield instance_class(text, hypothesis, label)
@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, List, Tuple
+
+import dill as pickle
+import numpy
+
+from .dataset import ColumnarIndexedDataset, IndexedDataset, LazyIndexedDataset, RaggedColumn, SharedRaggedColumn
+from .language_modeling.language_modeling_dataset import IndexedLanguageModelingDataset
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class IndexedDatasetCache:
+    """
+    An on-disk cache of indexed datasets, so that re-running an experiment on the same data files
+    doesn't have to tokenize and index them again.
+
+    Each entry is a directory under ``cache_directory``, named by a key from :func:`key`.  We store
+    datasets as a :class:`~.dataset.ColumnarIndexedDataset`: every numpy array (the token buffers
+    and offsets of each :class:`~.dataset.RaggedColumn`, the row ids of each
+    :class:`~.dataset.SharedRaggedColumn`, and the padding lengths) goes in its own
+    ``.npy`` file, and everything else (the instance type, object columns, and any model state you
+    want to store alongside the dataset) goes in a pickled metadata file.  When we load an entry, the
+    ``.npy`` files are memory-mapped, so loading is fast, and the operating system only pages in the
+    parts of the data that actually get used.
+
+    An :class:`~.language_modeling.language_modeling_dataset.IndexedLanguageModelingDataset` is
+    stored as its token stream, and the parameters of its windows, instead, as converting it to
+    columns would copy every window out of the stream.
+
+    Parameters
+    ----------
+    cache_directory: str
+        The directory to keep cached datasets in.  We create it if it doesn't exist.
+    """
+    def __init__(self, cache_directory: str):
+        self.cache_directory = cache_directory
+        os.makedirs(cache_directory, exist_ok=True)
+
+    @staticmethod
+    def key(files: List[str], *fingerprints: str) -> str:
+        """
+        Computes a cache key from the `contents` of the given files (so moving or touching a file
+        doesn't invalidate the cache, but editing it does), and any number of additional strings
+        describing how the data gets indexed (the tokenizer configuration, the vocabulary, etc.).
+        """
+        hasher = hashlib.sha1()
+        for filename in files:
+            with open(filename, 'rb') as data_file:
+                block = data_file.read(1 << 20)
+                while block:
+                    hasher.update(block)
+                    block = data_file.read(1 << 20)
+            hasher.update(b'\0')
+        for fingerprint in fingerprints:
+            hasher.update(fingerprint.encode('utf-8'))
+            hasher.update(b'\0')
+        return hasher.hexdigest()
+
+    def load(self, key: str) -> Tuple[IndexedDataset, Any]:
+        """
+        Returns the dataset and the model state stored under ``key``, or ``None`` if there is no
+        such entry.
+        """
+        entry_directory = os.path.join(self.cache_directory, key)
+        if not os.path.exists(entry_directory):
+            return None
+        logger.info("Loading indexed dataset from cache: %s", entry_directory)
+        with open(os.path.join(entry_directory, 'metadata.pkl'), 'rb') as metadata_file:
+            metadata = pickle.load(metadata_file)
+
+        def load_array(name):
+            return numpy.load(os.path.join(entry_directory, name + '.npy'), mmap_mode='r')
+
+        if 'windows' in metadata:
+            # An IndexedLanguageModelingDataset; see _save_windows().
+            windows = metadata['windows']
+            dataset = IndexedLanguageModelingDataset(load_array('tokens'),
+                                                     windows['sequence_length'],
+                                                     windows['stride'],
+                                                     windows['random_offsets'])
+            dataset.offset = windows['offset']
+            if windows['has_rows']:
+                dataset._rows = load_array('rows')  # pylint: disable=protected-access
+            return dataset, metadata['model_state']
+
+        def load_ragged_column(name, num_levels):
+            offsets = [load_array('column.%s.offsets.%d' % (name, level)) for level in range(num_levels)]
+            return RaggedColumn(load_array('column.%s.values' % name), offsets)
+
+        columns = dict(metadata['object_columns'])
+        for name, num_levels in metadata['ragged_columns'].items():
+            columns[name] = load_ragged_column(name, num_levels)
+        for name, num_levels in metadata['shared_columns'].items():
+            columns[name] = SharedRaggedColumn(load_array('column.%s.row_ids' % name),
+                                               load_ragged_column(name, num_levels))
+        instance_lengths = {key: load_array('lengths.%s' % key) for key in metadata['length_keys']}
+        dataset = ColumnarIndexedDataset(metadata['instance_type'], columns, instance_lengths)
+        return dataset, metadata['model_state']
+
+    def save(self, key: str, dataset: IndexedDataset, model_state: Any=None):
+        """
+        Stores ``dataset`` (converting it to a ``ColumnarIndexedDataset`` first, if it isn't one
+        already) and ``model_state`` under ``key``.  We write the entry to a temporary directory
+        and then rename it, so that concurrent runs never see a partially-written entry.
+
+        We don't cache a ``LazyIndexedDataset``: it's streamed from the text data during training,
+        so storing it would mean indexing the whole corpus in memory just to write arrays that
+        training never reads.
+        """
+        if isinstance(dataset, LazyIndexedDataset):
+            logger.info("Not caching lazily indexed dataset, as it gets streamed from the text data")
+            return
+        if isinstance(dataset, IndexedLanguageModelingDataset):
+            self._save_windows(key, dataset, model_state)
+            return
+        if not isinstance(dataset, ColumnarIndexedDataset):
+            try:
+                dataset = ColumnarIndexedDataset.from_instances(dataset.instances)
+            except RuntimeError as error:
+                logger.warning("Not caching indexed dataset: %s", str(error))
+                return
+        # Selecting everything puts the columns in the dataset's current order.
+        dataset = dataset.select(numpy.arange(len(dataset)))
+        temp_directory = tempfile.mkdtemp(dir=self.cache_directory)
+
+        def save_array(name, array):
+            numpy.save(os.path.join(temp_directory, name + '.npy'), numpy.ascontiguousarray(array))
+
+        def save_ragged_column(name, column):
+            save_array('column.%s.values' % name, column.values)
+            for level, offsets in enumerate(column.offsets):
+                save_array('column.%s.offsets.%d' % (name, level), offsets)
+
+        ragged_columns = {}
+        shared_columns = {}
+        object_columns = {}
+        for name, column in dataset.columns.items():
+            if isinstance(column, RaggedColumn):
+                ragged_columns[name] = len(column.offsets)
+                save_ragged_column(name, column)
+            elif isinstance(column, SharedRaggedColumn):
+                shared_columns[name] = len(column.table.offsets)
+                save_array('column.%s.row_ids' % name, column.row_ids)
+                save_ragged_column(name, column.table)
+            else:
+                object_columns[name] = column
+        for key_name, lengths in dataset.instance_lengths.items():
+            save_array('lengths.%s' % key_name, lengths)
+        metadata = {
+                'instance_type': dataset.instance_type,
+                'ragged_columns': ragged_columns,
+                'shared_columns': shared_columns,
+                'object_columns': object_columns,
+                'length_keys': list(dataset.instance_lengths.keys()),
+                'model_state': model_state,
+                }
+        self._commit_entry(key, temp_directory, metadata)
+
+    def _save_windows(self, key: str, dataset: IndexedLanguageModelingDataset, model_state: Any):
+        """
+        Stores an ``IndexedLanguageModelingDataset`` as its token stream, the parameters of its
+        windows, and (if it has been sorted or selected from) the windows it has, in order.
+        """
+        # pylint: disable=protected-access
+        temp_directory = tempfile.mkdtemp(dir=self.cache_directory)
+        numpy.save(os.path.join(temp_directory, 'tokens.npy'), numpy.ascontiguousarray(dataset.tokens))
+        if dataset._rows is not None:
+            numpy.save(os.path.join(temp_directory, 'rows.npy'), dataset._rows)
+        windows = {
+                'sequence_length': dataset.sequence_length,
+                'stride': dataset.stride,
+                'random_offsets': dataset.random_offsets,
+                'offset': dataset.offset,
+                'has_rows': dataset._rows is not None,
+                }
+        self._commit_entry(key, temp_directory, {'windows': windows, 'model_state': model_state})
+
+    def _commit_entry(self, key: str, temp_directory: str, metadata: Dict[str, Any]):
+        """
+        Writes ``metadata`` into ``temp_directory``, and renames it to the entry for ``key``.
+        """
+        entry_directory = os.path.join(self.cache_directory, key)
+        with open(os.path.join(temp_directory, 'metadata.pkl'), 'wb') as metadata_file:
+            pickle.dump(metadata, metadata_file)
+        try:
+            os.rename(temp_directory, entry_directory)
+            logger.info("Saved indexed dataset to cache: %s", entry_directory)
+        except OSError:
+            # Someone else wrote the same entry while we were writing ours.
+            shutil.rmtree(temp_directory, ignore_errors=True)
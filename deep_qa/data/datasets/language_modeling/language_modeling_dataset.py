@@ -1,35 +1,282 @@
-from typing import List
+from typing import Callable, Dict, Iterator, List
+import itertools
 
+import numpy
 from overrides import overrides
 
-from ..dataset import TextDataset, log_label_counts
+from ..dataset import Dataset, IndexedDataset, LazyTextDataset, padding_sort_order, read_lines
+from ...data_indexer import DataIndexer
 from ...instances import TextInstance
-from ...instances.language_modeling import SentenceInstance
+from ...instances.language_modeling import SentenceInstance, IndexedSentenceInstance
+from ....common.checks import ConfigurationError
 from ....common.params import Params
 
 
-class LanguageModelingDataset(TextDataset):
+class LanguageModelingDataset(LazyTextDataset):
+    """
+    A dataset for language modeling on a (possibly very large) corpus of running text.
 
-    def __init__(self, instances: List[TextInstance], params: Params=None):
-        # TODO(Mark): We are splitting on spaces below, so this won't end up being
-        # the exact sequence length. This could be solved by passing the tokeniser
-        # to the dataset.
-        self.sequence_length = params.pop("sequence_length")
-        super(LanguageModelingDataset, self).__init__(instances)
+    The text dataset is lazy, with one :class:`SentenceInstance` per line of the corpus, so fitting
+    a vocabulary on it is a single streaming pass over the file.  :func:`to_indexed_dataset` then
+    tokenizes each line exactly once, and writes the word indices of the whole corpus, in order,
+    into one flat ``int32`` token stream.  The training instances are fixed-length windows over
+    that stream, which we only cut out of it when we make a batch; see
+    :class:`IndexedLanguageModelingDataset`.
+
+    Parameters
+    ----------
+    instance_generator: Callable[[], Iterator[TextInstance]]
+        A function that returns a new iterator over the lines of the corpus, as
+        ``SentenceInstances``.
+    params: Params, optional (default=None)
+        Can contain the following keys:
+
+        - ``sequence_length`` (default=20): the number of words in each training window.  The
+          labels are the same window shifted one word to the right.
+        - ``stride`` (default=``sequence_length``): the number of words between the starts of
+          consecutive windows.  Less than ``sequence_length`` gives overlapping windows.
+        - ``random_offsets`` (default=``False``): if ``True``, every epoch starts its windows at a
+          random offset in ``[0, stride)``, so that different epochs see different windows.
+        - ``token_file`` (default=``None``): if given, we write the token stream to this file, and
+          memory-map it, instead of keeping it in memory.
+    max_instances: int, optional (default=None)
+        If not ``None``, we only read this many lines of the corpus.
+    """
+    # How many word indices we collect in python lists before converting them to an array (and
+    # writing them to ``token_file``, if we have one).
+    flush_size = 1 << 20
+
+    def __init__(self,
+                 instance_generator: Callable[[], Iterator[TextInstance]],
+                 params: Params=None,
+                 max_instances: int=None):
+        params = params or Params({})
+        self.sequence_length = params.pop("sequence_length", 20)
+        self.stride = params.pop("stride", None)
+        if self.stride is None:
+            self.stride = self.sequence_length
+        self.random_offsets = params.pop("random_offsets", False)
+        self.token_file = params.pop("token_file", None)
+        if self.stride < 1:
+            raise ConfigurationError("stride must be positive, not %d" % self.stride)
+        super(LanguageModelingDataset, self).__init__(instance_generator, params, max_instances)
+
+    def _params(self) -> Params:
+        return Params({"sequence_length": self.sequence_length,
+                       "stride": self.stride,
+                       "random_offsets": self.random_offsets,
+                       "token_file": self.token_file})
+
+    @overrides
+    def merge(self, other: 'Dataset') -> 'LanguageModelingDataset':
+        if type(self) is not type(other):
+            raise RuntimeError("Cannot merge datasets with different types")
+        return LanguageModelingDataset(lambda: itertools.chain(self.instances, other.instances), self._params())
+
+    @overrides
+    def truncate(self, max_instances: int) -> 'LanguageModelingDataset':
+        if self.max_instances is not None:
+            max_instances = min(max_instances, self.max_instances)
+        return LanguageModelingDataset(self.instance_generator, self._params(), max_instances)
+
+    @overrides
+    def to_indexed_dataset(self,
+                           data_indexer: DataIndexer,
+                           columnar: bool=False,
+                           num_workers: int=1,
+                           lazy: bool=False,
+                           fit_data_indexer: bool=False) -> 'IndexedLanguageModelingDataset':
+        """
+        Tokenizes and indexes the corpus, line by line, into a flat ``int32`` token stream, and
+        returns an :class:`IndexedLanguageModelingDataset` of windows over it.
+
+        The token stream is already compact and supports random access to any window, so
+        ``columnar`` and ``lazy`` don't change anything here, and we always index in a single
+        process, ignoring ``num_workers``.  ``fit_data_indexer`` works as in
+        :func:`LazyTextDataset.to_indexed_dataset`.
+        """
+        # pylint: disable=unused-argument
+        token_file = open(self.token_file, 'wb') if self.token_file else None
+        chunks = []
+        buffer = []
+        num_tokens = 0
+
+        def flush_buffer():
+            chunk = numpy.asarray(buffer, dtype='int32')
+            del buffer[:]
+            if token_file is not None:
+                chunk.tofile(token_file)
+            else:
+                chunks.append(chunk)
+            return len(chunk)
+
+        try:
+            for instance in TextInstance.tokenize_in_batches(self.instances):
+                if fit_data_indexer:
+                    for namespace, words in instance.words().items():
+                        for word in words:
+                            data_indexer.add_word_to_index(word, namespace)
+                indices = TextInstance.tokenizer.index_text(instance.text, data_indexer)
+                if indices and isinstance(indices[0], list):
+                    raise ConfigurationError("LanguageModelingDataset needs a tokenizer that gives one "
+                                             "index per word, not characters")
+                buffer.extend(indices)
+                if len(buffer) >= self.flush_size:
+                    num_tokens += flush_buffer()
+            num_tokens += flush_buffer()
+        finally:
+            if token_file is not None:
+                token_file.close()
+        if token_file is not None and num_tokens > 0:
+            tokens = numpy.memmap(self.token_file, dtype='int32', mode='r')
+        else:
+            tokens = numpy.concatenate(chunks) if chunks else numpy.zeros(0, dtype='int32')
+        return IndexedLanguageModelingDataset(tokens, self.sequence_length, self.stride, self.random_offsets)
 
     @staticmethod
     @overrides
     def read_from_file(filename: str, instance_class, params: Params=None):
+        # We always read SentenceInstances, one per line; the windows are made after indexing.
+        def instance_generator():
+            return (SentenceInstance(line) for line in read_lines(filename) if line)
+        return LanguageModelingDataset(instance_generator, params)
+
+
+class IndexedLanguageModelingDataset(IndexedDataset):
+    """
+    An ``IndexedDataset`` of fixed-length language modeling windows over a flat ``int32`` token
+    stream (typically made by :func:`LanguageModelingDataset.to_indexed_dataset`).
+
+    Window ``i`` covers the ``sequence_length + 1`` tokens starting at ``offset + i * stride``; the
+    first ``sequence_length`` of those are the inputs, and the last ``sequence_length`` are the
+    (next word) labels.  We never store the windows: :func:`windows` is a strided view of the token
+    stream, which also works when the stream is memory-mapped, and a batch only copies the rows it
+    selects out of that view.  As every window has the same length, there is no padding to do.
+
+    If ``random_offsets`` is ``True``, :func:`start_epoch` (which the
+    :class:`~deep_qa.data.DataGenerator` calls before every pass over the data) picks a new random
+    ``offset`` in ``[0, stride)``.  The number of windows is computed for the largest possible
+    offset, so it stays the same across epochs.
+
+    Parameters
+    ----------
+    tokens: numpy.array
+        The word indices of the whole corpus, in order.
+    sequence_length: int
+        The number of words in each window.
+    stride: int, optional (default=None)
+        The number of words between the starts of consecutive windows.  Defaults to
+        ``sequence_length``, which gives non-overlapping windows.
+    random_offsets: bool, optional (default=False)
+        Whether to start the windows at a random offset every epoch.
+    """
+    def __init__(self,
+                 tokens: numpy.array,
+                 sequence_length: int,
+                 stride: int=None,
+                 random_offsets: bool=False):
+        # pylint: disable=super-init-not-called
+        # We don't call the superclass constructor, because we don't have a list of instances.
+        self.tokens = tokens
+        self.sequence_length = sequence_length
+        self.stride = stride or sequence_length
+        self.random_offsets = random_offsets
+        self.offset = 0
+        max_offset = self.stride - 1 if random_offsets else 0
+        self._num_windows = max(0, (len(tokens) - 1 - sequence_length - max_offset) // self.stride + 1)
+        # The windows in this dataset, in order, after sorting or selecting; ``None`` means all of
+        # the windows, in the order they occur in the text.
+        self._rows = None
+        self._lengths_to_use = None
+
+    @overrides
+    def __len__(self):
+        return self._num_windows if self._rows is None else len(self._rows)
+
+    @property
+    def instances(self) -> List[IndexedSentenceInstance]:
+        """
+        Creates an ``IndexedSentenceInstance`` for every window in the dataset.  This is here for
+        compatibility with code that expects an ``IndexedDataset``; don't use it on large datasets.
+        """
+        return [IndexedSentenceInstance(window[:-1], window[1:])
+                for window in self.windows()[self.__rows()].tolist()]
+
+    def windows(self) -> numpy.array:
+        """
+        Returns a read-only ``(num_windows, sequence_length + 1)`` view of the token stream, with
+        the current ``offset``, where row ``i`` is window ``i``.  This doesn't copy any tokens.
+        """
+        tokens = self.tokens[self.offset:]
+        item_stride = tokens.strides[0]
+        return numpy.lib.stride_tricks.as_strided(tokens,
+                                                  shape=(self._num_windows, self.sequence_length + 1),
+                                                  strides=(self.stride * item_stride, item_stride),
+                                                  writeable=False)
+
+    @overrides
+    def start_epoch(self):
+        if self.random_offsets:
+            self.offset = numpy.random.randint(self.stride)
 
-        sequence_length = params.get("sequence_length", 20)
-        with open(filename, "r") as text_file:
-            text = text_file.readlines()
-            text = " ".join([x.replace("\n", " ").strip() for x in text]).split(" ")
+    @overrides
+    def merge(self, other: 'Dataset') -> 'IndexedLanguageModelingDataset':
+        raise RuntimeError("IndexedLanguageModelingDatasets can't be merged; merge the text datasets "
+                           "before indexing them instead")
+
+    @overrides
+    def truncate(self, max_instances: int) -> 'IndexedLanguageModelingDataset':
+        if len(self) <= max_instances:
+            return self
+        return self.select(numpy.arange(max_instances))
+
+    @overrides
+    def sort_by_padding(self, sorting_keys: List[str], padding_noise: float=0.0):
+        # All of the windows have the same length, so this just shuffles them if there's noise.
+        order = padding_sort_order(self.padding_length_arrays(), sorting_keys, padding_noise)
+        self._rows = self.__rows()[order]
 
-        instances = []
-        for index in range(0, len(text) - sequence_length, sequence_length):
-            word_sequence = " ".join(text[index: index + sequence_length])
-            instances.append(SentenceInstance(word_sequence))
+    @overrides
+    def padding_length_arrays(self) -> Dict[str, numpy.array]:
+        return {'num_sentence_words': numpy.full(len(self), self.sequence_length, dtype='int32')}
+
+    @overrides
+    def select(self, positions: List[int]) -> 'IndexedLanguageModelingDataset':
+        """
+        Returns a dataset of the windows at ``positions``.  The selection shares our token stream,
+        and keeps our current ``offset``, even if :func:`start_epoch` changes it later.
+        """
+        selected = IndexedLanguageModelingDataset(self.tokens,
+                                                  self.sequence_length,
+                                                  self.stride,
+                                                  self.random_offsets)
+        selected.offset = self.offset
+        selected._rows = self.__rows()[numpy.asarray(positions, dtype='int64')]  # pylint: disable=protected-access
+        return selected
+
+    @overrides
+    def instance_padding_lengths(self) -> List[Dict[str, int]]:
+        return [{'num_sentence_words': self.sequence_length} for _ in range(len(self))]
+
+    @overrides
+    def padding_lengths(self):
+        return {'num_sentence_words': self.sequence_length}
+
+    @overrides
+    def as_training_data(self):
+        """
+        Copies the selected windows out of :func:`windows`, and returns them as inputs and labels
+        in the same format as :func:`IndexedSentenceInstance.batch_as_training_data`.
+        """
+        if self._lengths_to_use is not None and \
+                self._lengths_to_use['num_sentence_words'] != self.sequence_length:
+            raise ConfigurationError("Language modeling windows have %d words, but we were asked to pad "
+                                     "them to %d" % (self.sequence_length,
+                                                     self._lengths_to_use['num_sentence_words']))
+        windows = self.windows()[self.__rows()]
+        # The expand dims here is because Keras' sparse categorical cross entropy expects tensors
+        # of shape (batch_size, num_words, 1).
+        return windows[:, :-1], numpy.expand_dims(windows[:, 1:], axis=2)
 
-        log_label_counts(instances)
-        return LanguageModelingDataset(instances, params)
+    def __rows(self) -> numpy.array:
+        return numpy.arange(self._num_windows) if self._rows is None else self._rows
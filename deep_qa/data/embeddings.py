@@ -1,10 +1,18 @@
+from typing import Any, Dict, Iterator, List, Set, Tuple
 import codecs
 import gzip
+import hashlib
+import itertools
+import json
 import logging
+import os
+import shutil
+import tempfile
 
 import numpy
 from keras.layers import Embedding
 from .data_indexer import DataIndexer
+from ..common.util import map_over_shards
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
@@ -21,80 +29,302 @@ class PretrainedEmbeddings:
     def get_embedding_layer(embeddings_filename: str,
                             data_indexer: DataIndexer,
                             trainable=False,
-                            log_misses=False,
-                            name="pretrained_embedding"):
+                            misses_filename: str=None,
+                            name="pretrained_embedding",
+                            cache_directory: str=None,
+                            num_workers: int=1):
         """
         Reads a pre-trained embedding file and generates a Keras Embedding layer that has weights
         initialized to the pre-trained embeddings.  The Embedding layer can either be trainable or
         not.
 
+        See :func:`get_embedding_matrix` for how we read the embedding file, and for what
+        ``cache_directory`` and ``num_workers`` do.  We log how much of the vocabulary the
+        embedding file covers, and if you give a ``misses_filename``, we write the full miss
+        statistics there, as JSON.
+        """
+        embedding_matrix, statistics = PretrainedEmbeddings.get_embedding_matrix(embeddings_filename,
+                                                                                 data_indexer,
+                                                                                 cache_directory,
+                                                                                 num_workers)
+        logger.info("Pre-trained embeddings cover %.2f%% of the vocabulary (%d misses)",
+                    statistics['coverage'], statistics['num_misses'])
+        if misses_filename is not None:
+            logger.info("Logging embedding misses to %s", misses_filename)
+            with codecs.open(misses_filename, 'w', 'utf-8') as misses_file:
+                json.dump(statistics, misses_file, ensure_ascii=False, indent=2)
+
+        # The weight matrix is initialized, so we construct and return the actual Embedding layer.
+        vocab_size, embedding_dim = embedding_matrix.shape
+        return Embedding(input_dim=vocab_size,
+                         output_dim=embedding_dim,
+                         mask_zero=True,
+                         weights=[embedding_matrix],
+                         trainable=trainable,
+                         name=name)
+
+    @staticmethod
+    def get_embedding_matrix(embeddings_filename: str,
+                             data_indexer: DataIndexer,
+                             cache_directory: str=None,
+                             num_workers: int=1,
+                             num_top_misses: int=20) -> Tuple[numpy.array, Dict[str, Any]]:
+        """
+        Reads a pre-trained embedding file, and returns an embedding matrix for the words in the
+        ``DataIndexer``, along with statistics about the words that the file doesn't have a vector
+        for.
+
         We use the DataIndexer to map from the word strings in the embeddings file to the indices
         that we need, and to know which words from the embeddings file we can safely ignore.  If we
-        come across a word in DataIndexer that does not show up with the embeddings file, we give
-        it a zero vector.
+        come across a word in DataIndexer that does not show up with the embeddings file, we leave
+        its row with a random initialization.
 
         The embeddings file is assumed to be gzipped, formatted as [word] [dim 1] [dim 2] ...
+
+        Parsing a large embedding file is slow, so if you give a ``cache_directory``, the first
+        time we see an embedding file we convert all of it into a binary matrix in that directory
+        (see :func:`read_binary_embeddings`).  After that, we just memory-map the matrix and pull
+        out the rows for the words in the ``DataIndexer``, which is much faster.
+
+        If ``num_workers`` is greater than one, we parse the text file in that many worker
+        processes, while the main process decompresses it and hands out blocks of lines.
+
+        Returns
+        -------
+        embedding_matrix: numpy.array
+            A ``(vocab_size, embedding_dim)`` matrix.
+        statistics: Dict[str, Any]
+            A JSON-serializable dictionary with the number of words we looked for
+            (``num_words``, which excludes the padding and OOV tokens), the number of those we
+            didn't find (``num_misses``), the percentage we did find (``coverage``), and the
+            missed words with their counts from :func:`DataIndexer.fit_word_dictionary`, most
+            frequent first (``misses``, and the first ``num_top_misses`` of those, ``top_misses``).
         """
-        words_to_keep = set(data_indexer.words_in_index())
         vocab_size = data_indexer.get_vocab_size()
-        embeddings = {}
-        embedding_dim = None
-
-        # TODO(matt): make this a parameter
-        embedding_misses_filename = 'embedding_misses.txt'
-
-        # First we read the embeddings from the file, only keeping vectors for the words we need.
-        logger.info("Reading embeddings from file")
-        with gzip.open(embeddings_filename, 'rb') as embeddings_file:
-            for line in embeddings_file:
-                fields = line.decode('utf-8').strip().split(' ')
-                if embedding_dim is None:
-                    embedding_dim = len(fields) - 1
-                    assert embedding_dim > 1, "Found embedding size of 1; do you have a header?"
-                else:
-                    if len(fields) - 1 != embedding_dim:
-                        # Sometimes there are funny unicode parsing problems that lead to different
-                        # fields lengths (e.g., a word with a unicode space character that splits
-                        # into more than one column).  We skip those lines.  Note that if you have
-                        # some kind of long header, this could result in all of your lines getting
-                        # skipped.  It's hard to check for that here; you just have to look in the
-                        # embedding_misses_file and at the model summary to make sure things look
-                        # like they are supposed to.
-                        continue
-                word = fields[0]
-                if word in words_to_keep:
-                    vector = numpy.asarray(fields[1:], dtype='float32')
-                    embeddings[word] = vector
-
+        vocabulary = data_indexer.words_in_index()
+        if cache_directory is not None:
+            rows, vectors = PretrainedEmbeddings.read_binary_embeddings(embeddings_filename,
+                                                                        cache_directory,
+                                                                        vocabulary[2:],
+                                                                        num_workers)
+            embedding_dim = vectors.shape[1]
+        else:
+            embedding_dim = _read_embedding_dim(embeddings_filename)
 
         # Now we initialize the weight matrix for an embedding layer, starting with random vectors,
-        # then filling in the word vectors we just read.
-        logger.info("Initializing pre-trained embedding layer")
-        if log_misses:
-            logger.info("Logging embedding misses to %s", embedding_misses_filename)
-            embedding_misses_file = codecs.open(embedding_misses_filename, 'w', 'utf-8')
+        # then filling in the word vectors we read.
+        logger.info("Initializing pre-trained embedding matrix")
         embedding_matrix = PretrainedEmbeddings.initialize_random_matrix((vocab_size, embedding_dim))
 
         # The 2 here is because we know too much about the DataIndexer.  Index 0 is the padding
         # index, and the vector for that dimension is going to be 0.  Index 1 is the OOV token, and
         # we can't really set a vector for the OOV token.
-        for i in range(2, vocab_size):
-            word = data_indexer.get_word_from_index(i)
+        indices = numpy.arange(2, vocab_size)
+        if cache_directory is not None:
+            # We have the row of each index in the binary cache (or -1, if the cache doesn't have
+            # the word), so we gather all of the vectors we need with one fancy-indexing call.
+            found = rows >= 0
+            embedding_matrix[indices[found]] = vectors[rows[found]]
+        else:
+            # We read the text file in blocks, only keeping vectors for the words we need, and put
+            # each block's vectors straight into their rows of the embedding matrix.
+            logger.info("Reading embeddings from file")
+            found = numpy.zeros(len(indices), dtype='bool')
+            words_to_keep = set(vocabulary[2:])
+            for words, vectors in _read_embedding_blocks(embeddings_filename, words_to_keep, num_workers):
+                word_indices = data_indexer.get_word_indices(words)
+                embedding_matrix[word_indices] = vectors
+                found[word_indices - 2] = True
 
-            # If we don't have a pre-trained vector for this word, we'll just leave this row alone,
-            # so the word has a random initialization.
-            if word in embeddings:
-                embedding_matrix[i] = embeddings[word]
-            elif log_misses:
-                print(word, file=embedding_misses_file)
+        misses = [(vocabulary[index], data_indexer.get_word_count(vocabulary[index]))
+                  for index in indices[~found].tolist()]
+        # This sort is stable, so words with the same count stay in index order.
+        misses.sort(key=lambda miss: -miss[1])
+        num_words = len(indices)
+        statistics = {
+                'num_words': num_words,
+                'num_misses': len(misses),
+                'coverage': 100.0 * (num_words - len(misses)) / num_words if num_words else 100.0,
+                'top_misses': misses[:num_top_misses],
+                'misses': misses,
+                }
+        return embedding_matrix, statistics
 
-        if log_misses:
-            embedding_misses_file.close()
+    @staticmethod
+    def read_binary_embeddings(embeddings_filename: str,
+                               cache_directory: str,
+                               words: List[str],
+                               num_workers: int=1) -> Tuple[numpy.array, numpy.array]:
+        """
+        Returns the row of each of ``words`` in a read-only, memory-mapped ``float32`` matrix of
+        all of the vectors in the given embedding file (or -1 for words the file doesn't have), and
+        that matrix.
 
-        # The weight matrix is initialized, so we construct and return the actual Embedding layer.
-        return Embedding(input_dim=vocab_size,
-                         output_dim=embedding_dim,
-                         mask_zero=True,
-                         weights=[embedding_matrix],
-                         trainable=trainable,
-                         name=name)
+        The first time we see an embedding file, we parse all of it, and write the matrix (as raw
+        ``float32`` values) into ``cache_directory``, with the words as UTF-8 bytes, and a sorted
+        array of their hashes; every later call just memory-maps those files.  We look ``words``
+        up by their hashes with ``numpy.searchsorted``, and then check that the word in the cache
+        really is the same, so the cost of a lookup depends on the number of ``words``, not on the
+        size of the embedding file.  If the file has a word more than once, we use its last vector,
+        as reading the text file does.
+
+        The cache entry is keyed on the embedding file's absolute path, size and modification time,
+        so if the file changes, we convert it again.  ``num_workers`` is the number of processes to
+        use for the conversion.
+        """
+        os.makedirs(cache_directory, exist_ok=True)
+        file_stat = os.stat(embeddings_filename)
+        hasher = hashlib.sha1()
+        hasher.update(("%s\0%d\0%f" % (os.path.abspath(embeddings_filename),
+                                        file_stat.st_size,
+                                        file_stat.st_mtime)).encode('utf-8'))
+        entry_directory = os.path.join(cache_directory, hasher.hexdigest())
+        if not os.path.exists(entry_directory):
+            PretrainedEmbeddings.__write_binary_embeddings(embeddings_filename,
+                                                           cache_directory,
+                                                           entry_directory,
+                                                           num_workers)
+        logger.info("Reading binary embeddings from %s", entry_directory)
+        with codecs.open(os.path.join(entry_directory, 'metadata.json'), 'r', 'utf-8') as metadata_file:
+            metadata = json.load(metadata_file)
+
+        def load_array(name):
+            return numpy.load(os.path.join(entry_directory, name + '.npy'), mmap_mode='r')
+
+        vectors = numpy.memmap(os.path.join(entry_directory, 'vectors.bin'), dtype='float32', mode='r',
+                               shape=(metadata['num_words'], metadata['embedding_dim']))
+        word_hashes = load_array('word_hashes')
+        hash_rows = load_array('hash_rows')
+        word_offsets = load_array('word_offsets')
+        word_bytes_filename = os.path.join(entry_directory, 'words.bin')
+        if os.path.getsize(word_bytes_filename) > 0:
+            word_bytes = numpy.memmap(word_bytes_filename, dtype='uint8', mode='r')
+        else:
+            # numpy can't memory-map an empty file.
+            word_bytes = numpy.zeros(0, dtype='uint8')
+
+        encoded_words = [word.encode('utf-8') for word in words]
+        hashes = _hash_words(encoded_words)
+        positions = numpy.searchsorted(word_hashes, hashes)
+        rows = numpy.full(len(words), -1, dtype='int64')
+        for i, (word, word_hash, position) in enumerate(zip(encoded_words, hashes.tolist(), positions.tolist())):
+            # Different words can (very rarely) have the same hash, so we check each word in the
+            # cache with this hash until we find the one we're looking for.
+            while position < len(word_hashes) and word_hashes[position] == word_hash:
+                row = hash_rows[position]
+                if word_bytes[word_offsets[row]:word_offsets[row + 1]].tobytes() == word:
+                    rows[i] = row
+                    break
+                position += 1
+        return rows, vectors
+
+    @staticmethod
+    def __write_binary_embeddings(embeddings_filename: str,
+                                  cache_directory: str,
+                                  entry_directory: str,
+                                  num_workers: int):
+        logger.info("Converting %s to binary embeddings in %s", embeddings_filename, entry_directory)
+        # We write to a temporary directory and then rename it, so that concurrent runs never see a
+        # partially-written entry.
+        temp_directory = tempfile.mkdtemp(dir=cache_directory)
+        word_lengths = []
+        hashes = []
+        embedding_dim = _read_embedding_dim(embeddings_filename)
+        with open(os.path.join(temp_directory, 'vectors.bin'), 'wb') as vectors_file, \
+                open(os.path.join(temp_directory, 'words.bin'), 'wb') as words_file:
+            for block_words, block_vectors in _read_embedding_blocks(embeddings_filename, None, num_workers):
+                encoded_words = [word.encode('utf-8') for word in block_words]
+                words_file.write(b''.join(encoded_words))
+                word_lengths.extend(len(word) for word in encoded_words)
+                hashes.append(_hash_words(encoded_words))
+                vectors_file.write(block_vectors.tobytes())
+        hashes = numpy.concatenate(hashes) if hashes else numpy.zeros(0, dtype='uint64')
+        num_words = len(hashes)
+        word_offsets = numpy.zeros(num_words + 1, dtype='int64')
+        numpy.cumsum(word_lengths, out=word_offsets[1:])
+        # We sort the rows by hash, and rows with the same hash from last to first, so that a lookup
+        # finds the last vector of a repeated word.
+        hash_rows = numpy.lexsort((-numpy.arange(num_words), hashes))
+        numpy.save(os.path.join(temp_directory, 'word_offsets.npy'), word_offsets)
+        numpy.save(os.path.join(temp_directory, 'word_hashes.npy'), hashes[hash_rows])
+        numpy.save(os.path.join(temp_directory, 'hash_rows.npy'), hash_rows)
+        with codecs.open(os.path.join(temp_directory, 'metadata.json'), 'w', 'utf-8') as metadata_file:
+            json.dump({'num_words': num_words, 'embedding_dim': embedding_dim}, metadata_file)
+        try:
+            os.rename(temp_directory, entry_directory)
+        except OSError:
+            # Someone else converted the same file while we were converting it.
+            shutil.rmtree(temp_directory, ignore_errors=True)
+
+
+def _hash_words(encoded_words: List[bytes]) -> numpy.array:
+    """
+    Returns a ``uint64`` hash of each of the given UTF-8 encoded words.  Unlike python's ``hash``,
+    this is the same in every process, so we can store it in the binary embedding cache.
+    """
+    digests = b''.join(hashlib.md5(word).digest()[:8] for word in encoded_words)
+    return numpy.frombuffer(digests, dtype='<u8').astype('uint64')
+
+
+def _read_embedding_dim(embeddings_filename: str) -> int:
+    """
+    Returns the embedding dimension of a gzipped embedding file, from its first line.
+    """
+    with gzip.open(embeddings_filename, 'rb') as embeddings_file:
+        first_line = embeddings_file.readline()
+    embedding_dim = len(first_line.decode('utf-8').strip().split(' ')) - 1
+    assert embedding_dim > 1, "Found embedding size of 1; do you have a header?"
+    return embedding_dim
+
+
+def _read_embedding_blocks(embeddings_filename: str,
+                           words_to_keep: Set[str]=None,
+                           num_workers: int=1,
+                           block_size: int=10000) -> Iterator[Tuple[List[str], numpy.array]]:
+    """
+    Reads a gzipped embedding file in blocks of ``block_size`` lines, yielding the words in each
+    block (only those in ``words_to_keep``, if it's given), and a ``float32`` matrix of their
+    vectors, in file order.  If ``num_workers`` is greater than one, we decompress the file here,
+    and parse the blocks in that many worker processes.
+    """
+    embedding_dim = _read_embedding_dim(embeddings_filename)
+    with gzip.open(embeddings_filename, 'rb') as embeddings_file:
+        if num_workers > 1:
+            for block in map_over_shards(_parse_embedding_lines, embeddings_file, num_workers,
+                                         embedding_dim, words_to_keep, shard_size=block_size):
+                yield block
+        else:
+            lines = list(itertools.islice(embeddings_file, block_size))
+            while lines:
+                yield _parse_embedding_lines(lines, embedding_dim, words_to_keep)
+                lines = list(itertools.islice(embeddings_file, block_size))
+
+
+def _parse_embedding_lines(lines: List[bytes],
+                           embedding_dim: int,
+                           words_to_keep: Set[str]=None) -> Tuple[List[str], numpy.array]:
+    """
+    Parses a block of lines from an embedding file (see :func:`_read_embedding_blocks`).  We check
+    the word of each line before parsing its vector, and then parse the vectors of all of the lines
+    we keep with a single call to ``numpy.fromstring``.
+    """
+    words = []
+    vector_strings = []
+    for line in lines:
+        line = line.decode('utf-8').strip()
+        if line.count(' ') != embedding_dim:
+            # Sometimes there are funny unicode parsing problems that lead to different fields
+            # lengths (e.g., a word with a unicode space character that splits into more than one
+            # column).  We skip those lines.  Note that if you have some kind of long header, this
+            # could result in all of your lines getting skipped.  It's hard to check for that here;
+            # you just have to look at the embedding miss statistics and at the model summary to
+            # make sure things look like they are supposed to.
+            continue
+        word, vector_string = line.split(' ', 1)
+        if words_to_keep is None or word in words_to_keep:
+            words.append(word)
+            vector_strings.append(vector_string)
+    vectors = numpy.fromstring(' '.join(vector_strings), dtype='float32', sep=' ')
+    if len(vectors) != len(words) * embedding_dim:
+        raise ValueError("Could not parse all of the embedding vectors in a block of lines")
+    return words, vectors.reshape(len(words), embedding_dim)
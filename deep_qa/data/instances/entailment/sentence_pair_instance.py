@@ -18,6 +18,10 @@ class SentencePairInstance(TextInstance):
         self.first_sentence = first_sentence
         self.second_sentence = second_sentence
 
+    @overrides
+    def texts(self) -> List[str]:
+        return [self.first_sentence, self.second_sentence]
+
     @overrides
     def words(self) -> Dict[str, List[str]]:
         words = self._words_from_text(self.first_sentence)
@@ -80,3 +84,15 @@ class IndexedSentencePairInstance(IndexedInstance):
         first_sentence_array = numpy.asarray(self.first_sentence_indices, dtype='int32')
         second_sentence_array = numpy.asarray(self.second_sentence_indices, dtype='int32')
         return (first_sentence_array, second_sentence_array), numpy.asarray(self.label)
+
+    @classmethod
+    @overrides
+    def batch_as_training_data(cls,
+                               instances: List['IndexedSentencePairInstance'],
+                               padding_lengths: Dict[str, int]):
+        first_sentence_array = cls.pad_word_sequences(
+                [instance.first_sentence_indices for instance in instances], padding_lengths)
+        second_sentence_array = cls.pad_word_sequences(
+                [instance.second_sentence_indices for instance in instances], padding_lengths)
+        labels = numpy.asarray([numpy.asarray(instance.label) for instance in instances])
+        return [first_sentence_array, second_sentence_array], labels
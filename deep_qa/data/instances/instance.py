@@ -17,8 +17,11 @@ all of the concrete ``Instance`` types will have both a ``TextInstance`` and a
 corresponding ``IndexedInstance``, which you can see in the individual files
 for each ``Instance`` type.
 """
+from copy import deepcopy
 import itertools
-from typing import Any, Callable, Dict, List
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+import numpy
 
 from ...common.params import Params
 from ..tokenizers import tokenizers
@@ -71,6 +74,48 @@ class TextInstance(Instance):
     def _index_text(self, text: str, data_indexer: DataIndexer) -> List[int]:
         return self.tokenizer.index_text(text, data_indexer)
 
+    def texts(self) -> List[str]:
+        """
+        Returns all of the strings in this instance that get tokenized, so that their tokenization
+        can be batched with that of other instances (see :func:`tokenize_in_batches`).  Returning
+        an empty list, as we do by default, is always correct; the texts just get tokenized one at
+        a time, as they're used.
+        """
+        return []
+
+    @classmethod
+    def tokenize_in_batches(cls,
+                            instances: Iterable['TextInstance'],
+                            batch_size: int=1000) -> Iterator['TextInstance']:
+        """
+        Yields ``instances``, after giving the :func:`texts` of each ``batch_size`` of them to
+        :func:`Tokenizer.cache_tokens <deep_qa.data.tokenizers.tokenizer.Tokenizer.cache_tokens>`,
+        so that the tokenizer can process them in one batch before :func:`words` or
+        :func:`to_indexed_instance` get called on them.
+        """
+        instances = iter(instances)
+        batch = list(itertools.islice(instances, batch_size))
+        while batch:
+            cls.tokenizer.cache_tokens([text for instance in batch for text in instance.texts()])
+            for instance in batch:
+                yield instance
+            batch = list(itertools.islice(instances, batch_size))
+
+    @classmethod
+    def index_in_batches(cls,
+                         instances: Iterable['TextInstance'],
+                         data_indexer: DataIndexer,
+                         batch_size: int=1000) -> Iterator['IndexedInstance']:
+        """
+        Yields each of ``instances`` indexed with ``data_indexer``, tokenizing them in batches
+        first (see :func:`tokenize_in_batches`).  All of the instances share one passage table (see
+        :func:`index_with_passage_table`), which only lives as long as this iteration, so a passage
+        that several instances have is indexed once per pass over the data.
+        """
+        passage_table = {}  # type: Dict[Any, Any]
+        for instance in cls.tokenize_in_batches(instances, batch_size):
+            yield instance.index_with_passage_table(data_indexer, passage_table)
+
     def words(self) -> Dict[str, List[str]]:
         """
         Returns a list of all of the words in this instance, contained in a
@@ -116,6 +161,18 @@ class TextInstance(Instance):
         """
         raise NotImplementedError
 
+    def index_with_passage_table(self,
+                                 data_indexer: DataIndexer,
+                                 passage_table: Dict[Any, Any]) -> 'IndexedInstance':
+        """
+        Like :func:`to_indexed_instance`, but instances with a passage that other instances can
+        share (see :class:`~deep_qa.data.instances.reading_comprehension.QuestionPassageInstance`)
+        look up what they compute from it in ``passage_table``, and store it there for the next
+        instance with the same passage.  Instances without passages ignore the table.
+        """
+        # pylint: disable=unused-argument
+        return self.to_indexed_instance(data_indexer)
+
     @classmethod
     def read_from_line(cls, line: str):
         """
@@ -188,7 +245,10 @@ class IndexedInstance(Instance):
         Add zero-padding to make each data example of equal length for use
         in the neural network.
 
-        This modifies the current object.
+        This modifies the current object.  ``IndexedDataset`` and ``DataGenerator`` don't call
+        this method; they use :func:`batch_as_training_data`, which returns new padded arrays and
+        leaves the instances untouched, so the same instances can be padded to different lengths
+        over and over without being copied.
 
         Parameters
         ----------
@@ -215,6 +275,61 @@ class IndexedInstance(Instance):
         """
         raise NotImplementedError
 
+    @classmethod
+    def batch_as_training_data(cls,
+                               instances: List['IndexedInstance'],
+                               padding_lengths: Dict[str, int]):
+        """
+        Pads a whole batch of (unpadded) instances of this type and converts them into (inputs,
+        labels) arrays in one step, without modifying the instances.  The result is the same as
+        calling :func:`pad` and then :func:`as_training_data` on each instance, then stacking the
+        results with :func:`stack_training_data`.
+
+        This default implementation does exactly that, on a copy of each instance.  Concrete
+        ``IndexedInstance`` types override this to write their ragged index lists directly into
+        preallocated batch arrays with :func:`pad_word_sequences`, which is a whole lot faster than
+        padding python lists one instance at a time.
+
+        Parameters
+        ----------
+        instances: List[IndexedInstance]
+            The instances to pad.  These must all be of type ``cls``.
+        padding_lengths: Dict[str, int]
+            The lengths to pad to, with the same keys as returned by
+            :func:`~IndexedInstance.get_padding_lengths()`.
+
+        Returns
+        -------
+        train_data : (inputs, labels)
+            Batched numpy arrays, in the format described in :func:`stack_training_data`.
+        """
+        training_data = []
+        for instance in instances:
+            padded_instance = deepcopy(instance)
+            padded_instance.pad(padding_lengths)
+            training_data.append(padded_instance.as_training_data())
+        return cls.stack_training_data(training_data)
+
+    @staticmethod
+    def stack_training_data(training_data: List[Tuple[Any, Any]]):
+        """
+        Takes a list of (inputs, label) pairs, as returned by :func:`as_training_data` for each
+        instance, and stacks them into batch arrays.  Note that if the ``Instances`` return tuples
+        for their inputs, we convert the list of tuples into a list of arrays, one per element of
+        the tuple.  The same goes for labels.
+        """
+        inputs = [instance_inputs for instance_inputs, _ in training_data]
+        labels = [label for _, label in training_data]
+        if isinstance(inputs[0], tuple):
+            inputs = [numpy.asarray(x) for x in zip(*inputs)]
+        else:
+            inputs = numpy.asarray(inputs)
+        if isinstance(labels[0], tuple):
+            labels = [numpy.asarray(x) for x in zip(*labels)]
+        else:
+            labels = numpy.asarray(labels)
+        return inputs, labels
+
     @staticmethod
     def _get_word_sequence_lengths(word_indices: List) -> Dict[str, int]:
         """
@@ -299,6 +414,117 @@ class IndexedInstance(Instance):
                                     for word in words_padded_to_longest]
         return padded_word_sequence
 
+    @staticmethod
+    def pad_word_sequences(word_sequences: List[List],
+                           padding_lengths: Dict[str, int],
+                           truncate_from_right: bool=True) -> numpy.array:
+        """
+        The batch version of :func:`pad_word_sequence`: takes a list of (ragged) word index
+        sequences and writes them all into a single preallocated ``int32`` array, with the same
+        padding and truncation semantics as padding each sequence individually.
+
+        Parameters
+        ----------
+        word_sequences : List of List
+            A list of word index sequences.  If ``padding_lengths`` contains a
+            ``num_word_characters`` key, each word in the sequences must itself be a list of
+            indices (as produced by the "words and characters" tokenizer), otherwise each word is
+            an int.
+
+        padding_lengths : Dict[str, int]
+            Must contain ``num_sentence_words``, and optionally ``num_word_characters``.
+
+        truncate_from_right : bool, default=True
+            If truncating the sequences is necessary, this parameter dictates whether we do so on
+            the left or right.  See :func:`pad_word_sequence` for what this means.
+
+        Returns
+        -------
+        padded_word_sequences : numpy.array
+            An array of shape ``(len(word_sequences), num_sentence_words)``, or
+            ``(len(word_sequences), num_sentence_words, num_word_characters)`` if we have
+            characters.
+        """
+        num_sentence_words = padding_lengths['num_sentence_words']
+        batch_size = len(word_sequences)
+        sequence_lengths = numpy.fromiter((len(sequence) for sequence in word_sequences),
+                                          dtype='int64', count=batch_size)
+        kept_lengths = numpy.minimum(sequence_lengths, num_sentence_words)
+        sequence_offsets = numpy.cumsum(sequence_lengths) - sequence_lengths
+        if truncate_from_right:
+            # We keep the _end_ of each sequence, and put the zeros at the front.
+            source_starts = sequence_offsets + sequence_lengths - kept_lengths
+            target_starts = num_sentence_words - kept_lengths
+        else:
+            source_starts = sequence_offsets
+            target_starts = numpy.zeros(batch_size, dtype='int64')
+        rows, positions = IndexedInstance._ragged_positions(kept_lengths)
+        word_sources = source_starts[rows] + positions
+        word_targets = target_starts[rows] + positions
+
+        if 'num_word_characters' not in padding_lengths:
+            flat_words = numpy.fromiter(itertools.chain.from_iterable(word_sequences),
+                                        dtype='int32', count=int(sequence_lengths.sum()))
+            padded = numpy.zeros((batch_size, num_sentence_words), dtype='int32')
+            padded[rows, word_targets] = flat_words[word_sources]
+            return padded
+
+        # With characters, we do the same thing again one level down: each kept word gets its
+        # first ``num_word_characters`` characters copied in, and zeros after that.
+        num_word_characters = padding_lengths['num_word_characters']
+        all_words = list(itertools.chain.from_iterable(word_sequences))
+        kept_words = [all_words[source] for source in word_sources]
+        word_lengths = numpy.fromiter((len(word) for word in kept_words),
+                                      dtype='int64', count=len(kept_words))
+        flat_characters = numpy.fromiter(itertools.chain.from_iterable(kept_words),
+                                         dtype='int32', count=int(word_lengths.sum()))
+        kept_word_lengths = numpy.minimum(word_lengths, num_word_characters)
+        word_indices, character_positions = IndexedInstance._ragged_positions(kept_word_lengths)
+        character_sources = (numpy.cumsum(word_lengths) - word_lengths)[word_indices] + character_positions
+        padded = numpy.zeros((batch_size, num_sentence_words, num_word_characters), dtype='int32')
+        padded[rows[word_indices], word_targets[word_indices], character_positions] = \
+                flat_characters[character_sources]
+        return padded
+
+    @staticmethod
+    def pad_word_sequence_lists(word_sequence_lists: List[List[List]],
+                                num_sequences: int,
+                                padding_lengths: Dict[str, int],
+                                truncate_from_right: bool=True) -> numpy.array:
+        """
+        Pads a batch of lists of word index sequences (e.g., the answer options of a batch of
+        multiple choice instances) into a single ``int32`` array of shape
+        ``(len(word_sequence_lists), num_sequences, num_sentence_words)``, or with an extra
+        ``num_word_characters`` dimension if we have characters.
+
+        We keep the first ``num_sequences`` sequences of each list, pad all of the kept sequences
+        at once with :func:`pad_word_sequences`, and scatter them into the output; lists with
+        fewer sequences are padded with all-zero sequences, which never get materialized as
+        python lists.  ``padding_lengths`` is not modified.
+        """
+        num_kept = numpy.fromiter((min(len(sequences), num_sequences) for sequences in word_sequence_lists),
+                                  dtype='int64', count=len(word_sequence_lists))
+        kept_sequences = list(itertools.chain.from_iterable(sequences[:num_sequences]
+                                                            for sequences in word_sequence_lists))
+        padded_sequences = IndexedInstance.pad_word_sequences(kept_sequences, padding_lengths, truncate_from_right)
+        padded = numpy.zeros((len(word_sequence_lists), num_sequences) + padded_sequences.shape[1:], dtype='int32')
+        rows, positions = IndexedInstance._ragged_positions(num_kept)
+        padded[rows, positions] = padded_sequences
+        return padded
+
+    @staticmethod
+    def _ragged_positions(lengths: numpy.array) -> Tuple[numpy.array, numpy.array]:
+        """
+        For a ragged structure with the given row ``lengths``, returns two flat arrays with one
+        entry per element: the row the element is in, and its position within that row.  For
+        example, lengths ``[2, 0, 3]`` give rows ``[0, 0, 2, 2, 2]`` and positions ``[0, 1, 0, 1,
+        2]``.
+        """
+        rows = numpy.repeat(numpy.arange(len(lengths)), lengths)
+        row_starts = numpy.cumsum(lengths) - lengths
+        positions = numpy.arange(len(rows)) - numpy.repeat(row_starts, lengths)
+        return rows, positions
+
     @staticmethod
     def pad_sequence_to_length(sequence: List,
                                desired_length: int,
@@ -20,6 +20,10 @@ class SentenceInstance(TextInstance):
     def __str__(self):
         return 'SentenceInstance(' + self.text + ')'
 
+    @overrides
+    def texts(self) -> List[str]:
+        return [self.text]
+
     @overrides
     def words(self) -> Dict[str, List[str]]:
         words = self._words_from_text(self.text)
@@ -92,3 +96,15 @@ class IndexedSentenceInstance(IndexedInstance):
         # The expand dims here is because Keras' sparse categorical cross entropy expects tensors
         # of shape (batch_size, num_words, 1).
         return word_array, numpy.expand_dims(label_array, axis=2)
+
+    @classmethod
+    @overrides
+    def batch_as_training_data(cls,
+                               instances: List['IndexedSentenceInstance'],
+                               padding_lengths: Dict[str, int]):
+        word_array = cls.pad_word_sequences([instance.word_indices for instance in instances],
+                                            padding_lengths)
+        label_padding_lengths = {'num_sentence_words': padding_lengths['num_sentence_words']}
+        label_array = cls.pad_word_sequences([instance.label for instance in instances],
+                                             label_padding_lengths)
+        return word_array, numpy.expand_dims(label_array, axis=2)
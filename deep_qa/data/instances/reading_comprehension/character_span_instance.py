@@ -1,10 +1,11 @@
-from typing import Tuple, List
+from typing import Any, Dict, List, Tuple
 
 import numpy
 from overrides import overrides
 
 from .question_passage_instance import QuestionPassageInstance, IndexedQuestionPassageInstance
 from ...data_indexer import DataIndexer
+from ...tokenizers.tokenizer import Tokenizer
 
 
 class CharacterSpanInstance(QuestionPassageInstance):
@@ -19,8 +20,11 @@ class CharacterSpanInstance(QuestionPassageInstance):
     are going to use in the rest of the code is a span of _tokens_ in the passage, so the mapping
     from character labels to token labels depends on the tokenization we did, and the logic to
     handle this is, unfortunately, a little complicated. The label conversion happens when
-    converting a CharacterSpanInstance to in IndexedInstance (where character indices are generally
-    lost, anyway).
+    converting a CharacterSpanInstance to in IndexedInstance.  We use the character offsets of the
+    passage tokens (see :func:`Tokenizer.tokenize_with_offsets
+    <deep_qa.data.tokenizers.tokenizer.Tokenizer.tokenize_with_offsets>`) for this, and we keep
+    them, in the ``IndexedInstance`` too, so that a predicted token span can be mapped back to a
+    span of characters in the passage with :func:`token_span_to_char_span`.
 
     This class should be used to represent training instances for the SQuAD (Stanford Question
     Answering) and NewsQA datasets, to name a few.
@@ -33,11 +37,21 @@ class CharacterSpanInstance(QuestionPassageInstance):
 
     def __init__(self, question: str, passage: str, label: Tuple[int, int], index: int=None):
         super(CharacterSpanInstance, self).__init__(question, passage, label, index)
+        self.passage_offsets = None  # type: List[Tuple[int, int]]
 
     def __str__(self):
         return ('CharacterSpanInstance(' + self.question_text + ', ' +
                 self.passage_text + ', ' + str(self.label) + ')')
 
+    @overrides
+    def words(self) -> Dict[str, List[str]]:
+        # We include the stop token, so that fitting a vocabulary on these instances adds it.
+        # Otherwise, only ``to_indexed_instance`` would add it, and when indexing in worker
+        # processes, that only changes the workers' copies of the ``DataIndexer``.
+        words = super(CharacterSpanInstance, self).words()
+        words.setdefault('words', []).append(self.stop_token)
+        return words
+
     @overrides
     def _index_label(self, label: Tuple[int, int]) -> List[int]:
         """
@@ -45,9 +59,28 @@ class CharacterSpanInstance(QuestionPassageInstance):
         into an IndexedInstance (handled in superclass).
         """
         if self.label is not None:
-            return self.tokenizer.char_span_to_token_span(self.passage_text, self.label)
+            return self.tokenizer.char_span_to_token_span(self.passage_text,
+                                                          self.label,
+                                                          self.get_passage_offsets())
         return None
 
+    def get_passage_offsets(self) -> List[Tuple[int, int]]:
+        """
+        Returns the ``(start, end)`` character offsets of the passage tokens, tokenizing the
+        passage the first time this is called (unless :func:`to_indexed_instance` already took
+        them from its passage table).
+        """
+        if self.passage_offsets is None:
+            self.passage_offsets = self.tokenizer.tokenize_with_offsets(self.passage_text)[1]
+        return self.passage_offsets
+
+    def token_span_to_char_span(self, span: Tuple[int, int]) -> Tuple[int, int]:
+        """
+        Maps an end-exclusive span of passage tokens (e.g., a predicted span) back to the span of
+        characters in the passage that it covers.
+        """
+        return self.tokenizer.token_span_to_char_span(self.get_passage_offsets(), span)
+
     @classmethod
     @overrides
     def read_from_line(cls, line: str):
@@ -75,18 +108,60 @@ class CharacterSpanInstance(QuestionPassageInstance):
         return cls(question, passage, (span_begin, span_end), index)
 
     @overrides
-    def to_indexed_instance(self, data_indexer: DataIndexer):
-        instance = super(CharacterSpanInstance, self).to_indexed_instance(data_indexer)
-        stop_index = data_indexer.add_word_to_index(self.stop_token)
-        if isinstance(instance.passage_indices[0], list):
-            instance.passage_indices.append([stop_index])
-        else:
-            instance.passage_indices.append(stop_index)
+    def _index_passage_text(self, data_indexer: DataIndexer) -> List[int]:
+        passage_indices = super(CharacterSpanInstance, self)._index_passage_text(data_indexer)
+        # The stop token is in the vocabulary already: fitting the vocabulary adds it (see
+        # ``words``), and so does ``to_indexed_instance``.
+        stop_index = data_indexer.get_word_index(self.stop_token)
+        if isinstance(passage_indices[0], list):
+            return passage_indices + [[stop_index]]
+        return passage_indices + [stop_index]
+
+    @overrides
+    def to_indexed_instance(self, data_indexer: DataIndexer, passage_table: Dict[Any, Any]=None):
+        # We add the stop token first, so the vocabulary size (which the shared passage indices
+        # depend on) doesn't change while we index this instance.
+        data_indexer.add_word_to_index(self.stop_token)
+        if self.passage_offsets is None:
+            self.passage_offsets = self._get_passage_value(
+                    'offsets', lambda: self.tokenizer.tokenize_with_offsets(self.passage_text)[1],
+                    passage_table)
+        instance = super(CharacterSpanInstance, self).to_indexed_instance(data_indexer, passage_table)
+        # We store the offsets as lists, so that a ``ColumnarIndexedDataset`` can keep them in a
+        # compact integer buffer.  Like the passage indices, these are shared between instances
+        # with the same passage.
+        passage_offsets = self._get_passage_value(
+                'offset_lists', lambda: [list(offsets) for offsets in self.get_passage_offsets()],
+                passage_table)
         return IndexedCharacterSpanInstance(instance.question_indices, instance.passage_indices,
-                                            instance.label, instance.index)
+                                            instance.label, instance.index, passage_offsets)
 
 
 class IndexedCharacterSpanInstance(IndexedQuestionPassageInstance):
+    """
+    An indexed ``CharacterSpanInstance``.  In addition to the question and passage indices, this
+    keeps the ``[start, end]`` character offsets of each passage token (not including the stop
+    token), if we have them, so that predicted spans can be mapped back to characters with
+    :func:`token_span_to_char_span`.
+    """
+    def __init__(self,
+                 question_indices: List[int],
+                 passage_indices: List[int],
+                 label: Tuple[int, int],
+                 index: int=None,
+                 passage_offsets: List[List[int]]=None):
+        super(IndexedCharacterSpanInstance, self).__init__(question_indices, passage_indices, label, index)
+        self.passage_offsets = passage_offsets
+
+    def token_span_to_char_span(self, span: Tuple[int, int]) -> Tuple[int, int]:
+        """
+        Maps an end-exclusive span of passage tokens (e.g., a predicted span) back to the span of
+        characters in the original passage that it covers.
+        """
+        if self.passage_offsets is None:
+            raise RuntimeError("This instance doesn't have passage offsets")
+        return Tokenizer.token_span_to_char_span(self.passage_offsets, span)
+
     @overrides
     def as_training_data(self):
         input_arrays, _ = super(IndexedCharacterSpanInstance, self).as_training_data()
@@ -97,3 +172,22 @@ class IndexedCharacterSpanInstance(IndexedQuestionPassageInstance):
             span_begin_label[self.label[0]] = 1
             span_end_label[self.label[1]] = 1
         return input_arrays, (span_begin_label, span_end_label)
+
+    @classmethod
+    @overrides
+    def batch_as_training_data(cls,
+                               instances: List['IndexedCharacterSpanInstance'],
+                               padding_lengths: Dict[str, int]):
+        input_arrays, _ = super(IndexedCharacterSpanInstance, cls).batch_as_training_data(instances,
+                                                                                          padding_lengths)
+        if instances[0].label is None:
+            no_labels = numpy.asarray([None] * len(instances))
+            return input_arrays, [no_labels, numpy.asarray([None] * len(instances))]
+        num_passage_words = padding_lengths['num_passage_words']
+        span_begin_label = numpy.zeros((len(instances), num_passage_words))
+        span_end_label = numpy.zeros((len(instances), num_passage_words))
+        spans = numpy.asarray([instance.label for instance in instances])
+        batch_indices = numpy.arange(len(instances))
+        span_begin_label[batch_indices, spans[:, 0]] = 1
+        span_end_label[batch_indices, spans[:, 1]] = 1
+        return input_arrays, [span_begin_label, span_end_label]
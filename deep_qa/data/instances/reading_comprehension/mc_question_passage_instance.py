@@ -1,4 +1,4 @@
-from typing import Dict, List, Tuple
+from typing import Any, Dict, List, Tuple
 import numpy as np
 
 from overrides import overrides
@@ -27,6 +27,10 @@ class McQuestionPassageInstance(QuestionPassageInstance):
                                                                    '|'.join(self.answer_options),
                                                                    str(self.label)))
 
+    @overrides
+    def texts(self) -> List[str]:
+        return super(McQuestionPassageInstance, self).texts() + list(self.answer_options)
+
     @overrides
     def words(self) -> Dict[str, List[str]]:
         words = super(McQuestionPassageInstance, self).words()
@@ -45,9 +49,9 @@ class McQuestionPassageInstance(QuestionPassageInstance):
         return self.label
 
     @overrides
-    def to_indexed_instance(self, data_indexer: DataIndexer):
+    def to_indexed_instance(self, data_indexer: DataIndexer, passage_table: Dict[Any, Any]=None):
         question_indices = self._index_text(self.question_text, data_indexer)
-        passage_indices = self._index_text(self.passage_text, data_indexer)
+        passage_indices = self._index_passage(data_indexer, passage_table)
         option_indices = [self._index_text(option, data_indexer) for option in
                           self.answer_options]
         return IndexedMcQuestionPassageInstance(question_indices, passage_indices,
@@ -135,22 +139,26 @@ class IndexedMcQuestionPassageInstance(IndexedQuestionPassageInstance):
         as well as the individual words in the questions and passages themselves. We also pad the
         number of answer options, the answer options (in terms of numbers or words in each),
         as well as the individual words in the answer options.
+
+        We build new option lists, so neither the option lists we had before nor
+        ``padding_lengths`` get modified.
         """
         super(IndexedMcQuestionPassageInstance, self).pad(padding_lengths)
 
         # pad the number of options
         num_options = padding_lengths['num_options']
-        while len(self.option_indices) < num_options:
-            self.option_indices.append([])
-        self.option_indices = self.option_indices[:num_options]
+        options = self.option_indices[:num_options]
+        options = options + [[]] * (num_options - len(options))
 
         # pad the number of words in the options, number of characters in each word in option
-        padded_options = []
-        for indices in self.option_indices:
-            padding_lengths['num_sentence_words'] = padding_lengths['num_option_words']
-            padded_options.append(self.pad_word_sequence(indices, padding_lengths))
-        self.option_indices = padded_options
+        option_padding_lengths = self._option_padding_lengths(padding_lengths)
+        self.option_indices = [self.pad_word_sequence(indices, option_padding_lengths) for indices in options]
 
+    @staticmethod
+    def _option_padding_lengths(padding_lengths: Dict[str, int]) -> Dict[str, int]:
+        option_padding_lengths = padding_lengths.copy()
+        option_padding_lengths['num_sentence_words'] = padding_lengths['num_option_words']
+        return option_padding_lengths
 
     @overrides
     def as_training_data(self):
@@ -163,3 +171,23 @@ class IndexedMcQuestionPassageInstance(IndexedQuestionPassageInstance):
             label = np.zeros((len(self.option_indices)))
             label[self.label] = 1
         return (question_array, passage_array, options_array), label
+
+    @classmethod
+    @overrides
+    def batch_as_training_data(cls,
+                               instances: List['IndexedMcQuestionPassageInstance'],
+                               padding_lengths: Dict[str, int]):
+        (question_array, passage_array), _ = super(IndexedMcQuestionPassageInstance,
+                                                   cls).batch_as_training_data(instances, padding_lengths)
+        # We pad all of the options in the batch in one go, straight into a (batch_size,
+        # num_options, num_option_words[, num_word_characters]) array.
+        num_options = padding_lengths['num_options']
+        options_array = cls.pad_word_sequence_lists([instance.option_indices for instance in instances],
+                                                    num_options,
+                                                    cls._option_padding_lengths(padding_lengths))
+        if instances[0].label is None:
+            labels = np.asarray([None] * len(instances))
+        else:
+            labels = np.zeros((len(instances), num_options))
+            labels[np.arange(len(instances)), [instance.label for instance in instances]] = 1
+        return [question_array, passage_array, options_array], labels
@@ -1,4 +1,4 @@
-from typing import Dict, List, Any
+from typing import Any, Callable, Dict, List
 
 import numpy as np
 from overrides import overrides
@@ -12,6 +12,14 @@ class QuestionPassageInstance(TextInstance):
     A QuestionPassageInstance is a base class for datasets that consist primarily of a question
     text and a passage, where the passage contains the answer to the question. This class should
     not be used directly due to the missing ``_index_label`` function, use a subclass instead.
+
+    In datasets like SQuAD, each passage comes with several questions.  When a dataset indexes
+    its instances (see :func:`TextInstance.index_in_batches
+    <deep_qa.data.instances.instance.TextInstance.index_in_batches>`), they share a passage table,
+    keyed by the passage text, so each distinct passage is only indexed once, and all of its
+    instances get the `same` passage indices list.  ``ColumnarIndexedDataset`` notices this, and
+    stores each of these passages only once.  Because the lists are shared, don't modify them in
+    place.
     """
     def __init__(self, question_text: str, passage_text: str, label: Any, index: int=None):
         super(QuestionPassageInstance, self).__init__(label, index)
@@ -23,6 +31,10 @@ class QuestionPassageInstance(TextInstance):
                 ', ' + self.passage_text + ', ' +
                 str(self.label) + ')')
 
+    @overrides
+    def texts(self) -> List[str]:
+        return [self.question_text, self.passage_text]
+
     @overrides
     def words(self) -> Dict[str, List[str]]:
         words = self._words_from_text(self.question_text)
@@ -38,10 +50,48 @@ class QuestionPassageInstance(TextInstance):
         """
         raise NotImplementedError
 
+    def _get_passage_value(self,
+                           name: str,
+                           compute: Callable[[], Any],
+                           passage_table: Dict[Any, Any],
+                           *dependencies) -> Any:
+        """
+        Returns ``compute()``, which computes something (called ``name``) from the passage of this
+        instance, taking it from ``passage_table`` if an earlier instance with the same passage put
+        it there, and putting it there otherwise.  The value is keyed by the passage text and the
+        given ``dependencies``.  If ``passage_table`` is ``None``, we just call ``compute()``.
+        """
+        if passage_table is None:
+            return compute()
+        key = (self.__class__, name, self.passage_text) + dependencies
+        value = passage_table.get(key)
+        if value is None:
+            value = compute()
+            passage_table[key] = value
+        return value
+
+    def _index_passage(self, data_indexer: DataIndexer, passage_table: Dict[Any, Any]=None) -> List[int]:
+        """
+        Returns the indexed passage, which is shared with other instances of the same passage (see
+        the class docstring).  Subclasses that need to change how passages are indexed should
+        override :func:`_index_passage_text`, not this method.
+        """
+        # A word that we add to the vocabulary could have been OOV in the passage, so shared
+        # indices are only good for the same vocabulary size.
+        return self._get_passage_value('indices', lambda: self._index_passage_text(data_indexer),
+                                       passage_table, data_indexer.get_vocab_size())
+
+    def _index_passage_text(self, data_indexer: DataIndexer) -> List[int]:
+        return self._index_text(self.passage_text, data_indexer)
+
     @overrides
-    def to_indexed_instance(self, data_indexer: DataIndexer):
+    def index_with_passage_table(self, data_indexer: DataIndexer, passage_table: Dict[Any, Any]):
+        return self.to_indexed_instance(data_indexer, passage_table)
+
+    @overrides
+    def to_indexed_instance(self, data_indexer: DataIndexer, passage_table: Dict[Any, Any]=None):
         question_indices = self._index_text(self.question_text, data_indexer)
-        passage_indices = self._index_text(self.passage_text, data_indexer)
+        passage_indices = self._index_passage(data_indexer, passage_table)
         label_indices = self._index_label(self.label)
         return IndexedQuestionPassageInstance(question_indices,
                                               passage_indices, label_indices,
@@ -107,3 +157,19 @@ class IndexedQuestionPassageInstance(IndexedInstance):
         question_array = np.asarray(self.question_indices, dtype='int32')
         passage_array = np.asarray(self.passage_indices, dtype='int32')
         return (question_array, passage_array), np.asarray(self.label)
+
+    @classmethod
+    @overrides
+    def batch_as_training_data(cls,
+                               instances: List['IndexedQuestionPassageInstance'],
+                               padding_lengths: Dict[str, int]):
+        padding_lengths_tmp = padding_lengths.copy()
+        padding_lengths_tmp['num_sentence_words'] = padding_lengths_tmp['num_question_words']
+        question_array = cls.pad_word_sequences([instance.question_indices for instance in instances],
+                                                padding_lengths_tmp)
+        padding_lengths_tmp['num_sentence_words'] = padding_lengths_tmp['num_passage_words']
+        passage_array = cls.pad_word_sequences([instance.passage_indices for instance in instances],
+                                               padding_lengths_tmp,
+                                               truncate_from_right=False)
+        labels = np.asarray([np.asarray(instance.label) for instance in instances])
+        return [question_array, passage_array], labels
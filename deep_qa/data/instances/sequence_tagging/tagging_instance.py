@@ -24,6 +24,10 @@ class TaggingInstance(TextInstance):
     def __str__(self):
         return "TaggedSequenceInstance(" + self.text + ", " + str(self.label) + ")"
 
+    @overrides
+    def texts(self) -> List[str]:
+        return [self.text]
+
     @overrides
     def words(self) -> Dict[str, List[str]]:
         words = self._words_from_text(self.text)
@@ -81,3 +85,23 @@ class IndexedTaggingInstance(IndexedInstance):
         text_array = numpy.asarray(self.text_indices, dtype='int32')
         label_array = numpy.asarray(self.label, dtype='int32')
         return text_array, label_array
+
+    @classmethod
+    @overrides
+    def batch_as_training_data(cls,
+                               instances: List['IndexedTaggingInstance'],
+                               padding_lengths: Dict[str, int]):
+        text_array = cls.pad_word_sequences([instance.text_indices for instance in instances],
+                                            padding_lengths,
+                                            truncate_from_right=False)
+        # Tags can be anything array-like (ints, one-hot vectors, ...), and are padded with the
+        # first tag of each instance, so we handle them one instance at a time.
+        num_words = padding_lengths['num_sentence_words']
+        tag_shape = numpy.asarray(instances[0].label[0]).shape
+        label_array = numpy.zeros((len(instances), num_words) + tag_shape, dtype='int32')
+        for i, instance in enumerate(instances):
+            tags = instance.label[:num_words]
+            label_array[i, :len(tags)] = tags
+            if len(tags) < num_words:
+                label_array[i, len(tags):] = instance.label[0]
+        return text_array, label_array
@@ -22,6 +22,10 @@ class TextClassificationInstance(TextInstance):
     def __str__(self):
         return 'TextClassificationInstance(' + self.text + ', ' + str(self.label) + ')'
 
+    @overrides
+    def texts(self) -> List[str]:
+        return [self.text]
+
     @overrides
     def words(self) -> Dict[str, List[str]]:
         return self._words_from_text(self.text)
@@ -88,12 +92,26 @@ class IndexedTextClassificationInstance(IndexedInstance):
     @overrides
     def as_training_data(self):
         word_array = numpy.asarray(self.word_indices, dtype='int32')
-        if self.label is True:
-            label = numpy.zeros((2))
-            label[1] = 1
-        elif self.label is False:
-            label = numpy.zeros((2))
-            label[0] = 1
+        return word_array, self._label_to_array(self.label)
+
+    @classmethod
+    @overrides
+    def batch_as_training_data(cls,
+                               instances: List['IndexedTextClassificationInstance'],
+                               padding_lengths: Dict[str, int]):
+        word_array = cls.pad_word_sequences([instance.word_indices for instance in instances],
+                                            padding_lengths)
+        labels = numpy.asarray([cls._label_to_array(instance.label) for instance in instances])
+        return word_array, labels
+
+    @staticmethod
+    def _label_to_array(label: bool):
+        if label is True:
+            label_array = numpy.zeros((2))
+            label_array[1] = 1
+        elif label is False:
+            label_array = numpy.zeros((2))
+            label_array[0] = 1
         else:
-            label = None
-        return word_array, label
+            label_array = None
+        return label_array
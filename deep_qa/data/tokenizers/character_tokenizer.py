@@ -34,6 +34,10 @@ class CharacterTokenizer(Tokenizer):
     def tokenize(self, text: str) -> List[str]:
         return list(text)
 
+    @overrides
+    def tokenize_with_offsets(self, text: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+        return list(text), [(index, index + 1) for index in range(len(text))]
+
     @overrides
     def get_words_for_indexer(self, text: str) -> Dict[str, List[str]]:
         return {'words': self.tokenize(text)}
@@ -42,7 +46,7 @@ class CharacterTokenizer(Tokenizer):
     def index_text(self,
                    text: str,
                    data_indexer: DataIndexer) -> List:
-        return [data_indexer.get_word_index(char) for char in self.tokenize(text)]
+        return data_indexer.get_word_indices(self.tokenize(text)).tolist()
 
     @overrides
     def embed_input(self,
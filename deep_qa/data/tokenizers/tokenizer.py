@@ -1,6 +1,9 @@
 from typing import Callable, Dict, List, Tuple
+import bisect
 
 from keras.layers import Layer
+import numpy
+from .word_splitter import WordSplitter
 from ..data_indexer import DataIndexer
 from ...common.params import Params
 
@@ -34,6 +37,27 @@ class Tokenizer:
         """
         raise NotImplementedError
 
+    def tokenize_with_offsets(self, text: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+        """
+        Like :func:`tokenize`, but also returns the character span of each token in ``text``, as a
+        ``(start, end)`` tuple with an exclusive ``end``.  The default implementation finds the
+        tokens in the text with :func:`WordSplitter.find_offsets
+        <deep_qa.data.tokenizers.word_splitter.WordSplitter.find_offsets>`; subclasses that know
+        where their tokens came from should override this.
+        """
+        tokens = self.tokenize(text)
+        return tokens, WordSplitter.find_offsets(text, tokens)
+
+    def cache_tokens(self, texts: List[str]):
+        """
+        Tokenizes all of the given texts at once and caches the result, so that later calls to
+        :func:`tokenize`, :func:`get_words_for_indexer` and :func:`index_text` on these texts don't
+        have to do it again.  Some word splitters are much faster on a batch of texts than on one
+        text at a time.  The default implementation does nothing; that's always correct, because
+        it's just an optimization.
+        """
+        pass
+
     def get_words_for_indexer(self, text: str) -> Dict[str, List[str]]:
         """
         The DataIndexer needs to assign indices to whatever strings we see in the training data
@@ -56,6 +80,25 @@ class Tokenizer:
         """
         raise NotImplementedError
 
+    def mask_words(self, inputs, word_mask: numpy.array):
+        """
+        Takes model inputs, as returned by ``IndexedInstance.as_training_data`` (an array or a
+        tuple of arrays, all of them padded outputs of :func:`index_text`), and returns copies
+        where every word whose index is ``True`` in ``word_mask`` (see
+        :func:`DataIndexer.get_word_mask <deep_qa.data.data_indexer.DataIndexer.get_word_mask>`)
+        is replaced with padding.  This is vectorized, so it's cheap to do on every batch.
+        """
+        if isinstance(inputs, (list, tuple)):
+            return tuple(self._mask_words_in_array(array, word_mask) for array in inputs)
+        return self._mask_words_in_array(inputs, word_mask)
+
+    def _mask_words_in_array(self, indices: numpy.array, word_mask: numpy.array) -> numpy.array:
+        """
+        Does the work of :func:`mask_words` on a single array, which can have any number of
+        leading dimensions.
+        """
+        raise NotImplementedError
+
     def embed_input(self,
                     input_layer: Layer,
                     embed_function: Callable[[Layer, str, str], Layer],
@@ -108,53 +151,47 @@ class Tokenizer:
     def char_span_to_token_span(self,
                                 sentence: str,
                                 span: Tuple[int, int],
-                                slack: int=3) -> Tuple[int, int]:
+                                offsets: List[Tuple[int, int]]=None) -> Tuple[int, int]:
         """
         Converts a character span from a sentence into the corresponding token span in the
-        tokenized version of the sentence.  If you pass in a character span that does not
-        correspond to complete tokens in the tokenized version, we'll do our best, but the behavior
-        is officially undefined.
+        tokenized version of the sentence.  If the character span starts or ends in the middle of
+        a token, the token span includes that whole token.
 
-        The basic outline of this method is to find the token that starts the same number of
-        characters into the sentence as the given character span.  We try to handle a bit of error
-        in the tokenization by checking `slack` tokens in either direction from that initial
-        estimate.
+        We do this with two binary searches over the character offsets of the tokens, from
+        :func:`tokenize_with_offsets`.  If you already have those ``offsets`` (e.g., because you're
+        converting several spans in the same passage), you can pass them in, and we won't
+        tokenize the sentence again.
 
         The returned ``(begin, end)`` indices are `inclusive` for ``begin``, and `exclusive` for
         ``end``.  So, for example, ``(2, 2)`` is an empty span, ``(2, 3)`` is the one-word span
         beginning at token index 2, and so on.
         """
-        # First we'll tokenize the span and the sentence, so we can count tokens and check for
-        # matches.
-        span_chars = sentence[span[0]:span[1]]
-        tokenized_span = self.tokenize(span_chars)
-        tokenized_sentence = self.tokenize(sentence)
-        # Then we'll find what we think is the first token in the span
-        chars_seen = 0
-        index = 0
-        while index < len(tokenized_sentence) and chars_seen < span[0]:
-            chars_seen += len(tokenized_sentence[index]) + 1
-            index += 1
-        # index is now the span start index.  Is it a match?
-        if self._spans_match(tokenized_sentence, tokenized_span, index):
-            return (index, index + len(tokenized_span))
-        for i in range(1, slack + 1):
-            if self._spans_match(tokenized_sentence, tokenized_span, index + i):
-                return (index + i, index + i+ len(tokenized_span))
-            if self._spans_match(tokenized_sentence, tokenized_span, index - i):
-                return (index - i, index - i + len(tokenized_span))
-        # No match; we'll just return our best guess.
-        return (index, index + len(tokenized_span))
+        if offsets is None:
+            _, offsets = self.tokenize_with_offsets(sentence)
+        # The offsets are sorted by start (and so by end, too), so the tokens that start at or
+        # before span[0] come first; the last of those contains span[0] if it ends after it, and
+        # otherwise the span begins with the next token.
+        begin = bisect.bisect_right(offsets, (span[0], float('inf')))
+        if begin > 0 and offsets[begin - 1][1] > span[0]:
+            begin -= 1
+        if span[1] <= span[0]:
+            return (begin, begin)
+        # The span ends after the last token that starts before span[1].
+        end = bisect.bisect_left(offsets, (span[1],))
+        return (begin, max(begin, end))
 
     @staticmethod
-    def _spans_match(sentence_tokens: List[str], span_tokens: List[str], index: int) -> bool:
-        if index < 0 or index >= len(sentence_tokens):
-            return False
-        if sentence_tokens[index] == span_tokens[0]:
-            span_index = 1
-            while (span_index < len(span_tokens) and
-                   sentence_tokens[index + span_index] == span_tokens[span_index]):
-                span_index += 1
-            if span_index == len(span_tokens):
-                return True
-        return False
+    def token_span_to_char_span(offsets: List[Tuple[int, int]], span: Tuple[int, int]) -> Tuple[int, int]:
+        """
+        The inverse of :func:`char_span_to_token_span`: given the token ``offsets`` from
+        :func:`tokenize_with_offsets` and an end-exclusive token span (e.g., one predicted by a
+        model), returns the end-exclusive character span that the tokens cover.  An empty token
+        span gives an empty character span where the token span begins.
+        """
+        if span[1] <= span[0]:
+            if span[0] < len(offsets):
+                position = offsets[span[0]][0]
+            else:
+                position = offsets[-1][1] if offsets else 0
+            return (position, position)
+        return (offsets[span[0]][0], offsets[span[1] - 1][1])
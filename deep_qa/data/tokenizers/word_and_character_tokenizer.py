@@ -3,6 +3,7 @@ from typing import Any, Callable, Dict, List, Tuple
 from overrides import overrides
 from keras import backend as K
 from keras.layers import Concatenate, Layer
+import numpy
 
 from .tokenizer import Tokenizer
 from .word_processor import WordProcessor
@@ -39,6 +40,14 @@ class WordAndCharacterTokenizer(Tokenizer):
     def tokenize(self, text: str) -> List[str]:
         return self.word_processor.get_tokens(text)
 
+    @overrides
+    def tokenize_with_offsets(self, text: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+        return self.word_processor.get_tokens_with_offsets(text)
+
+    @overrides
+    def cache_tokens(self, texts: List[str]):
+        self.word_processor.cache_tokens(texts)
+
     @overrides
     def get_words_for_indexer(self, text: str) -> Dict[str, List[str]]:
         words = self.tokenize(text)
@@ -48,14 +57,18 @@ class WordAndCharacterTokenizer(Tokenizer):
     @overrides
     def index_text(self, text: str, data_indexer: DataIndexer) -> List:
         words = self.tokenize(text)
-        arrays = []
-        for word in words:
-            word_index = data_indexer.get_word_index(word, namespace='words')
-            # TODO(matt): I'd be nice to keep the capitalization of the word in the character
-            # representation.  Doing that would require pretty fancy logic here, though.
-            char_indices = [data_indexer.get_word_index(char, namespace='characters') for char in word]
-            arrays.append([word_index] + char_indices)
-        return arrays
+        word_indices = data_indexer.get_word_indices(words, namespace='words').tolist()
+        # TODO(matt): I'd be nice to keep the capitalization of the word in the character
+        # representation.  Doing that would require pretty fancy logic here, though.
+        char_indices = data_indexer.get_character_indices(words, namespace='characters')
+        return [[word_index] + list(word_char_indices)
+                for word_index, word_char_indices in zip(word_indices, char_indices)]
+
+    @overrides
+    def _mask_words_in_array(self, indices: numpy.array, word_mask: numpy.array) -> numpy.array:
+        # The word index is the first entry for each word; we mask its characters too.
+        masked_words = word_mask[indices[..., 0]]
+        return numpy.where(numpy.expand_dims(masked_words, -1), 0, indices)
 
     @overrides
     def embed_input(self,
@@ -26,40 +26,48 @@ class PassThroughWordFilter(WordFilter):
         return words
 
 
+# TODO(matt): Allow this to be specified somehow, either with a file, or with parameters, or
+# something.  Note that this only has single tokens in it; word filtering happens on individual
+# tokens, so multi-word stopwords (like "how many") could never match anything.
+STOPWORDS = frozenset(['I', 'a', 'aboard', 'about', 'above', 'accordance', 'according', 'across',
+                       'after', 'against', 'along', 'alongside', 'also', 'am', 'amid', 'amidst',
+                       'an', 'and', 'apart', 'are', 'around', 'as', 'aside', 'astride', 'at',
+                       'atop', 'back', 'be', 'because', 'before', 'behind', 'below', 'beneath',
+                       'beside', 'besides', 'between', 'beyond', 'but', 'by', 'concerning', 'do',
+                       'down', 'due', 'during', 'either', 'except', 'exclusive', 'false', 'for',
+                       'from', 'happen', 'he', 'her', 'hers', 'herself', 'him', 'himself', 'his',
+                       'how', 'i', 'if', 'in', 'including', 'inside', 'instead', 'into',
+                       'irrespective', 'is', 'it', 'its', 'itself', 'less', 'me', 'mine', 'minus',
+                       'my', 'myself', 'neither', 'next', 'not', 'occur', 'of', 'off', 'on',
+                       'onto', 'opposite', 'or', 'our', 'ours', 'ourselves', 'out', 'outside',
+                       'over', 'owing', 'per', 'prepatory', 'previous', 'prior', 'pursuant',
+                       'regarding', 's', 'sans', 'she', 'subsequent', 'such', 'than', 'thanks',
+                       'that', 'the', 'their', 'theirs', 'them', 'themselves', 'then', 'these',
+                       'they', 'this', 'those', 'through', 'throughout', 'thru', 'till', 'to',
+                       'together', 'top', 'toward', 'towards', 'true', 'under', 'underneath',
+                       'unlike', 'until', 'up', 'upon', 'us', 'using', 'versus', 'via', 'was', 'we',
+                       'were', 'what', 'when', 'where', 'which', 'who', 'why', 'will', 'with',
+                       'within', 'without', 'you', 'your', 'yours', 'yourself', 'yourselves', ",",
+                       '.', ':', '!', ';', "'", '"', '&', '$', '#', '@', '(', ')', '?'])
+
+
 class StopwordFilter(WordFilter):
     """
-    Uses a list of stopwords to filter.
+    Uses a list of stopwords (``STOPWORDS``) to filter.
+
+    This removes the stopwords from the text before it gets indexed, so indexed data (e.g., in an
+    :class:`~deep_qa.data.IndexedDatasetCache`) is specific to this setting.  If you instead
+    want to keep the stopwords in the indexed data, and mask them out of model inputs when
+    creating batches, see the ``mask_stopwords`` parameter to
+    :class:`~deep_qa.training.TextTrainer`.
     """
     def __init__(self):
-        # TODO(matt): Allow this to be specified somehow, either with a file, or with parameters,
-        # or something.
-        self.stopwords = set(['I', 'a', 'aboard', 'about', 'above', 'accordance', 'according',
-                              'across', 'after', 'against', 'along', 'alongside', 'also', 'am',
-                              'amid', 'amidst', 'an', 'and', 'apart', 'are', 'around', 'as',
-                              'aside', 'astride', 'at', 'atop', 'back', 'be', 'because', 'before',
-                              'behind', 'below', 'beneath', 'beside', 'besides', 'between',
-                              'beyond', 'but', 'by', 'concerning', 'do', 'down', 'due', 'during',
-                              'either', 'except', 'exclusive', 'false', 'for', 'from', 'happen',
-                              'he', 'her', 'hers', 'herself', 'him', 'himself', 'his', 'how',
-                              'how many', 'how much', 'i', 'if', 'in', 'including', 'inside',
-                              'instead', 'into', 'irrespective', 'is', 'it', 'its', 'itself',
-                              'less', 'me', 'mine', 'minus', 'my', 'myself', 'neither', 'next',
-                              'not', 'occur', 'of', 'off', 'on', 'onto', 'opposite', 'or', 'our',
-                              'ours', 'ourselves', 'out', 'out of', 'outside', 'over', 'owing',
-                              'per', 'prepatory', 'previous', 'prior', 'pursuant', 'regarding',
-                              's', 'sans', 'she', 'subsequent', 'such', 'than', 'thanks', 'that',
-                              'the', 'their', 'theirs', 'them', 'themselves', 'then', 'these',
-                              'they', 'this', 'those', 'through', 'throughout', 'thru', 'till',
-                              'to', 'together', 'top', 'toward', 'towards', 'true', 'under',
-                              'underneath', 'unlike', 'until', 'up', 'upon', 'us', 'using',
-                              'versus', 'via', 'was', 'we', 'were', 'what', 'when', 'where',
-                              'which', 'who', 'why', 'will', 'with', 'within', 'without', 'you',
-                              'your', 'yours', 'yourself', 'yourselves', ",", '.', ':', '!', ';',
-                              "'", '"', '&', '$', '#', '@', '(', ')', '?'])
+        self.stopwords = STOPWORDS
 
     @overrides
     def filter_words(self, words: List[str]) -> List[str]:
-        return [word for word in words if word not in self.stopwords]
+        stopwords = self.stopwords
+        return [word for word in words if word not in stopwords]
 
 
 word_filters = OrderedDict()  # pylint: disable=invalid-name
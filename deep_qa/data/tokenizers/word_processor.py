@@ -1,4 +1,5 @@
-from typing import List
+from collections import OrderedDict
+from typing import List, Tuple
 
 from .word_splitter import word_splitters
 from .word_stemmer import word_stemmers
@@ -24,6 +25,18 @@ class WordProcessor:
     word_stemmer: str, default="pass_through"
         The name of the ``WordStemmer`` to use (see the options at the bottom of
         ``word_stemmer.py``).
+
+    token_cache_size: int, default=10000
+        We keep the tokens (and their character offsets) of this many recently processed strings,
+        keyed by the string itself, so that text we see more than once only gets split, filtered
+        and stemmed the first time.  The
+        same text gets tokenized several times during preprocessing: once to fit the vocabulary,
+        and once to index it; in reading comprehension data, the same passage also shows up for
+        each of its questions.  The default is enough to cover repeats within and between nearby
+        instances, and stays bounded when streaming a large dataset.  If you set this to ``None``,
+        the cache is unbounded, so that fitting the vocabulary and indexing an in-memory dataset
+        share all of their tokenization, at the cost of keeping the tokens of the whole dataset in
+        memory.  ``0`` turns the cache off.
     """
     def __init__(self, params: Params):
         word_splitter_choice = params.pop_choice('word_splitter', list(word_splitters.keys()),
@@ -35,16 +48,114 @@ class WordProcessor:
         word_stemmer_choice = params.pop_choice('word_stemmer', list(word_stemmers.keys()),
                                                 default_to_first_choice=True)
         self.word_stemmer = word_stemmers[word_stemmer_choice]()
+        self.token_cache_size = params.pop('token_cache_size', 10000)
+        self._token_cache = OrderedDict()
         params.assert_empty("WordProcessor")
 
+    def __getstate__(self):
+        # There's no need to send the cache along when we're pickled, e.g., to a worker process.
+        state = self.__dict__.copy()
+        state['_token_cache'] = OrderedDict()
+        return state
+
     def get_tokens(self, sentence: str) -> List[str]:
         """
         Does whatever processing is required to convert a string of text into a sequence of tokens.
 
         At a minimum, this uses a ``WordSplitter`` to split words into text.  It may also do
         stemming or stopword removal, depending on the parameters given to the constructor.
+
+        The result is cached (see the ``token_cache_size`` parameter); you get a new list each
+        time, so it's safe to modify it.
+        """
+        if self.token_cache_size == 0 or not isinstance(sentence, str):
+            # Pre-split text (see ``NoOpWordSplitter``) isn't hashable, so we can't cache it.
+            return self._filter_and_stem(self.word_splitter.split_words(sentence))
+        return list(self._get_cached(sentence)[0])
+
+    def get_tokens_with_offsets(self, sentence: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+        """
+        Like :func:`get_tokens`, but also returns the ``(start, end)`` character span of each token
+        in ``sentence`` (see :func:`WordSplitter.split_words_with_offsets`).  A stemmed token keeps
+        the span of the word it came from.  The token cache keeps the offsets along with the
+        tokens, so a sentence only gets split once, whichever of these methods you call.
+        """
+        if self.token_cache_size == 0 or not isinstance(sentence, str):
+            return self._process_with_offsets(sentence)
+        tokens, offsets = self._get_cached(sentence)
+        return list(tokens), list(offsets)
+
+    def cache_tokens(self, sentences: List[str]):
+        """
+        Processes all of the given sentences that aren't already in the token cache, splitting
+        them into words together with :func:`WordSplitter.split_words_batch`, which some
+        ``WordSplitters`` can do much faster than one sentence at a time, and puts the results in
+        the cache.  As ``split_words_batch`` only gives us the words, we find their offsets with
+        :func:`WordSplitter.find_offsets`.  If the cache is bounded and you give more new
+        sentences than fit in it, only the last ones get cached.
         """
-        words = self.word_splitter.split_words(sentence)
+        if self.token_cache_size == 0:
+            return
+        # An OrderedDict, so we only process repeated sentences once.
+        new_sentences = OrderedDict()
+        for sentence in sentences:
+            if not isinstance(sentence, str):
+                continue
+            if sentence in self._token_cache:
+                # This will be used again soon, so it shouldn't get evicted before the new ones.
+                self._token_cache.move_to_end(sentence)
+            else:
+                new_sentences[sentence] = True
+        new_sentences = list(new_sentences)
+        if self.token_cache_size is not None:
+            new_sentences = new_sentences[-self.token_cache_size:]
+        if not new_sentences:
+            return
+        for sentence, words in zip(new_sentences, self.word_splitter.split_words_batch(new_sentences)):
+            offsets = self.word_splitter.find_offsets(sentence, words)
+            tokens, offsets = self._filter_and_stem_with_offsets(words, offsets)
+            self._add_to_cache(sentence, (tuple(tokens), tuple(offsets)))
+
+    def _get_cached(self, sentence: str) -> Tuple[Tuple[str, ...], Tuple[Tuple[int, int], ...]]:
+        """
+        Returns the cached tokens and offsets of ``sentence``, processing it first if it isn't in
+        the cache.
+        """
+        entry = self._token_cache.get(sentence)
+        if entry is not None:
+            self._token_cache.move_to_end(sentence)
+            return entry
+        tokens, offsets = self._process_with_offsets(sentence)
+        entry = (tuple(tokens), tuple(offsets))
+        self._add_to_cache(sentence, entry)
+        return entry
+
+    def _add_to_cache(self, sentence: str, entry: Tuple[Tuple[str, ...], Tuple[Tuple[int, int], ...]]):
+        self._token_cache[sentence] = entry
+        if self.token_cache_size is not None and len(self._token_cache) > self.token_cache_size:
+            self._token_cache.popitem(last=False)
+
+    def _process_with_offsets(self, sentence: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+        words, offsets = self.word_splitter.split_words_with_offsets(sentence)
+        return self._filter_and_stem_with_offsets(words, offsets)
+
+    def _filter_and_stem(self, words: List[str]) -> List[str]:
         filtered_words = self.word_filter.filter_words(words)
         stemmed_words = [self.word_stemmer.stem_word(word) for word in filtered_words]
         return stemmed_words
+
+    def _filter_and_stem_with_offsets(self,
+                                      words: List[str],
+                                      offsets: List[Tuple[int, int]]) -> Tuple[List[str], List[Tuple[int, int]]]:
+        filtered_words = self.word_filter.filter_words(words)
+        if len(filtered_words) != len(words):
+            # Filtering only removes words, so we can match up the words that are left with their
+            # offsets in one pass.
+            kept_offsets = []
+            filtered_index = 0
+            for word, word_offsets in zip(words, offsets):
+                if filtered_index < len(filtered_words) and word == filtered_words[filtered_index]:
+                    kept_offsets.append(word_offsets)
+                    filtered_index += 1
+            offsets = kept_offsets
+        return [self.word_stemmer.stem_word(word) for word in filtered_words], offsets
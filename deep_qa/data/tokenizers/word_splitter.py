@@ -1,5 +1,6 @@
 from collections import OrderedDict
-from typing import List
+from typing import List, Tuple
+import re
 
 from overrides import overrides
 
@@ -14,6 +15,66 @@ class WordSplitter:
     def split_words(self, sentence: str) -> List[str]:
         raise NotImplementedError
 
+    def split_words_batch(self, sentences: List[str]) -> List[List[str]]:
+        """
+        Splits each of the given sentences into words.  By default this just calls
+        :func:`split_words` on each sentence, but subclasses that can process a batch of sentences
+        more efficiently than that should override it.
+        """
+        return [self.split_words(sentence) for sentence in sentences]
+
+    def split_words_with_offsets(self, sentence: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+        """
+        Splits a sentence into words, like :func:`split_words`, and also returns the character
+        span of each word in ``sentence``, as a ``(start, end)`` tuple with an exclusive ``end``.
+        By default we find the spans with :func:`find_offsets`.  Subclasses whose underlying
+        tokenizer already knows where its tokens came from should override this.
+        """
+        words = self.split_words(sentence)
+        return words, self.find_offsets(sentence, words)
+
+    @staticmethod
+    def find_offsets(sentence: str, words: List[str]) -> List[Tuple[int, int]]:
+        """
+        Finds the character span of each of the given words in ``sentence``, assuming that the
+        words occur in order, and (ignoring case) exactly as they appear in the sentence.  We look
+        for each word starting where the previous one ended, so this is linear in the length of
+        the sentence.  If a word isn't in the sentence at all (some splitters normalize
+        punctuation, for instance), we give it an empty span where the previous word ended.
+
+        Lower-casing can change the length of a string (``"İ".lower()`` has two characters), so
+        when it does we search the lower-cased sentence, and map the spans we find back to the
+        original sentence, character by character.
+        """
+        lowered = sentence.lower()
+        if len(lowered) == len(sentence):
+            original_positions = None
+        else:
+            # original_positions[i] is the character of ``sentence`` that lowered[i] came from.
+            original_positions = []
+            for i, character in enumerate(sentence):
+                original_positions.extend([i] * len(character.lower()))
+            original_positions.append(len(sentence))
+        offsets = []
+        position = 0
+        for word in words:
+            start = lowered.find(word, position)
+            if start < 0:
+                offsets.append((position, position))
+            else:
+                position = start + len(word)
+                offsets.append((start, position))
+        if original_positions is not None:
+            original_offsets = []
+            for start, end in offsets:
+                if start == end:
+                    original_offsets.append((original_positions[start], original_positions[start]))
+                else:
+                    # The span ends just after the character that its last character came from.
+                    original_offsets.append((original_positions[start], original_positions[end - 1] + 1))
+            offsets = original_offsets
+        return offsets
+
 
 class SimpleWordSplitter(WordSplitter):
     """
@@ -76,6 +137,63 @@ class SimpleWordSplitter(WordSplitter):
         return token and token not in self.special_cases
 
 
+class FastSimpleWordSplitter(SimpleWordSplitter):
+    """
+    Gives exactly the same tokens as :class:`SimpleWordSplitter`, but is several times faster,
+    because it does its splitting with ``str`` methods and a precompiled regular expression,
+    instead of peeling characters off of each token one at a time in python.  You can use it as a
+    drop-in replacement for ``SimpleWordSplitter``.
+    """
+    def __init__(self):
+        super(FastSimpleWordSplitter, self).__init__()
+        self._beginning_characters = ''.join(self.beginning_punctuation)
+        self._ending_characters = ''.join(self.ending_punctuation)
+        self._special_case_lengths = sorted(set(len(case) for case in self.special_cases), reverse=True)
+        self._contraction_suffixes = tuple(self.contractions)
+        contraction_pattern = '|'.join(re.escape(contraction) for contraction in self.contractions)
+        self._contraction_regex = re.compile(contraction_pattern)
+        self._contraction_tail_regex = re.compile('(?:%s)+$' % contraction_pattern)
+
+    @overrides
+    def split_words(self, sentence: str) -> List[str]:
+        """
+        The outline here is the same as in :func:`SimpleWordSplitter.split_words`.  We can strip
+        all beginning punctuation at once, because no special case starts with punctuation.  When
+        stripping ending punctuation, we have to stop at the longest prefix of the token that's a
+        special case, if there is one.  None of the contractions is a suffix (or a prefix) of
+        another, so the contractions at the end of a token are the longest suffix that is made
+        entirely of contractions, and we can find them with one regular expression search.
+        """
+        tokens = []
+        for field in sentence.lower().split():
+            stripped = field.lstrip(self._beginning_characters)
+            if len(stripped) < len(field):
+                tokens.extend(field[:len(field) - len(stripped)])
+                field = stripped
+            if not field:
+                continue
+            add_at_end = None
+            stripped = field.rstrip(self._ending_characters)
+            if len(stripped) < len(field):
+                end = len(stripped)
+                for length in self._special_case_lengths:
+                    if end <= length <= len(field) and field[:length] in self.special_cases:
+                        end = length
+                        break
+                add_at_end = list(field[end:])
+                field = field[:end]
+            if field.endswith(self._contraction_suffixes):
+                tail = self._contraction_tail_regex.search(field)
+                contractions = self._contraction_regex.findall(tail.group())
+                add_at_end = contractions + add_at_end if add_at_end else contractions
+                field = field[:tail.start()]
+            if field:
+                tokens.append(field)
+            if add_at_end:
+                tokens.extend(add_at_end)
+        return tokens
+
+
 class NltkWordSplitter(WordSplitter):
     """
     A tokenizer that uses nltk's word_tokenize method.
@@ -96,17 +214,38 @@ class NltkWordSplitter(WordSplitter):
 
 class SpacyWordSplitter(WordSplitter):
     """
-    A tokenizer that uses spaCy's Tokenizer, which is much faster than the others.
+    A tokenizer that uses spaCy's Tokenizer, which is much faster than the others, especially when
+    you give it a batch of sentences with :func:`split_words_batch`.
+
+    We only need spaCy's tokenizer, so we don't load the tagger, parser or entity recognizer
+    models.
     """
-    def __init__(self):
+    def __init__(self, batch_size: int=1000):
         # Import is here it's slow, and can be unnecessary.
         import spacy
-        self.en_nlp = spacy.load('en')
+        try:
+            # The tokenizer rules are part of the language, so this needs no model at all.
+            self.en_nlp = spacy.blank('en')
+        except AttributeError:
+            # Older versions of spaCy don't have ``blank``.
+            self.en_nlp = spacy.load('en', tagger=False, parser=False, entity=False)
+        self.batch_size = batch_size
 
     @overrides
     def split_words(self, sentence: str) -> List[str]:
         return [str(token.lower_) for token in self.en_nlp.tokenizer(sentence)]
 
+    @overrides
+    def split_words_batch(self, sentences: List[str]) -> List[List[str]]:
+        return [[str(token.lower_) for token in tokens]
+                for tokens in self.en_nlp.tokenizer.pipe(sentences, batch_size=self.batch_size)]
+
+    @overrides
+    def split_words_with_offsets(self, sentence: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+        tokens = self.en_nlp.tokenizer(sentence)
+        words = [str(token.lower_) for token in tokens]
+        return words, [(token.idx, token.idx + len(token.text)) for token in tokens]
+
 
 class NoOpWordSplitter(WordSplitter):
     """
@@ -125,9 +264,24 @@ class NoOpWordSplitter(WordSplitter):
         assert isinstance(sentence, list), "This splitter is only meant to be used for pre-split text"
         return sentence
 
+    @overrides
+    def split_words_with_offsets(self, sentence: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+        """
+        There is no original text here, so we give the offsets of the words in the text you'd get
+        by joining them with single spaces.
+        """
+        words = self.split_words(sentence)
+        offsets = []
+        position = 0
+        for word in words:
+            offsets.append((position, position + len(word)))
+            position += len(word) + 1
+        return words, offsets
+
 
 word_splitters = OrderedDict()  # pylint: disable=invalid-name
 word_splitters['simple'] = SimpleWordSplitter
+word_splitters['simple_fast'] = FastSimpleWordSplitter
 word_splitters['nltk'] = NltkWordSplitter
 word_splitters['spacy'] = SpacyWordSplitter
 word_splitters['no_op'] = NoOpWordSplitter
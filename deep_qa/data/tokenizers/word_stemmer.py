@@ -1,4 +1,5 @@
 from collections import OrderedDict
+from typing import Dict
 
 from nltk.stem import PorterStemmer as NltkPorterStemmer
 from overrides import overrides
@@ -31,13 +32,50 @@ class PassThroughWordStemmer(WordStemmer):
 class PorterStemmer(WordStemmer):
     """
     Uses NLTK's PorterStemmer to stem words.
+
+    NLTK's stemmer is pure python, and slow, but word frequencies are very skewed, so we remember
+    the stems of the first ``cache_size`` distinct words we see, which covers nearly all of the
+    tokens in a typical corpus.  We stop adding words once the cache is full, instead of evicting
+    old ones, because the words we see first are the most likely to be frequent, and because it
+    keeps a cache hit down to a single dictionary lookup.
     """
-    def __init__(self):
+    def __init__(self, cache_size: int=100000):
         self.stemmer = NltkPorterStemmer()
+        self.cache_size = cache_size
+        self._cache = {}
+        self._hits = 0
+        self._misses = 0
+
+    def __getstate__(self):
+        # There's no need to send the cache along when we're pickled, e.g., to a worker process.
+        state = self.__dict__.copy()
+        state['_cache'] = {}
+        return state
 
     @overrides
     def stem_word(self, word: str) -> str:
-        return self.stemmer.stem(word)
+        stem = self._cache.get(word)
+        if stem is not None:
+            self._hits += 1
+            return stem
+        self._misses += 1
+        stem = self.stemmer.stem(word)
+        if len(self._cache) < self.cache_size:
+            self._cache[word] = stem
+        return stem
+
+    def cache_statistics(self) -> Dict[str, float]:
+        """
+        Returns the number of cache hits and misses so far, the hit rate, and the number of cached
+        words, e.g. for logging.
+        """
+        lookups = self._hits + self._misses
+        return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'cached_words': len(self._cache),
+                }
 
 
 word_stemmers = OrderedDict()  # pylint: disable=invalid-name
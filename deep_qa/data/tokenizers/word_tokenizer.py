@@ -2,6 +2,7 @@ from typing import Callable, Dict, List, Tuple
 
 from overrides import overrides
 from keras.layers import Layer
+import numpy
 
 from .tokenizer import Tokenizer
 from .word_processor import WordProcessor
@@ -35,13 +36,25 @@ class WordTokenizer(Tokenizer):
     def tokenize(self, text: str) -> List[str]:
         return self.word_processor.get_tokens(text)
 
+    @overrides
+    def tokenize_with_offsets(self, text: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+        return self.word_processor.get_tokens_with_offsets(text)
+
+    @overrides
+    def cache_tokens(self, texts: List[str]):
+        self.word_processor.cache_tokens(texts)
+
     @overrides
     def get_words_for_indexer(self, text: str) -> Dict[str, List[str]]:
         return {'words': self.tokenize(text)}
 
     @overrides
     def index_text(self, text: str, data_indexer: DataIndexer) -> List:
-        return [data_indexer.get_word_index(word, namespace='words') for word in self.tokenize(text)]
+        return data_indexer.get_word_indices(self.tokenize(text), namespace='words').tolist()
+
+    @overrides
+    def _mask_words_in_array(self, indices: numpy.array, word_mask: numpy.array) -> numpy.array:
+        return numpy.where(word_mask[indices], 0, indices)
 
     @overrides
     def embed_input(self,
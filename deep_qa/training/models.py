@@ -300,6 +300,7 @@ class DeepQaModel(Model):
             verbose = 2
         index_array = numpy.arange(num_train_samples)
         out_labels = out_labels or []
+        reads_from_memmaps = any(isinstance(array, numpy.memmap) for array in ins)
         callbacks, callback_model = self._prepare_callbacks(callbacks, val_ins, epochs, batch_size,
                                                             num_train_samples, callback_metrics,
                                                             do_validation, verbose)
@@ -315,6 +316,10 @@ class DeepQaModel(Model):
             epoch_logs = {}
             for batch_index, (batch_start, batch_end) in enumerate(batches):
                 batch_ids = index_array[batch_start:batch_end]
+                if reads_from_memmaps:
+                    # The order of instances within a batch doesn't matter, and reading rows of a
+                    # memory-mapped file in order is a lot faster than reading them at random.
+                    batch_ids = numpy.sort(batch_ids)
                 try:
                     if isinstance(ins[-1], float):
                         # Do not slice the training phase flag.
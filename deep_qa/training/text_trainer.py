@@ -1,6 +1,8 @@
 from copy import deepcopy
 from typing import Any, Dict, List, Tuple
+import json
 import logging
+import os
 
 import dill as pickle
 from keras import backend as K
@@ -12,9 +14,10 @@ import tensorflow
 from ..common.checks import ConfigurationError
 from ..common.params import Params
 from ..common.util import clean_layer_name
-from ..data import tokenizers, DataIndexer, DataGenerator, IndexedDataset, TextDataset
+from ..data import tokenizers, DataIndexer, DataGenerator, IndexedDataset, LazyTextDataset, TextDataset
 from ..data.embeddings import PretrainedEmbeddings
 from ..data.instances import Instance, TextInstance
+from ..data.tokenizers.word_filter import STOPWORDS
 from ..data.datasets import concrete_datasets
 from ..layers.encoders import encoders, set_regularization_params, seq2seq_encoders
 from .trainer import Trainer
@@ -52,15 +55,21 @@ class TextTrainer(Trainer):
         These parameters specify the kind of embeddings to use for words, character, tags, or
         whatever you want to embed.  This dictionary behaves similarly to the ``encoder`` and
         ``seq2seq_encoder`` parameter dictionaries.  Valid keys are ``dimension``, ``dropout``,
-        ``pretrained_file``, ``fine_tune``, and ``project``.  The value for ``dimension`` is an
-        ``int`` specifying the dimensionality of the embedding (default 50 for words, 8 for
-        characters); ``dropout`` is a float, specifying the amount of dropout to use on the
-        embedding layer (default ``0.5``); ``pretrained_file`` is a (string) path to a glove-formatted file
-        containing pre-trained embeddings; ``fine_tune`` is a boolean specifying whether the
-        pretrained embeddings should be trainable (default ``False``); and ``project`` is a boolean
+        ``pretrained_file``, ``fine_tune``, ``project``, and ``cache_directory``.  The value for
+        ``dimension`` is an ``int`` specifying the dimensionality of the embedding (default 50 for
+        words, 8 for characters); ``dropout`` is a float, specifying the amount of dropout to use on
+        the embedding layer (default ``0.5``); ``pretrained_file`` is a (string) path to a
+        glove-formatted file containing pre-trained embeddings; ``fine_tune`` is a boolean
+        specifying whether the pretrained embeddings should be trainable (default ``False``);
+        ``project`` is a boolean
         specifying whether to add a projection layer after the embedding layer (only really useful
         in conjunction with pre-trained embeddings, to get them into a lower-dimensional space;
-        default ``False``).
+        default ``False``); and ``cache_directory`` is a directory in which to keep a binary copy
+        of the ``pretrained_file``, which is much faster to load than re-parsing the text file on
+        every run (see :func:`~deep_qa.data.embeddings.PretrainedEmbeddings.get_embedding_layer`).
+        When we use a ``pretrained_file`` and ``model_serialization_prefix`` is set, we write
+        statistics about the words the file has no vector for (how many there are, the vocabulary
+        coverage, and the most frequent ones) to ``[model_serialization_prefix]_[name]_embedding_misses.json``.
     data_generator: Dict[str, Any], optional (default=None)
         If not ``None``, we will pass these parameters to a :class:`DataGenerator` object to create
         data batches, instead of creating one big array for all of our training data.  See
@@ -73,6 +82,31 @@ class TextTrainer(Trainer):
         ``DataGenerator`` does can change the behavior of your learning algorithm, so you should
         think carefully about how exactly you want batches to be structured before you choose these
         parameters.
+    columnar_datasets: bool, optional (default=False)
+        If ``True``, we index datasets into a :class:`~deep_qa.data.ColumnarIndexedDataset`, which
+        keeps all of the word indices in flat numpy arrays instead of in ``IndexedInstance``
+        objects.  This takes a lot less memory for large datasets.  It works with or without a
+        ``data_generator``, and as long as your dataset class uses the default
+        ``TextDataset.to_indexed_dataset``.
+    num_preprocessing_workers: int, optional (default=1)
+        If greater than one, we tokenize the data to fit the vocabulary, and tokenize and index
+        it, in this many worker processes (see :func:`~deep_qa.data.DataIndexer.fit_word_dictionary`
+        and :func:`~deep_qa.data.TextDataset.to_indexed_dataset`).  We also parse pre-trained
+        embedding files with this many processes.
+    memory_mapped_arrays: bool, optional (default=False)
+        Only relevant if ``data_generator`` is ``None``.  If ``True``, instead of padding the whole
+        dataset into in-memory arrays, we pad it one batch at a time into ``.npy`` files next to
+        ``model_serialization_prefix``, and train from memory-mapped views of those files (see
+        :func:`~deep_qa.data.IndexedDataset.as_memory_mapped_training_data`).  This bounds the
+        memory used by padding to about one batch, instead of the whole dataset.
+    mask_stopwords: bool, optional (default=False)
+        If ``True``, we replace stopwords (see :data:`~deep_qa.data.tokenizers.word_filter.STOPWORDS`)
+        in the model inputs with padding, when we create data arrays for each batch.  Unlike the
+        ``"stopwords"`` word filter, this doesn't change the indexed data, so the same cached
+        indexed dataset (see ``indexed_dataset_cache``) can serve experiments with and without
+        stopwords, and it doesn't change token positions, so span labels stay valid.  This only
+        works with the ``"words"`` and ``"words and characters"`` tokenizers, and it can't be
+        combined with ``memory_mapped_arrays``.
     num_sentence_words: int, optional (default=None)
         Upper limit on length of word sequences in the training data. Ignored during testing (we
         use the value set at training time, either from this parameter or from a loaded model).  If
@@ -122,10 +156,18 @@ class TextTrainer(Trainer):
         dataset_type_key = self.dataset_params.pop_choice("type", list(concrete_datasets.keys()),
                                                           default_to_first_choice=True)
         self.dataset_type = concrete_datasets[dataset_type_key]
+        # We keep a string version of the dataset and tokenizer parameters for the
+        # `indexed_dataset_cache` fingerprint, as the objects we pass these params to pop from them.
+        self._dataset_params_string = json.dumps(self.dataset_params.as_dict(quiet=True), sort_keys=True)
+        self.columnar_datasets = params.pop('columnar_datasets', False)
+        self.memory_mapped_arrays = params.pop('memory_mapped_arrays', False)
+        self.num_preprocessing_workers = params.pop('num_preprocessing_workers', 1)
+        self.mask_stopwords = params.pop('mask_stopwords', False)
         self.num_sentence_words = params.pop('num_sentence_words', None)
         self.num_word_characters = params.pop('num_word_characters', None)
 
         tokenizer_params = params.pop('tokenizer', {})
+        self._tokenizer_params_string = json.dumps(tokenizer_params.as_dict(quiet=True), sort_keys=True)
         tokenizer_choice = tokenizer_params.pop_choice('type', list(tokenizers.keys()),
                                                        default_to_first_choice=True)
         self.tokenizer = tokenizers[tokenizer_choice](tokenizer_params)
@@ -150,6 +192,18 @@ class TextTrainer(Trainer):
 
         self.name = "TextTrainer"
         self.data_indexer = DataIndexer()
+        if self.memory_mapped_arrays and self.model_prefix is None:
+            raise ConfigurationError("memory_mapped_arrays requires model_serialization_prefix to be set")
+        if self.memory_mapped_arrays and self.mask_stopwords:
+            raise ConfigurationError("mask_stopwords can't be combined with memory_mapped_arrays")
+        if self.mask_stopwords and isinstance(self.tokenizer, tokenizers['characters']):
+            raise ConfigurationError("mask_stopwords needs a tokenizer with words, not the characters tokenizer")
+        # The stopword mask for get_input_word_mask(), and the DataIndexer and vocabulary size it
+        # was computed for.
+        self._stopword_mask = None
+        self._stopword_mask_key = None
+        # Used to give each set of memory-mapped arrays its own files.
+        self._num_memory_mapped_datasets = 0
 
         # These keep track of which names you've used to get embeddings and encoders, so that we
         # reuse layers that you want to reuse.
@@ -171,7 +225,15 @@ class TextTrainer(Trainer):
             return self.data_generator.create_generator(dataset, batch_size)
         else:
             dataset.pad_instances(self.get_padding_lengths())
-            return dataset.as_training_data()
+            if self.memory_mapped_arrays:
+                filename_prefix = "%s_data_arrays_%d" % (self.model_prefix, self._num_memory_mapped_datasets)
+                self._num_memory_mapped_datasets += 1
+                return dataset.as_memory_mapped_training_data(filename_prefix, chunk_size=batch_size)
+            inputs, labels = dataset.as_training_data()
+            word_mask = self.get_input_word_mask()
+            if word_mask is not None:
+                inputs = self.tokenizer.mask_words(inputs, word_mask)
+            return inputs, labels
 
     @overrides
     def load_dataset_from_files(self, files: List[str]):
@@ -212,14 +274,38 @@ class TextTrainer(Trainer):
     @overrides
     def set_model_state_from_dataset(self, dataset: TextDataset):
         logger.info("Fitting data indexer word dictionary.")
-        self.data_indexer.fit_word_dictionary(dataset)
+        self.data_indexer.fit_word_dictionary(dataset, num_workers=self.num_preprocessing_workers)
 
     @overrides
     def set_model_state_from_indexed_dataset(self, dataset: IndexedDataset):
         self._set_padding_lengths(dataset.padding_lengths())
 
     def _dataset_indexing_kwargs(self) -> Dict[str, Any]:
-        return {'data_indexer': self.data_indexer}
+        indexing_kwargs = {'data_indexer': self.data_indexer}
+        if self.columnar_datasets:
+            indexing_kwargs['columnar'] = True
+        if self.num_preprocessing_workers > 1:
+            indexing_kwargs['num_workers'] = self.num_preprocessing_workers
+        if issubclass(self.dataset_type, LazyTextDataset) and self.data_generator is not None:
+            # With a data generator, we can stream the data, instead of indexing it all up front.
+            indexing_kwargs['lazy'] = True
+        return indexing_kwargs
+
+    @overrides
+    def _dataset_cache_fingerprint(self) -> str:
+        return "\n".join([self.dataset_type.__name__,
+                          self._dataset_params_string,
+                          self._instance_type().__name__,
+                          self._tokenizer_params_string,
+                          self.data_indexer.fingerprint()])
+
+    @overrides
+    def _get_cacheable_model_state(self) -> Any:
+        return self.data_indexer
+
+    @overrides
+    def _set_cached_model_state(self, model_state: Any):
+        self.data_indexer = model_state
 
     @overrides
     def _set_params_from_model(self):
@@ -228,16 +314,19 @@ class TextTrainer(Trainer):
     @overrides
     def _save_auxiliary_files(self):
         super(TextTrainer, self)._save_auxiliary_files()
-        data_indexer_file = open("%s_data_indexer.pkl" % self.model_prefix, "wb")
-        pickle.dump(self.data_indexer, data_indexer_file)
-        data_indexer_file.close()
+        self.data_indexer.save_to_file("%s_data_indexer.json" % self.model_prefix)
 
     @overrides
     def _load_auxiliary_files(self):
         super(TextTrainer, self)._load_auxiliary_files()
-        data_indexer_file = open("%s_data_indexer.pkl" % self.model_prefix, "rb")
-        self.data_indexer = pickle.load(data_indexer_file)
-        data_indexer_file.close()
+        data_indexer_filename = "%s_data_indexer.json" % self.model_prefix
+        if os.path.exists(data_indexer_filename):
+            self.data_indexer = DataIndexer.load_from_file(data_indexer_filename)
+        else:
+            # Models saved by older versions of this code pickled the whole DataIndexer.
+            data_indexer_file = open("%s_data_indexer.pkl" % self.model_prefix, "rb")
+            self.data_indexer = pickle.load(data_indexer_file)
+            data_indexer_file.close()
 
     @overrides
     def _overall_debug_output(self, output_dict: Dict[str, numpy.array]) -> str:
@@ -581,6 +670,21 @@ class TextTrainer(Trainer):
             self.num_word_characters = dataset_padding_lengths.get('num_word_characters', None)
 
     # pylint: disable=no-self-use,unused-argument
+    def get_input_word_mask(self) -> numpy.array:
+        """
+        Returns a boolean array over the ``"words"`` vocabulary, which is ``True`` for words that
+        should be masked out of the model inputs in every batch, or ``None`` if nothing should be
+        masked.  By default this masks stopwords if ``mask_stopwords`` is set; you can override
+        this to mask other words.
+        """
+        if not self.mask_stopwords:
+            return None
+        key = (id(self.data_indexer), self.data_indexer.get_vocab_size())
+        if self._stopword_mask_key != key:
+            self._stopword_mask = self.data_indexer.get_word_mask(STOPWORDS)
+            self._stopword_mask_key = key
+        return self._stopword_mask
+
     def get_padding_memory_scaling(self, padding_lengths: Dict[str, int]) -> int:
         """
         This method is for computing adaptive batch sizes.  We assume that memory usage is a
@@ -594,11 +698,16 @@ class TextTrainer(Trainer):
         specific you get in specifying :math:`O(p)` in this function, the better a job we can do in
         optimizing memory usage.
 
+        :class:`DataGenerator` evaluates this function for many candidate batches at once, so
+        the values in ``padding_lengths`` might be numpy arrays instead of ints.  Write your
+        implementation using element-wise arithmetic (``*``, ``**``, ``numpy.maximum``, etc.) and
+        it will work for both.
+
         Parameters
         ----------
         padding_lengths: Dict[str, int]
             Dictionary containing padding lengths, mapping keys like ``num_sentence_words`` to
-            ints.  This method computes a function of these ints.
+            ints (or to arrays of ints).  This method computes a function of these ints.
 
         Returns
         -------
@@ -664,11 +773,17 @@ class TextTrainer(Trainer):
             pretrained_file = embedding_params.pop('pretrained_file', None)
             projection_layer = None
             if pretrained_file:
+                misses_filename = None
+                if self.model_prefix is not None:
+                    misses_filename = "%s_%s_embedding_misses.json" % (self.model_prefix, name)
                 embedding_layer = PretrainedEmbeddings.get_embedding_layer(
                         pretrained_file,
                         self.data_indexer,
                         embedding_params.pop('fine_tune', False),
-                        name=name + '_embedding')
+                        misses_filename=misses_filename,
+                        name=name + '_embedding',
+                        cache_directory=embedding_params.pop('cache_directory', None),
+                        num_workers=self.num_preprocessing_workers)
 
                 if embedding_params.pop('project', False):
                     # This projection layer is not time distributed, because we handle it later
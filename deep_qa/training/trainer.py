@@ -6,7 +6,7 @@ import numpy
 from keras.callbacks import CallbackList, EarlyStopping, LambdaCallback, ModelCheckpoint
 from keras.models import model_from_json
 
-from ..data.datasets import Dataset, IndexedDataset
+from ..data.datasets import Dataset, IndexedDataset, IndexedDatasetCache
 from ..common.checks import ConfigurationError
 from ..common.params import Params
 from ..data.instances.instance import Instance
@@ -57,6 +57,15 @@ class Trainer:
         Upper limit on the number of validation instances, analogous to ``max_training_instances``.
     max_test_instances: int, optional (default=None)
         Upper limit on the number of test instances, analogous to ``max_training_instances``.
+    indexed_dataset_cache: str, optional (default=None)
+        If set, this is a directory where we cache indexed datasets (see
+        :class:`~deep_qa.data.datasets.IndexedDatasetCache`), keyed by the contents of the data
+        files and by :func:`~Trainer._dataset_cache_fingerprint`.  When you run again on the same
+        files with the same configuration, we load the indexed data from the cache (memory-mapped)
+        instead of indexing the data again.  For the training data, we also cache the model state
+        fit on it (e.g., the vocabulary).  This only works if your ``Trainer`` implements the cache
+        methods, as :class:`~deep_qa.training.TextTrainer` does; otherwise it's ignored.  Data
+        that we stream lazily instead of indexing up front isn't cached.
     train_steps_per_epoch: int, optional (default=None)
         If :func:`~Trainer.create_data_arrays` returns a generator instead of actual arrays, how
         many steps should we run from this generator before declaring an "epoch" finished?  The
@@ -142,6 +151,11 @@ class Trainer:
         self.max_training_instances = params.pop('max_training_instances', None)
         self.max_validation_instances = params.pop('max_validation_instances', None)
         self.max_test_instances = params.pop('max_test_instances', None)
+        indexed_dataset_cache = params.pop('indexed_dataset_cache', None)
+        if indexed_dataset_cache is not None:
+            self.indexed_dataset_cache = IndexedDatasetCache(indexed_dataset_cache)
+        else:
+            self.indexed_dataset_cache = None
 
         # Data generator parameters.
         self.train_steps_per_epoch = params.pop('train_steps_per_epoch', None)
@@ -266,8 +280,7 @@ class Trainer:
             logger.info("Truncating the dataset to %d instances", max_instances)
             dataset = dataset.truncate(max_instances)
         logger.info("Indexing dataset")
-        indexing_kwargs = self._dataset_indexing_kwargs()
-        indexed_dataset = dataset.to_indexed_dataset(**indexing_kwargs)
+        indexed_dataset = self.__index_dataset(dataset, data_files, max_instances, fit_model_state=False)
         data_arrays = self.create_data_arrays(indexed_dataset, batch_size)
         return (dataset, data_arrays)
 
@@ -286,11 +299,12 @@ class Trainer:
         self.training_dataset = self.load_dataset_from_files(self.train_files)
         if self.max_training_instances:
             self.training_dataset = self.training_dataset.truncate(self.max_training_instances)
-        if self.update_model_state_with_training_data:
-            self.set_model_state_from_dataset(self.training_dataset)
         logger.info("Indexing training data")
-        indexing_kwargs = self._dataset_indexing_kwargs()
-        indexed_training_dataset = self.training_dataset.to_indexed_dataset(**indexing_kwargs)
+        fit_model_state = self.update_model_state_with_training_data
+        indexed_training_dataset = self.__index_dataset(self.training_dataset,
+                                                        self.train_files,
+                                                        self.max_training_instances,
+                                                        fit_model_state=fit_model_state)
         if self.update_model_state_with_training_data:
             self.set_model_state_from_indexed_dataset(indexed_training_dataset)
         self.training_arrays = self.create_data_arrays(indexed_training_dataset, self.batch_size)
@@ -535,6 +549,31 @@ class Trainer:
     # Protected methods - you CAN override these, if you want
     ###################
 
+    def _dataset_cache_fingerprint(self) -> str:
+        """
+        If you want to use an ``indexed_dataset_cache``, this must return a string that changes
+        whenever anything other than the data files themselves would change the result of
+        indexing a dataset (and, for training data, of :func:`~Trainer.set_model_state_from_dataset`):
+        tokenizer settings, the current vocabulary, dataset parameters, and so on.  The default of
+        ``None`` means that datasets can't be cached for this ``Trainer``.
+        """
+        return None
+
+    def _get_cacheable_model_state(self) -> Any:
+        """
+        Returns the model state set by :func:`~Trainer.set_model_state_from_dataset`, to be stored
+        in the ``indexed_dataset_cache`` with the indexed training data.
+        """
+        return None
+
+    def _set_cached_model_state(self, model_state: Any):
+        """
+        Restores model state returned by :func:`~Trainer._get_cacheable_model_state`, instead of
+        calling :func:`~Trainer.set_model_state_from_dataset`, when we find the training data in
+        the ``indexed_dataset_cache``.
+        """
+        pass
+
     def _get_callbacks(self):
         """
          Returns a set of Callbacks which are used to perform various functions within Keras' .fit method.
@@ -661,6 +700,38 @@ class Trainer:
     # consider making them protected instead.
     #################
 
+    def __index_dataset(self,
+                        dataset: Dataset,
+                        data_files: List[str],
+                        max_instances: int,
+                        fit_model_state: bool) -> IndexedDataset:
+        """
+        Indexes ``dataset`` (which was read from ``data_files`` and truncated to ``max_instances``),
+        first setting model state from it if ``fit_model_state`` is ``True``.  If we have an
+        ``indexed_dataset_cache``, we try to get both the indexed dataset and the model state from
+        there first, and store them there if they weren't found.
+        """
+        fingerprint = self._dataset_cache_fingerprint()
+        if self.indexed_dataset_cache is None or fingerprint is None:
+            if fit_model_state:
+                self.set_model_state_from_dataset(dataset)
+            return dataset.to_indexed_dataset(**self._dataset_indexing_kwargs())
+        # The fingerprint is computed before fitting any model state, so it tells us what state
+        # we're starting from, and fitting the state from the same data always gives the same result.
+        key = self.indexed_dataset_cache.key(data_files, fingerprint, str(max_instances), str(fit_model_state))
+        cached = self.indexed_dataset_cache.load(key)
+        if cached is not None:
+            indexed_dataset, model_state = cached
+            if fit_model_state:
+                self._set_cached_model_state(model_state)
+            return indexed_dataset
+        if fit_model_state:
+            self.set_model_state_from_dataset(dataset)
+        indexed_dataset = dataset.to_indexed_dataset(**self._dataset_indexing_kwargs())
+        model_state = self._get_cacheable_model_state() if fit_model_state else None
+        self.indexed_dataset_cache.save(key, indexed_dataset, model_state)
+        return indexed_dataset
+
     def __save_best_model(self):
         """
         Copies the weights from the best epoch to a final weight file.
@@ -1,4 +1,6 @@
 # pylint: disable=no-self-use,invalid-name
+import numpy
+
 from deep_qa.common import util
 from deep_qa.testing.test_case import DeepQaTestCase
 
@@ -6,3 +8,14 @@ from deep_qa.testing.test_case import DeepQaTestCase
 class TestCommonUtils(DeepQaTestCase):
     def test_group_by_count(self):
         assert util.group_by_count([1, 2, 3, 4, 5, 6, 7], 3, 20) == [[1, 2, 3], [4, 5, 6], [7, 20, 20]]
+
+    def test_add_noise_to_array_values_stays_within_noise_param(self):
+        array = numpy.asarray([0, 10, 100, 1000], dtype='float64')
+        noisy = util.add_noise_to_array_values(array, 0.1)
+        assert noisy[0] == 0
+        assert numpy.all(numpy.abs(noisy - array) <= array * 0.1)
+        assert not numpy.all(noisy == array)
+
+    def test_map_over_shards_keeps_shard_order(self):
+        results = util.map_over_shards(sum, range(10), 2, shard_size=3)
+        assert list(results) == [3, 12, 21, 9]
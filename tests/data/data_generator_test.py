@@ -1,8 +1,15 @@
 # pylint: disable=no-self-use,invalid-name
+from concurrent.futures import Future
+from unittest import mock
+import random
+
 import numpy
 
 from deep_qa.common.params import Params
-from deep_qa.data import DataGenerator, IndexedDataset
+from deep_qa.data import DataGenerator, DataIndexer, IndexedDataset, LazyTextDataset
+from deep_qa.data.instances import IndexedInstance
+from deep_qa.data.instances.text_classification import IndexedTextClassificationInstance
+from deep_qa.data.instances.text_classification import TextClassificationInstance
 from deep_qa.testing.test_case import DeepQaTestCase
 
 
@@ -84,6 +91,19 @@ class TestDataGenerator(DeepQaTestCase):
         assert self.as_list(one_epoch_arrays[2][0]) == [7, 2, 1]
         assert self.as_list(one_epoch_arrays[3][0]) == [8, 9, 5, 6]
 
+    def test_adaptive_grouping_puts_oversized_instances_in_their_own_batches(self):
+        params = Params({
+                'padding_noise': 0.0,
+                'dynamic_padding': True,
+                'adaptive_batch_sizes': True,
+                'adaptive_memory_usage_constant': 1,
+                })
+        generator = DataGenerator(self.text_trainer, params)
+        batches = generator.create_generator(IndexedDataset(self.instances))
+        assert generator.last_num_batches == 10
+        one_epoch_arrays = [next(batches) for _ in range(10)]
+        assert sorted(self.as_list(x[0])[0] for x in one_epoch_arrays) == list(range(10))
+
     def test_sort_every_batch_actually_adds_noise_every_batch(self):
         # We're just going to get two epoch's worth of batches, and make sure that they're
         # different.
@@ -125,13 +145,101 @@ class TestDataGenerator(DeepQaTestCase):
         assert self.as_list(one_epoch_arrays[5][0]) == [7]
         assert self.as_list(one_epoch_arrays[6][0]) == [8, 9]
 
+    def test_prefetching_does_not_change_batch_order(self):
+        for worker_type in ['thread', 'process']:
+            batches_by_setting = []
+            for prefetch_batches in [0, 3]:
+                random.seed(13370)
+                numpy.random.seed(13370)
+                params = Params({
+                        'padding_noise': 0.5,
+                        'dynamic_padding': True,
+                        'prefetch_batches': prefetch_batches,
+                        'num_prefetch_workers': 2,
+                        'prefetch_worker_type': worker_type,
+                        })
+                generator = DataGenerator(self.text_trainer, params)
+                batches = generator.create_generator(IndexedDataset(self.instances))
+                two_epochs = [self.as_list(next(batches)[0]) for _ in range(8)]
+                batches.close()
+                batches_by_setting.append(two_epochs)
+            assert batches_by_setting[0] == batches_by_setting[1]
+
+    def test_closing_a_prefetching_generator_cancels_batches_in_flight(self):
+        executors = []
+
+        class RecordingExecutor:
+            # Only runs the first batch, so the rest stay in flight until we close the generator.
+            def __init__(self, max_workers):  # pylint: disable=unused-argument
+                self.futures = []
+                executors.append(self)
+
+            def submit(self, function, *args):
+                future = Future()
+                if not self.futures:
+                    future.set_result(function(*args))
+                self.futures.append(future)
+                return future
+
+            def shutdown(self, wait=True):  # pylint: disable=unused-argument
+                pass
+
+        params = Params({'prefetch_batches': 3, 'prefetch_worker_type': 'thread'})
+        with mock.patch('deep_qa.data.data_generator.ThreadPoolExecutor', RecordingExecutor):
+            generator = DataGenerator(self.text_trainer, params)
+            batches = generator.create_generator(IndexedDataset(self.instances))
+            next(batches)
+            batches.close()
+        futures = executors[0].futures
+        assert len(futures) == 3
+        assert all(future.cancelled() for future in futures[1:])
+
+    def test_sort_every_epoch_leaves_instances_unpadded(self):
+        instances = [IndexedTextClassificationInstance([1] * length, True) for length in range(1, 7)]
+        dataset = IndexedDataset(instances)
+        params = Params({
+                'padding_noise': 0.5,
+                'sort_every_epoch': True,
+                'dynamic_padding': True,
+                })
+        generator = DataGenerator(SentenceTextTrainer(), params)
+        batches = generator.create_generator(dataset, batch_size=2)
+        for _ in range(3 * generator.last_num_batches):
+            inputs, _ = next(batches)
+            # Each batch is padded to its own longest instance, never to a previous batch's length.
+            assert numpy.all(inputs[:, -1] == 1)
+        assert sorted(id(instance) for instance in dataset.instances) == \
+                sorted(id(instance) for instance in instances)
+        assert sorted(len(instance.word_indices) for instance in instances) == list(range(1, 7))
+
+    def test_lazy_datasets_are_streamed_through_shuffle_buffers(self):
+        text_instances = [TextClassificationInstance(" ".join(["word"] * length), True, index=length)
+                          for length in [3, 1, 2, 6, 4, 5]]
+        data_indexer = DataIndexer()
+        dataset = LazyTextDataset(lambda: iter(text_instances))
+        data_indexer.fit_word_dictionary(dataset)
+        params = Params({
+                'padding_noise': 0.0,
+                'dynamic_padding': True,
+                'shuffle_buffer_size': 4,
+                })
+        generator = DataGenerator(SentenceTextTrainer(), params)
+        batches = generator.create_generator(dataset.to_indexed_dataset(data_indexer, lazy=True), batch_size=2)
+        assert generator.last_num_batches == 3
+        for _ in range(2):
+            one_epoch = [next(batches)[0] for _ in range(3)]
+            lengths = sorted(sorted(int(numpy.sum(row > 0)) for row in inputs) for inputs in one_epoch)
+            # The first buffer has lengths 3, 1, 2 and 6, so it's sorted into batches of (1, 2) and
+            # (3, 6); the second buffer has the last two instances.
+            assert lengths == [[1, 2], [3, 6], [4, 5]]
+
     def as_list(self, array):
         return list(numpy.squeeze(array, axis=-1))
 
 
-class FakeInstance:
+class FakeInstance(IndexedInstance):  # pylint: disable=abstract-method
     def __init__(self, index, a_length, b_length, c_length):
-        self.index = index
+        super(FakeInstance, self).__init__(None, index)
         self.a_length = a_length
         self.b_length = b_length
         self.c_length = c_length
@@ -139,7 +247,7 @@ class FakeInstance:
     def get_padding_lengths(self):
         return {'a': self.a_length, 'b': self.b_length, 'c': self.c_length}
 
-    def pad(self, lengths):
+    def pad(self, padding_lengths):
         pass
 
     def as_training_data(self):
@@ -159,3 +267,12 @@ class FakeTextTrainer:
 
     def get_padding_memory_scaling(self, lengths):
         return lengths['a'] * lengths['b'] * lengths['c']
+
+
+class SentenceTextTrainer:
+    batch_size = 2
+    def get_instance_sorting_keys(self):
+        return ['num_sentence_words']
+
+    def get_padding_lengths(self):
+        return {'num_sentence_words': None}
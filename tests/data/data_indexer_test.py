@@ -1,5 +1,6 @@
 # pylint: disable=no-self-use,invalid-name
 import codecs
+import pickle
 
 from deep_qa.data.data_indexer import DataIndexer
 from deep_qa.data.datasets import TextDataset
@@ -98,3 +99,79 @@ class TestDataIndexer(DeepQaTestCase):
         assert data_indexer.get_word_from_index(4) == "a"
         assert data_indexer.get_word_from_index(5) == "word"
         assert data_indexer.get_word_from_index(6) == "another"
+
+    def test_fit_word_dictionary_with_workers_matches_serial_fitting(self):
+        instances = [TextClassificationInstance("a b c a", True),
+                     TextClassificationInstance("d b e", True),
+                     TextClassificationInstance("c f a", True)] * 400
+        dataset = TextDataset(instances)
+        serial_indexer = DataIndexer()
+        serial_indexer.fit_word_dictionary(dataset)
+        parallel_indexer = DataIndexer()
+        parallel_indexer.fit_word_dictionary(dataset, num_workers=2)
+        assert parallel_indexer.word_indices == serial_indexer.word_indices
+
+    def test_data_indexer_can_be_pickled(self):
+        data_indexer = DataIndexer()
+        data_indexer.add_word_to_index("word")
+        data_indexer.add_word_to_index("char", namespace="characters")
+        loaded = pickle.loads(pickle.dumps(data_indexer))
+        assert loaded.fingerprint() == data_indexer.fingerprint()
+        assert loaded.get_word_index("word") == data_indexer.get_word_index("word")
+        assert loaded.get_word_index("char", namespace="characters") == 2
+        assert loaded.get_vocab_size("new namespace") == 2
+
+    def test_get_word_mask_marks_the_given_words(self):
+        data_indexer = DataIndexer()
+        the_index = data_indexer.add_word_to_index("the")
+        cat_index = data_indexer.add_word_to_index("cat")
+        mask = data_indexer.get_word_mask(["the", "a", "not in vocab"])
+        assert mask.shape == (data_indexer.get_vocab_size(),)
+        assert mask[the_index]
+        assert not mask[cat_index]
+        assert mask.sum() == 1
+
+    def test_save_and_load_round_trips(self):
+        data_indexer = DataIndexer()
+        data_indexer.add_word_to_index("word")
+        data_indexer.add_word_to_index("wörd")
+        data_indexer.add_word_to_index("char", namespace="characters")
+        data_indexer.finalize()
+        data_indexer.save_to_file(self.TEST_DIR + 'data_indexer.json')
+        loaded = DataIndexer.load_from_file(self.TEST_DIR + 'data_indexer.json')
+        assert loaded.fingerprint() == data_indexer.fingerprint()
+        assert loaded.get_word_index("wörd") == 3
+        assert loaded.get_word_from_index(3) == "wörd"
+        assert loaded.get_word_index("unseen") == 1
+        assert loaded.get_vocab_size("characters") == 3
+        assert loaded.words_in_index() == ["@@PADDING@@", "@@UNKOWN@@", "word", "wörd"]
+
+    def test_fit_word_dictionary_keeps_word_counts(self):
+        dataset = TextDataset([TextClassificationInstance("a a a a b b c c c", True)])
+        data_indexer = DataIndexer()
+        data_indexer.fit_word_dictionary(dataset, min_count=3)
+        data_indexer.add_word_to_index("d")
+        assert data_indexer.get_word_count("a") == 4
+        assert data_indexer.get_word_count("c") == 3
+        assert data_indexer.get_word_count("b") == 0
+        assert data_indexer.get_word_count("d") == 0
+        data_indexer.save_to_file(self.TEST_DIR + 'data_indexer.json')
+        loaded = DataIndexer.load_from_file(self.TEST_DIR + 'data_indexer.json')
+        assert loaded.get_word_count("a") == 4
+
+    def test_get_word_indices_matches_get_word_index(self):
+        data_indexer = DataIndexer()
+        data_indexer.add_word_to_index("a")
+        data_indexer.add_word_to_index("b", namespace="other")
+        words = ["a", "b", "unseen", "a"]
+        indices = data_indexer.get_word_indices(words)
+        assert indices.dtype == 'int32'
+        assert indices.tolist() == [data_indexer.get_word_index(word) for word in words]
+        assert data_indexer.get_word_indices([], namespace="other").tolist() == []
+
+    def test_get_character_indices_is_updated_when_the_vocabulary_changes(self):
+        data_indexer = DataIndexer()
+        a_index = data_indexer.add_word_to_index("a", namespace="characters")
+        assert data_indexer.get_character_indices(["ab", "a"]) == [(a_index, 1), (a_index,)]
+        b_index = data_indexer.add_word_to_index("b", namespace="characters")
+        assert data_indexer.get_character_indices(["ab"]) == [(a_index, b_index)]
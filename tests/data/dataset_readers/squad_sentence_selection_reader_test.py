@@ -124,28 +124,37 @@ class TestSquadSentenceSelectionReader(DeepQaTestCase):
         assert expected_line0 == lines[0]
         assert expected_line1 == lines[1]
 
-    def test_negative_sentence_choices_all_work(self):
-        # We're going to make sure that the other negative sentence selection methods don't crash
-        # here; that's about it.
-        # Note that the ordering of these sentences depends on a a particular shuffling of the
-        # data (and thus the random seed set above), and could change if you change the number of
-        # shuffles done in the code.
-        context0 = "###".join(self.sentences[i] for i in [3, 4, 0, 13, 5, 9]).replace("\\\"", "\"")
-        index0 = "4"
-        expected_line0 = self.question0 + "\t" + context0 + "\t" + index0
-
-        context1 = "###".join(self.sentences[i] for i in [4, 1, 9, 2, 7, 12]).replace("\\\"", "\"")
-        index1 = "3"
-        expected_line1 = self.question1 + "\t" + context1 + "\t" + index1
+    def read_choices(self, output_filepath: str):
+        with open(output_filepath, "r") as generated_file:
+            lines = [line.strip().split("\t") for line in generated_file]
+        return [(question, choices.split("###"), int(label)) for question, choices, label in lines]
 
+    def test_negative_sentence_choices_all_work(self):
+        # The random negatives are sampled for all questions at once, so we check the properties
+        # of the choices, instead of a particular sample.
+        sentences = [sentence.replace("\\\"", "\"") for sentence in self.sentences]
+        answers = [sentences[5], sentences[2]]
         reader = SquadSentenceSelectionReader(negative_sentence_selection="random-2,pad-to-5")
         output_filepath = reader.read_file(join(self.TEST_DIR, "squad_data.json"))
+        lines = self.read_choices(output_filepath)
+        assert len(lines) == 2
+        for (question, choices, label), expected_question, answer in zip(lines, self.questions, answers):
+            assert question == expected_question
+            assert len(choices) == 6
+            assert len(set(choices)) == 6
+            assert set(choices).issubset(sentences)
+            assert choices[label] == answer
+
+    def test_negative_sentence_choices_are_the_same_with_multiple_workers(self):
+        output_filepath = SquadSentenceSelectionReader().read_file(join(self.TEST_DIR, "squad_data.json"))
         with open(output_filepath, "r") as generated_file:
-            lines = []
-            for line in generated_file:
-                lines.append(line.strip())
-        assert expected_line0 == lines[0]
-        assert expected_line1 == lines[1]
+            lines = generated_file.readlines()
+        random.seed(1337)
+        numpy.random.seed(1337)
+        reader = SquadSentenceSelectionReader(num_workers=2)
+        output_filepath = reader.read_file(join(self.TEST_DIR, "squad_data.json"))
+        with open(output_filepath, "r") as generated_file:
+            assert generated_file.readlines() == lines
 
     def test_negative_question_choice_works(self):
         # We're going to make sure that the other negative sentence selection methods don't crash
@@ -168,21 +177,13 @@ class TestSquadSentenceSelectionReader(DeepQaTestCase):
         assert expected_line1 == lines[1]
 
     def test_negative_random_question_choice_works(self):
-        # We're going to make sure that the other negative sentence selection methods don't crash
-        # here; that's about it.
-        context0 = "###".join([self.question0, self.question1, self.sentences[5]]).replace("\\\"", "\"")
-        index0 = "2"
-        expected_line0 = self.question0 + "\t" + context0 + "\t" + index0
-
-        context1 = "###".join([self.question1, self.question0, self.sentences[2]]).replace("\\\"", "\"")
-        index1 = "2"
-        expected_line1 = self.question1 + "\t" + context1 + "\t" + index1
-
+        # With only two questions to pick two from, both of them are always picked.
+        answers = [self.sentences[5], self.sentences[2].replace("\\\"", "\"")]
         reader = SquadSentenceSelectionReader(negative_sentence_selection="questions-random-2")
         output_filepath = reader.read_file(join(self.TEST_DIR, "squad_data.json"))
-        with open(output_filepath, "r") as generated_file:
-            lines = []
-            for line in generated_file:
-                lines.append(line.strip())
-        assert expected_line0 == lines[0]
-        assert expected_line1 == lines[1]
+        lines = self.read_choices(output_filepath)
+        assert len(lines) == 2
+        for (question, choices, label), expected_question, answer in zip(lines, self.questions, answers):
+            assert question == expected_question
+            assert sorted(choices) == sorted([self.question0, self.question1, answer])
+            assert choices[label] == answer
@@ -1,5 +1,14 @@
 # pylint: disable=no-self-use,invalid-name
-from deep_qa.data.datasets.dataset import Dataset, TextDataset
+import numpy
+from numpy.testing import assert_array_equal
+
+from deep_qa.data.data_indexer import DataIndexer
+from deep_qa.data.datasets.dataset import ColumnarIndexedDataset, Dataset, IndexedDataset, TextDataset
+from deep_qa.data.datasets.dataset import LazyIndexedDataset, LazyTextDataset
+from deep_qa.data.datasets.dataset import RaggedColumn, SharedRaggedColumn
+from deep_qa.data.instances.reading_comprehension import CharacterSpanInstance, IndexedCharacterSpanInstance
+from deep_qa.data.instances.reading_comprehension import IndexedMcQuestionPassageInstance
+from deep_qa.data.instances.text_classification import IndexedTextClassificationInstance
 from deep_qa.data.instances.text_classification.text_classification_instance import TextClassificationInstance
 
 from deep_qa.testing.test_case import DeepQaTestCase
@@ -36,3 +45,269 @@ class TestTextDataset(DeepQaTestCase):
         assert instance.index == 3
         assert instance.text == "instance3"
         assert instance.label is None
+
+    def test_to_indexed_dataset_with_workers_matches_serial_indexing(self):
+        instances = [TextClassificationInstance("instance one", True, index=i) for i in range(12000)]
+        instances.append(TextClassificationInstance("another instance", False, index=12000))
+        dataset = TextDataset(instances)
+        data_indexer = DataIndexer()
+        data_indexer.fit_word_dictionary(dataset)
+        serial = dataset.to_indexed_dataset(data_indexer, columnar=True)
+        for columnar in [True, False]:
+            parallel = dataset.to_indexed_dataset(data_indexer, columnar=columnar, num_workers=2)
+            assert len(parallel) == len(serial)
+            assert [x.word_indices for x in parallel.instances] == [x.word_indices for x in serial.instances]
+            assert [x.index for x in parallel.instances] == [x.index for x in serial.instances]
+
+    def test_to_indexed_dataset_with_workers_keeps_special_tokens_in_the_vocabulary(self):
+        instances = [CharacterSpanInstance("What is %d?" % i, "It is %d, and not %d." % (i, i + 1), (6, 7))
+                     for i in range(40)]
+        dataset = TextDataset(instances)
+        data_indexer = DataIndexer()
+        data_indexer.fit_word_dictionary(dataset)
+        vocab_size = data_indexer.get_vocab_size()
+        indexed = dataset.to_indexed_dataset(data_indexer, num_workers=2)
+        assert data_indexer.get_vocab_size() == vocab_size
+        assert CharacterSpanInstance.stop_token in data_indexer.words_in_index()
+        largest_index = max(max(instance.passage_indices) for instance in indexed.instances)
+        assert largest_index < vocab_size
+
+
+class TestLazyTextDataset(DeepQaTestCase):
+    def setUp(self):
+        super(TestLazyTextDataset, self).setUp()
+        self.filename = self.TEST_DIR + 'test_dataset_file'
+        with open(self.filename, 'w') as datafile:
+            datafile.write("1\tinstance one\t0\n")
+            datafile.write("2\tinstance two\t1\n")
+            datafile.write("3\tinstance three\n")
+
+    def test_read_from_file_rereads_the_file_on_every_pass(self):
+        dataset = LazyTextDataset.read_from_file(self.filename, TextClassificationInstance)
+        assert len(dataset) == 3
+        assert [instance.text for instance in dataset.instances] == ["instance one", "instance two",
+                                                                     "instance three"]
+        assert [instance.index for instance in dataset.instances] == [1, 2, 3]
+        truncated = dataset.truncate(2)
+        assert len(truncated) == 2
+        assert [instance.index for instance in truncated.instances] == [1, 2]
+
+    def test_to_indexed_dataset_can_fit_the_data_indexer_in_the_same_pass(self):
+        dataset = LazyTextDataset.read_from_file(self.filename, TextClassificationInstance)
+        data_indexer = DataIndexer()
+        indexed_dataset = dataset.to_indexed_dataset(data_indexer, columnar=True, fit_data_indexer=True)
+        assert len(indexed_dataset) == 3
+        assert set(data_indexer.words_in_index()) >= {"instance", "one", "two", "three"}
+        word_indices = [instance.word_indices for instance in indexed_dataset.instances]
+        instance = data_indexer.get_word_index("instance")
+        assert word_indices == [[instance, data_indexer.get_word_index("one")],
+                                [instance, data_indexer.get_word_index("two")],
+                                [instance, data_indexer.get_word_index("three")]]
+
+    def test_lazy_indexed_dataset_indexes_as_it_reads(self):
+        dataset = LazyTextDataset.read_from_file(self.filename, TextClassificationInstance)
+        data_indexer = DataIndexer()
+        data_indexer.fit_word_dictionary(dataset)
+        indexed_dataset = dataset.to_indexed_dataset(data_indexer, lazy=True)
+        assert isinstance(indexed_dataset, LazyIndexedDataset)
+        assert len(indexed_dataset) == 3
+        assert indexed_dataset.padding_lengths() == {'num_sentence_words': 2}
+        labels = [instance.label for instance in indexed_dataset.instances]
+        assert labels == [False, True, None]
+
+
+class TestIndexedDataset(DeepQaTestCase):
+    def test_sort_by_padding_uses_keys_in_order(self):
+        instances = [IndexedMcQuestionPassageInstance([1, 2], [3], [[4]], 0, index=0),
+                     IndexedMcQuestionPassageInstance([1], [3, 4, 5], [[4]], 0, index=1),
+                     IndexedMcQuestionPassageInstance([1, 2], [3, 4], [[4]], 0, index=2),
+                     IndexedMcQuestionPassageInstance([1], [3], [[4]], 0, index=3)]
+        dataset = IndexedDataset(instances)
+        dataset.sort_by_padding(['num_question_words', 'num_passage_words'])
+        assert [instance.index for instance in dataset.instances] == [3, 1, 0, 2]
+        dataset.sort_by_padding(['num_passage_words'])
+        assert [instance.index for instance in dataset.instances] == [3, 0, 2, 1]
+        assert dataset.padding_length_arrays()['num_passage_words'].tolist() == [1, 1, 2, 3]
+
+    def test_padding_lengths_are_only_computed_once(self):
+        instances = [CountingInstance([1, 2, 3], True), CountingInstance([4], False)]
+        dataset = IndexedDataset(instances)
+        for _ in range(3):
+            dataset.sort_by_padding(['num_sentence_words'], padding_noise=0.5)
+        assert dataset.padding_lengths() == {'num_sentence_words': 3}
+        assert [instance.calls for instance in instances] == [1, 1]
+        dataset.instances = [instances[0]]
+        assert dataset.padding_lengths() == {'num_sentence_words': 3}
+        assert instances[0].calls == 2
+
+    def test_as_memory_mapped_training_data_matches_as_training_data(self):
+        instances = [IndexedMcQuestionPassageInstance([1, 2], [3], [[4], [5, 6]], 1, index=0),
+                     IndexedMcQuestionPassageInstance([1], [3, 4, 5], [[4], [7]], 0, index=1),
+                     IndexedMcQuestionPassageInstance([1, 2, 3], [3, 4], [[4], [7]], 0, index=2)]
+        dataset = IndexedDataset(instances)
+        dataset.pad_instances()
+        inputs, labels = dataset.as_training_data()
+        mapped_inputs, mapped_labels = dataset.as_memory_mapped_training_data(self.TEST_DIR + 'arrays',
+                                                                              chunk_size=2)
+        assert len(mapped_inputs) == len(inputs)
+        for mapped_array, array in zip(mapped_inputs, inputs):
+            assert isinstance(mapped_array, numpy.memmap)
+            assert_array_equal(mapped_array, array)
+        assert isinstance(mapped_labels, numpy.memmap)
+        assert_array_equal(mapped_labels, labels)
+
+    def test_as_memory_mapped_training_data_keeps_object_arrays_in_memory(self):
+        dataset = IndexedDataset([IndexedTextClassificationInstance([1, 2], None),
+                                  IndexedTextClassificationInstance([3], None)])
+        dataset.pad_instances()
+        inputs, labels = dataset.as_memory_mapped_training_data(self.TEST_DIR + 'arrays')
+        assert isinstance(inputs, numpy.memmap)
+        assert_array_equal(inputs, [[1, 2], [0, 3]])
+        assert labels.tolist() == [None, None]
+
+
+class CountingInstance(IndexedTextClassificationInstance):
+    def __init__(self, word_indices, label):
+        super(CountingInstance, self).__init__(word_indices, label)
+        self.calls = 0
+
+    def get_padding_lengths(self):
+        self.calls += 1
+        return super(CountingInstance, self).get_padding_lengths()
+
+
+class TestRaggedColumn:
+    def test_from_lists_round_trips_nested_lists(self):
+        rows = [[[1, 2], [3]], [], [[4]]]
+        column = RaggedColumn.from_lists(rows)
+        assert column.values.tolist() == [1, 2, 3, 4]
+        assert [offsets.tolist() for offsets in column.offsets] == [[0, 2, 2, 3], [0, 2, 3, 4]]
+        assert column.to_lists() == rows
+
+    def test_from_lists_rejects_things_that_are_not_index_lists(self):
+        assert RaggedColumn.from_lists([True, False]) is None
+        assert RaggedColumn.from_lists([(1, 2), (3, 4)]) is None
+        assert RaggedColumn.from_lists([[1], None]) is None
+
+    def test_take_and_concatenate(self):
+        rows = [[[1, 2], [3]], [], [[4]], [[5, 6, 7]]]
+        column = RaggedColumn.from_lists(rows)
+        assert column.take(numpy.asarray([3, 0, 1])).to_lists() == [rows[3], rows[0], rows[1]]
+        combined = RaggedColumn.concatenate([column, RaggedColumn.from_lists([[[8]], [[9], [10]]])])
+        assert combined.to_lists() == rows + [[[8]], [[9], [10]]]
+
+
+class TestSharedRaggedColumn:
+    def test_from_lists_stores_shared_lists_once(self):
+        passage = [[1, 2], [3]]
+        other_passage = [[4]]
+        rows = [passage, passage, other_passage, passage]
+        column = SharedRaggedColumn.from_lists(rows)
+        assert column.row_ids.tolist() == [0, 0, 1, 0]
+        assert column.table.to_lists() == [passage, other_passage]
+        restored = column.to_lists()
+        assert restored == rows
+        assert restored[0] is restored[1]
+
+    def test_from_lists_returns_none_without_shared_lists(self):
+        assert SharedRaggedColumn.from_lists([[1], [1]]) is None
+        shared = (1, 2)
+        assert SharedRaggedColumn.from_lists([shared, shared]) is None
+
+    def test_take_and_concatenate(self):
+        passage = [1, 2, 3]
+        column = SharedRaggedColumn.from_lists([passage, [4], passage])
+        taken = column.take(numpy.asarray([2, 1]))
+        assert taken.table is column.table
+        assert taken.to_lists() == [[1, 2, 3], [4]]
+        combined = SharedRaggedColumn.concatenate([column, RaggedColumn.from_lists([[5], [6, 7]])])
+        assert combined.to_lists() == [[1, 2, 3], [4], [1, 2, 3], [5], [6, 7]]
+        assert combined.row_ids.tolist() == [0, 1, 0, 2, 3]
+
+
+class TestColumnarIndexedDataset(DeepQaTestCase):
+    def setUp(self):
+        super(TestColumnarIndexedDataset, self).setUp()
+        self.instances = [IndexedTextClassificationInstance([1, 2, 3], True, 0),
+                          IndexedTextClassificationInstance([4], False, 1),
+                          IndexedTextClassificationInstance([5, 6], True, 2),
+                          IndexedTextClassificationInstance([7, 8, 9, 10], False, 3)]
+
+    def test_from_instances_round_trips_instances(self):
+        dataset = ColumnarIndexedDataset.from_instances(self.instances, chunk_size=3)
+        assert len(dataset) == 4
+        for original, restored in zip(self.instances, dataset.instances):
+            assert isinstance(restored, IndexedTextClassificationInstance)
+            assert vars(restored) == vars(original)
+        assert dataset.padding_lengths() == {'num_sentence_words': 4}
+
+    def test_sort_by_padding_select_and_truncate(self):
+        dataset = ColumnarIndexedDataset.from_instances(self.instances)
+        dataset.sort_by_padding(['num_sentence_words'])
+        assert [instance.index for instance in dataset.instances] == [1, 2, 0, 3]
+        assert dataset.instance_padding_lengths() == [{'num_sentence_words': length}
+                                                      for length in [1, 2, 3, 4]]
+        batch = dataset.select([1, 3])
+        assert [instance.word_indices for instance in batch.instances] == [[5, 6], [7, 8, 9, 10]]
+        assert batch.padding_lengths() == {'num_sentence_words': 4}
+        assert [instance.index for instance in dataset.truncate(2).instances] == [1, 2]
+
+    def test_merge_keeps_sorted_order(self):
+        first = ColumnarIndexedDataset.from_instances(self.instances[:2])
+        first.sort_by_padding(['num_sentence_words'])
+        merged = first.merge(ColumnarIndexedDataset.from_instances(self.instances[2:]))
+        assert [instance.index for instance in merged.instances] == [1, 0, 2, 3]
+
+    def test_concatenate_joins_many_chunks_at_once(self):
+        chunks = [ColumnarIndexedDataset.from_instances([instance]) for instance in self.instances]
+        chunks[1].sort_by_padding(['num_sentence_words'])
+        dataset = ColumnarIndexedDataset.concatenate(chunks + [ColumnarIndexedDataset.from_instances([])])
+        assert [instance.index for instance in dataset.instances] == [0, 1, 2, 3]
+        assert dataset.columns['word_indices'].offsets[0].tolist() == [0, 3, 4, 6, 10]
+        assert dataset.instance_lengths['num_sentence_words'].tolist() == [3, 1, 2, 4]
+
+    def test_as_training_data_matches_indexed_dataset(self):
+        instances = [IndexedMcQuestionPassageInstance([1, 2], [3, 4, 5], [[6], [7, 8]], 1),
+                     IndexedMcQuestionPassageInstance([9], [10], [[11, 12], [13], [14]], 2)]
+        columnar = ColumnarIndexedDataset.from_instances(instances)
+        indexed = IndexedDataset(instances)
+        columnar.pad_instances()
+        indexed.pad_instances()
+        columnar_inputs, columnar_labels = columnar.as_training_data()
+        inputs, labels = indexed.as_training_data()
+        for columnar_input, indexed_input in zip(columnar_inputs, inputs):
+            assert_array_equal(columnar_input, indexed_input)
+        assert_array_equal(columnar_labels, labels)
+
+    def test_shared_passages_are_stored_once(self):
+        passage = [3, 4, 5]
+        instances = [IndexedCharacterSpanInstance([1, 2], passage, (0, 1)),
+                     IndexedCharacterSpanInstance([6], passage, (1, 2)),
+                     IndexedCharacterSpanInstance([7], [8, 9], (0, 1))]
+        dataset = ColumnarIndexedDataset.from_instances(instances)
+        assert isinstance(dataset.columns['passage_indices'], SharedRaggedColumn)
+        assert dataset.columns['passage_indices'].table.values.tolist() == [3, 4, 5, 8, 9]
+        assert isinstance(dataset.columns['question_indices'], RaggedColumn)
+        merged = dataset.merge(ColumnarIndexedDataset.from_instances(instances[2:]))
+        assert [instance.passage_indices for instance in merged.instances] == [passage, passage, [8, 9], [8, 9]]
+        dataset.sort_by_padding(['num_question_words'])
+        dataset.pad_instances()
+        (_, passage_array), _ = dataset.as_training_data()
+        assert_array_equal(passage_array, [[3, 4, 5], [8, 9, 0], [3, 4, 5]])
+
+    def test_to_indexed_dataset_indexes_each_passage_once(self):
+        instances = [CharacterSpanInstance("Question %d?" % i, "Passage %d." % (i % 2), (0, 7))
+                     for i in range(6)]
+        dataset = TextDataset(instances)
+        data_indexer = DataIndexer()
+        data_indexer.fit_word_dictionary(dataset)
+        indexed_dataset = dataset.to_indexed_dataset(data_indexer, columnar=True)
+        column = indexed_dataset.columns['passage_indices']
+        assert isinstance(column, SharedRaggedColumn)
+        assert len(column.table) == 2
+
+    def test_non_index_labels_are_kept_as_objects(self):
+        instances = [IndexedCharacterSpanInstance([1, 2], [3, 4, 5], (0, 1)),
+                     IndexedCharacterSpanInstance([6], [7, 8], (1, 1))]
+        dataset = ColumnarIndexedDataset.from_instances(instances)
+        assert [instance.label for instance in dataset.instances] == [(0, 1), (1, 1)]
@@ -0,0 +1,87 @@
+# pylint: disable=no-self-use,invalid-name
+import codecs
+
+import numpy
+
+from deep_qa.data.data_indexer import DataIndexer
+from deep_qa.data.datasets import IndexedDataset, IndexedDatasetCache, IndexedLanguageModelingDataset
+from deep_qa.data.datasets import LazyTextDataset
+from deep_qa.data.datasets.dataset import SharedRaggedColumn
+from deep_qa.data.instances.reading_comprehension import IndexedMcQuestionPassageInstance
+from deep_qa.data.instances.text_classification import TextClassificationInstance
+from deep_qa.testing.test_case import DeepQaTestCase
+
+
+class TestIndexedDatasetCache(DeepQaTestCase):
+    def setUp(self):
+        super(TestIndexedDatasetCache, self).setUp()
+        self.cache = IndexedDatasetCache(self.TEST_DIR + 'cache')
+        with codecs.open(self.TRAIN_FILE, 'w', 'utf-8') as train_file:
+            train_file.write("some data\n")
+
+    def test_key_depends_on_file_contents_and_fingerprints(self):
+        key = self.cache.key([self.TRAIN_FILE], "tokenizer", "vocab")
+        assert self.cache.key([self.TRAIN_FILE], "tokenizer", "vocab") == key
+        assert self.cache.key([self.TRAIN_FILE], "tokenizer", "other vocab") != key
+        with codecs.open(self.TRAIN_FILE, 'a', 'utf-8') as train_file:
+            train_file.write("more data\n")
+        assert self.cache.key([self.TRAIN_FILE], "tokenizer", "vocab") != key
+
+    def test_save_and_load_round_trips_datasets(self):
+        instances = [IndexedMcQuestionPassageInstance([1, 2], [3], [[4], [5, 6]], 1, index=0),
+                     IndexedMcQuestionPassageInstance([1], [3, 4, 5], [[4]], 0, index=1),
+                     IndexedMcQuestionPassageInstance([1, 2, 3], [3, 4], [[4], [7]], 0, index=2)]
+        dataset = IndexedDataset(instances)
+        dataset.sort_by_padding(['num_passage_words'])
+        key = self.cache.key([self.TRAIN_FILE])
+        assert self.cache.load(key) is None
+        self.cache.save(key, dataset, model_state={'vocab': ['a', 'b']})
+
+        loaded_dataset, model_state = self.cache.load(key)
+        assert model_state == {'vocab': ['a', 'b']}
+        assert isinstance(loaded_dataset.columns['question_indices'].values, numpy.memmap)
+        assert loaded_dataset.padding_lengths() == dataset.padding_lengths()
+        for loaded, original in zip(loaded_dataset.instances, dataset.instances):
+            assert loaded.question_indices == original.question_indices
+            assert loaded.passage_indices == original.passage_indices
+            assert loaded.option_indices == original.option_indices
+            assert loaded.label == original.label
+            assert loaded.index == original.index
+
+    def test_save_and_load_keeps_shared_passages(self):
+        passage = [1, 2, 3]
+        instances = [IndexedMcQuestionPassageInstance([3], passage, [[4], [5, 6]], 1, index=0),
+                     IndexedMcQuestionPassageInstance([3, 4, 5], passage, [[4]], 0, index=1)]
+        key = self.cache.key([self.TRAIN_FILE])
+        self.cache.save(key, IndexedDataset(instances))
+        loaded_dataset, _ = self.cache.load(key)
+        column = loaded_dataset.columns['passage_indices']
+        assert isinstance(column, SharedRaggedColumn)
+        assert column.table.values.tolist() == [1, 2, 3]
+        assert [instance.passage_indices for instance in loaded_dataset.instances] == [passage, passage]
+
+    def test_save_and_load_keeps_language_modeling_windows(self):
+        dataset = IndexedLanguageModelingDataset(numpy.arange(30, dtype='int32'), 4, stride=3,
+                                                 random_offsets=True)
+        dataset.offset = 2
+        dataset = dataset.select([3, 0, 1])
+        key = self.cache.key([self.TRAIN_FILE])
+        self.cache.save(key, dataset)
+        loaded_dataset, _ = self.cache.load(key)
+        assert isinstance(loaded_dataset, IndexedLanguageModelingDataset)
+        assert isinstance(loaded_dataset.tokens, numpy.memmap)
+        assert loaded_dataset.tokens.tolist() == list(range(30))
+        assert (loaded_dataset.sequence_length, loaded_dataset.stride) == (4, 3)
+        assert loaded_dataset.random_offsets
+        assert len(loaded_dataset) == 3
+        assert loaded_dataset.as_training_data()[0].tolist() == dataset.as_training_data()[0].tolist()
+        loaded_dataset.start_epoch()
+        assert 0 <= loaded_dataset.offset < 3
+
+    def test_save_skips_lazy_datasets(self):
+        text_dataset = LazyTextDataset(lambda: iter([TextClassificationInstance("a sentence", True)]))
+        data_indexer = DataIndexer()
+        data_indexer.fit_word_dictionary(text_dataset)
+        key = self.cache.key([self.TRAIN_FILE])
+        self.cache.save(key, text_dataset.to_indexed_dataset(data_indexer, lazy=True))
+        assert self.cache.load(key) is None
@@ -1,7 +1,13 @@
 # pylint: disable=no-self-use,invalid-name
+import numpy
+import pytest
+
+from deep_qa.common.checks import ConfigurationError
 from deep_qa.common.params import Params
-from deep_qa.data.datasets import LanguageModelingDataset
+from deep_qa.data.data_indexer import DataIndexer
+from deep_qa.data.datasets import IndexedLanguageModelingDataset, LanguageModelingDataset
 from deep_qa.data.instances.language_modeling.sentence_instance import SentenceInstance
+from deep_qa.data.instances.instance import TextInstance
 from deep_qa.testing.test_case import DeepQaTestCase
 
 
@@ -11,11 +17,65 @@ class TestLanguageModellingDataset(DeepQaTestCase):
         super(TestLanguageModellingDataset, self).setUp()
         self.write_sentence_data()
 
+    def index_dataset(self, params: Params):
+        dataset = LanguageModelingDataset.read_from_file(self.TRAIN_FILE, SentenceInstance, params)
+        data_indexer = DataIndexer()
+        data_indexer.fit_word_dictionary(dataset)
+        expected_tokens = []
+        for instance in dataset.instances:
+            expected_tokens.extend(TextInstance.tokenizer.index_text(instance.text, data_indexer))
+        return dataset.to_indexed_dataset(data_indexer), expected_tokens
+
     def test_read_from_file(self):
         args = Params({"sequence_length": 4})
         dataset = LanguageModelingDataset.read_from_file(self.TRAIN_FILE, SentenceInstance, args)
 
-        instances = dataset.instances
-        assert instances[0].text == "This is a sentence"
-        assert instances[1].text == "for language modelling. Here's"
-        assert instances[2].text == "another one for language"
+        instances = list(dataset.instances)
+        assert len(instances) == 2
+        assert instances[0].text == "This is a sentence for language modelling."
+        assert instances[1].text == "Here's another one for language modelling."
+
+    def test_stride_must_be_positive(self):
+        with pytest.raises(ConfigurationError):
+            LanguageModelingDataset.read_from_file(self.TRAIN_FILE, SentenceInstance, Params({"stride": 0}))
+
+    def test_to_indexed_dataset_makes_windows_over_the_token_stream(self):
+        indexed_dataset, expected_tokens = self.index_dataset(Params({"sequence_length": 4, "stride": 2}))
+        assert indexed_dataset.tokens.tolist() == expected_tokens
+        assert len(indexed_dataset) == (len(expected_tokens) - 5) // 2 + 1
+        inputs, labels = indexed_dataset.as_training_data()
+        assert inputs.shape == (len(indexed_dataset), 4)
+        assert labels.shape == (len(indexed_dataset), 4, 1)
+        for i in range(len(indexed_dataset)):
+            assert inputs[i].tolist() == expected_tokens[2 * i:2 * i + 4]
+            assert labels[i, :, 0].tolist() == expected_tokens[2 * i + 1:2 * i + 5]
+
+    def test_token_file_is_memory_mapped(self):
+        params = Params({"sequence_length": 3, "token_file": self.TEST_DIR + "tokens.bin"})
+        indexed_dataset, expected_tokens = self.index_dataset(params)
+        assert isinstance(indexed_dataset.tokens, numpy.memmap)
+        assert indexed_dataset.tokens.tolist() == expected_tokens
+
+    def test_select_keeps_the_offset_of_its_epoch(self):
+        tokens = numpy.arange(20, dtype='int32')
+        dataset = IndexedLanguageModelingDataset(tokens, 4, stride=3, random_offsets=True)
+        # We leave room for an offset of up to two words.
+        assert len(dataset) == 5
+        dataset.offset = 2
+        batch = dataset.select([1, 0])
+        dataset.offset = 0
+        inputs, labels = batch.as_training_data()
+        assert inputs.tolist() == [[5, 6, 7, 8], [2, 3, 4, 5]]
+        assert labels[:, :, 0].tolist() == [[6, 7, 8, 9], [3, 4, 5, 6]]
+        for _ in range(10):
+            dataset.start_epoch()
+            assert 0 <= dataset.offset < 3
+            assert len(dataset) == 5
+            assert dataset.as_training_data()[0][-1, -1] < 19
+
+    def test_sort_by_padding_only_reorders_windows(self):
+        dataset = IndexedLanguageModelingDataset(numpy.arange(41, dtype='int32'), 4)
+        dataset.sort_by_padding(['num_sentence_words'], padding_noise=0.5)
+        inputs, _ = dataset.as_training_data()
+        assert sorted(inputs[:, 0].tolist()) == list(range(0, 40, 4))
+        assert dataset.padding_lengths() == {'num_sentence_words': 4}
@@ -1,11 +1,14 @@
 # pylint: disable=no-self-use,invalid-name
 import gzip
+import json
 
 import numpy
 import pytest
 from deep_qa.common.checks import ConfigurationError
 from deep_qa.data.data_indexer import DataIndexer
-from deep_qa.data.embeddings import PretrainedEmbeddings
+from deep_qa.data.datasets import TextDataset
+from deep_qa.data.embeddings import PretrainedEmbeddings, _read_embedding_blocks
+from deep_qa.data.instances.text_classification.text_classification_instance import TextClassificationInstance
 from deep_qa.models.text_classification import ClassificationModel
 from deep_qa.testing.test_case import DeepQaTestCase
 
@@ -104,3 +107,80 @@ class TestPretrainedEmbeddings(DeepQaTestCase):
             }
             model = self.get_model(ClassificationModel, args)
             model.train()
+
+    def test_get_embedding_layer_with_cache_directory_matches_reading_the_text_file(self):
+        data_indexer = DataIndexer()
+        data_indexer.add_word_to_index("word1")
+        data_indexer.add_word_to_index("unseen")
+        data_indexer.add_word_to_index("word2")
+        embeddings_filename = self.TEST_DIR + "embeddings.gz"
+        with gzip.open(embeddings_filename, 'wb') as embeddings_file:
+            embeddings_file.write("word1 1.0 2.3 -1.0\n".encode('utf-8'))
+            embeddings_file.write("word3 0.1 0.4\n".encode('utf-8'))
+            embeddings_file.write("word2 0.1 0.4 -4.0\n".encode('utf-8'))
+        expected = PretrainedEmbeddings.get_embedding_layer(embeddings_filename, data_indexer)
+        cache_directory = self.TEST_DIR + "embeddings_cache"
+        for _ in range(2):
+            embedding_layer = PretrainedEmbeddings.get_embedding_layer(embeddings_filename, data_indexer,
+                                                                       cache_directory=cache_directory)
+            assert numpy.allclose(embedding_layer._initial_weights[0], expected._initial_weights[0])
+        rows, vectors = PretrainedEmbeddings.read_binary_embeddings(embeddings_filename, cache_directory,
+                                                                    ["word2", "unseen", "word1"])
+        assert rows.tolist() == [1, -1, 0]
+        assert isinstance(vectors, numpy.memmap)
+        assert vectors.shape == (2, 3)
+
+    def test_read_binary_embeddings_uses_the_last_vector_of_repeated_words(self):
+        embeddings_filename = self.TEST_DIR + "embeddings.gz"
+        with gzip.open(embeddings_filename, 'wb') as embeddings_file:
+            embeddings_file.write("word1 1.0 2.3 -1.0\n".encode('utf-8'))
+            embeddings_file.write("word2 0.1 0.4 -4.0\n".encode('utf-8'))
+            embeddings_file.write("word1 5.0 5.0 5.0\n".encode('utf-8'))
+        rows, vectors = PretrainedEmbeddings.read_binary_embeddings(embeddings_filename,
+                                                                    self.TEST_DIR + "embeddings_cache",
+                                                                    ["word1", "word2"])
+        assert rows.tolist() == [2, 1]
+        assert numpy.allclose(vectors[2], [5.0, 5.0, 5.0])
+
+    def test_read_embedding_blocks_in_parallel_matches_serial_reading(self):
+        embeddings_filename = self.TEST_DIR + "embeddings.gz"
+        with gzip.open(embeddings_filename, 'wb') as embeddings_file:
+            for i in range(7):
+                embeddings_file.write(("word%d %d.0 0.5 -1.0\n" % (i, i)).encode('utf-8'))
+            embeddings_file.write("bad 0.1 0.4\n".encode('utf-8'))
+        words_to_keep = {"word1", "word4", "word5", "bad"}
+        serial_blocks = list(_read_embedding_blocks(embeddings_filename, words_to_keep, block_size=3))
+        parallel_blocks = list(_read_embedding_blocks(embeddings_filename, words_to_keep,
+                                                      num_workers=2, block_size=3))
+        assert [words for words, _ in serial_blocks] == [["word1"], ["word4", "word5"], []]
+        assert [words for words, _ in parallel_blocks] == [words for words, _ in serial_blocks]
+        for (_, serial_vectors), (_, parallel_vectors) in zip(serial_blocks, parallel_blocks):
+            assert serial_vectors.shape[1] == 3
+            assert numpy.allclose(serial_vectors, parallel_vectors)
+        assert numpy.allclose(serial_blocks[1][1], [[4.0, 0.5, -1.0], [5.0, 0.5, -1.0]])
+
+    def test_get_embedding_matrix_returns_miss_statistics(self):
+        dataset = TextDataset([TextClassificationInstance("word1 rare common common common", True)])
+        data_indexer = DataIndexer()
+        data_indexer.fit_word_dictionary(dataset)
+        data_indexer.add_word_to_index("word2")
+        embeddings_filename = self.TEST_DIR + "embeddings.gz"
+        with gzip.open(embeddings_filename, 'wb') as embeddings_file:
+            embeddings_file.write("word1 1.0 2.3 -1.0\n".encode('utf-8'))
+            embeddings_file.write("word2 0.1 0.4 -4.0\n".encode('utf-8'))
+        embedding_matrix, statistics = PretrainedEmbeddings.get_embedding_matrix(embeddings_filename,
+                                                                                 data_indexer,
+                                                                                 num_top_misses=1)
+        assert embedding_matrix.shape == (6, 3)
+        assert numpy.allclose(embedding_matrix[data_indexer.get_word_index("word2")], [0.1, 0.4, -4.0])
+        assert statistics['num_words'] == 4
+        assert statistics['num_misses'] == 2
+        assert statistics['coverage'] == 50.0
+        assert statistics['misses'] == [("common", 3), ("rare", 1)]
+        assert statistics['top_misses'] == [("common", 3)]
+
+        misses_filename = self.TEST_DIR + "misses.json"
+        PretrainedEmbeddings.get_embedding_layer(embeddings_filename, data_indexer,
+                                                 misses_filename=misses_filename)
+        with open(misses_filename) as misses_file:
+            assert json.load(misses_file)['misses'] == [["common", 3], ["rare", 1]]
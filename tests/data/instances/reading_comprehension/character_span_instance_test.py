@@ -41,6 +41,10 @@ class TestCharacterSpanInstance(DeepQaTestCase):
         assert instance.label == label
         assert instance.index == index
 
+    def test_words_includes_the_stop_token(self):
+        instance = CharacterSpanInstance("What do dogs eat?", "Dogs eat cats.", (9, 13))
+        assert instance.words()['words'][-1] == CharacterSpanInstance.stop_token
+
     def test_to_indexed_instance_converts_correctly(self):
         instance = CharacterSpanInstance("What do dogs eat?", "Dogs eat cats.",
                                          (9, 13))
@@ -71,3 +75,41 @@ class TestCharacterSpanInstance(DeepQaTestCase):
         assert numpy.all(question_array == numpy.asarray([dogs_index, eat_index, question_index]))
         assert numpy.all(passage_array == numpy.asarray([dogs_index, eat_index, cats_index,
                                                          period_index, stop_index, 0]))
+
+    def test_token_span_to_char_span_maps_predicted_spans_back_to_the_passage(self):
+        passage = "Dogs eat  cats."
+        instance = CharacterSpanInstance("What do dogs eat?", passage, (10, 14))
+        indexed_instance = instance.to_indexed_instance(DataIndexer())
+        assert indexed_instance.label == (2, 3)
+        assert indexed_instance.passage_offsets == [[0, 4], [5, 8], [10, 14], [14, 15]]
+        assert instance.token_span_to_char_span((1, 3)) == (5, 14)
+        # A span can end at the stop token.
+        begin, end = indexed_instance.token_span_to_char_span((2, 4))
+        assert passage[begin:end] == "cats."
+
+    def test_instances_with_the_same_passage_share_indexed_passages(self):
+        data_indexer = DataIndexer()
+        data_indexer.add_word_to_index("cats")
+        first = CharacterSpanInstance("What do dogs eat?", "Dogs eat cats.", (9, 13))
+        second = CharacterSpanInstance("Who eats cats?", "Dogs eat cats.", (0, 4))
+        passage_table = {}
+        first_indexed = first.index_with_passage_table(data_indexer, passage_table)
+        second_indexed = second.index_with_passage_table(data_indexer, passage_table)
+        assert second_indexed.passage_indices is first_indexed.passage_indices
+        assert second_indexed.passage_offsets is first_indexed.passage_offsets
+        assert second_indexed.label == (0, 1)
+
+        # Once the vocabulary changes, we index the passage again.
+        dogs_index = data_indexer.add_word_to_index("dogs")
+        third_indexed = first.index_with_passage_table(data_indexer, passage_table)
+        assert third_indexed.passage_indices[0] == dogs_index
+        assert first_indexed.passage_indices[0] == 1
+
+    def test_instances_only_share_passages_through_a_passage_table(self):
+        data_indexer = DataIndexer()
+        first = CharacterSpanInstance("What do dogs eat?", "Dogs eat cats.", (9, 13))
+        second = CharacterSpanInstance("Who eats cats?", "Dogs eat cats.", (0, 4))
+        first_indexed = first.to_indexed_instance(data_indexer)
+        second_indexed = second.to_indexed_instance(data_indexer)
+        assert second_indexed.passage_indices == first_indexed.passage_indices
+        assert second_indexed.passage_indices is not first_indexed.passage_indices
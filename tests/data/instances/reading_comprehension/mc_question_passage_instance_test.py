@@ -127,6 +127,15 @@ class TestIndexedMcQuestionPassageInstance(DeepQaTestCase):
         assert self.instance.option_indices[3] == [0]
         assert len(self.instance.option_indices) == 4
 
+    def test_pad_does_not_modify_its_inputs(self):
+        option_indices = self.instance.option_indices
+        padding_lengths = {'num_question_words': 3, 'num_passage_words': 4,
+                           'num_option_words': 1, 'num_options': 4}
+        self.instance.pad(padding_lengths)
+        assert option_indices == [[2], [3, 5], [6]]
+        assert padding_lengths == {'num_question_words': 3, 'num_passage_words': 4,
+                                   'num_option_words': 1, 'num_options': 4}
+
     def test_pad_removes_options_when_necessary(self):
         self.instance.pad({'num_question_words': 3, 'num_passage_words': 4,
                            'num_option_words': 1, 'num_options': 1})
@@ -143,3 +152,17 @@ class TestIndexedMcQuestionPassageInstance(DeepQaTestCase):
         assert np.all(inputs[0] == np.asarray([0, 0, 1, 2, 3, 5, 6]))
         assert np.all(inputs[1] == np.asarray([2, 3, 4, 5]))
         assert np.all(inputs[2] == np.asarray([[0, 2], [3, 5], [0, 6], [0, 0]]))
+
+    def test_batch_as_training_data_matches_padding_each_instance(self):
+        other_instance = IndexedMcQuestionPassageInstance([4], [5, 6], [[7, 8, 9]], 0)
+        padding_lengths = {'num_question_words': 3, 'num_passage_words': 4,
+                           'num_option_words': 2, 'num_options': 2}
+        inputs, labels = IndexedMcQuestionPassageInstance.batch_as_training_data(
+                [self.instance, other_instance], padding_lengths)
+        assert np.all(inputs[0] == np.asarray([[3, 5, 6], [0, 0, 4]]))
+        assert np.all(inputs[1] == np.asarray([[2, 3, 4, 5], [5, 6, 0, 0]]))
+        assert np.all(inputs[2] == np.asarray([[[0, 2], [3, 5]], [[8, 9], [0, 0]]]))
+        assert np.all(labels == np.asarray([[0, 1], [1, 0]]))
+        assert self.instance.option_indices == [[2], [3, 5], [6]]
+        assert padding_lengths == {'num_question_words': 3, 'num_passage_words': 4,
+                                   'num_option_words': 2, 'num_options': 2}
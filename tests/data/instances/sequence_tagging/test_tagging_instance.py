@@ -24,3 +24,11 @@ class TestIndexedTaggingInstance(DeepQaTestCase):
         text_array, label_array = self.instance.as_training_data()
         assert_array_almost_equal(text_array, [1, 2, 3, 4])
         assert_array_almost_equal(label_array, [4, 5, 6])
+
+    def test_batch_as_training_data_matches_padding_each_instance(self):
+        instances = [self.instance, IndexedTaggingInstance([7], [8])]
+        text_array, label_array = IndexedTaggingInstance.batch_as_training_data(
+                instances, {'num_sentence_words': 3})
+        assert_array_almost_equal(text_array, [[1, 2, 3], [7, 0, 0]])
+        assert_array_almost_equal(label_array, [[4, 5, 6], [8, 8, 8]])
+        assert self.instance.text_indices == [1, 2, 3, 4]
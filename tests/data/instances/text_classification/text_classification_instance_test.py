@@ -90,3 +90,13 @@ class TestIndexedTextClassificationInstance(DeepQaTestCase):
         instance.label = False
         _, label = instance.as_training_data()
         assert numpy.all(label == numpy.asarray([1, 0]))
+
+    def test_batch_as_training_data_pads_without_modifying_instances(self):
+        instances = [IndexedTextClassificationInstance([1, 2, 3, 4], True),
+                     IndexedTextClassificationInstance([5], False)]
+        inputs, labels = IndexedTextClassificationInstance.batch_as_training_data(
+                instances, {'num_sentence_words': 3})
+        assert numpy.all(inputs == numpy.asarray([[2, 3, 4], [0, 0, 5]]))
+        assert numpy.all(labels == numpy.asarray([[0, 1], [1, 0]]))
+        assert instances[0].word_indices == [1, 2, 3, 4]
+        assert instances[1].word_indices == [5]
@@ -1,10 +1,13 @@
 # pylint: disable=no-self-use,invalid-name
+import numpy
+
 from deep_qa.common.params import Params
 from deep_qa.data.data_indexer import DataIndexer
-from deep_qa.data.instances.instance import TextInstance
+from deep_qa.data.instances.instance import IndexedInstance, TextInstance
 from deep_qa.data.instances.text_classification import IndexedTextClassificationInstance
 from deep_qa.data.instances.text_classification import TextClassificationInstance
 from deep_qa.data.tokenizers import tokenizers
+from deep_qa.data.tokenizers.word_splitter import SimpleWordSplitter
 from deep_qa.testing.test_case import DeepQaTestCase
 
 class TestTextInstance(DeepQaTestCase):
@@ -27,6 +30,35 @@ class TestTextInstance(DeepQaTestCase):
                              'characters': ['t', 'h', 'i', 's', 'i', 's', 'a', 's', 'e', 'n', 't',
                                             'e', 'n', 'c', 'e', '.']}
 
+    def test_tokenize_in_batches_splits_the_texts_of_each_batch_together(self):
+        class BatchRecordingWordSplitter(SimpleWordSplitter):
+            # A splitter that really overrides split_words_batch, like the spacy one does.
+            def __init__(self):
+                super(BatchRecordingWordSplitter, self).__init__()
+                self.batches = []
+                self.num_single_splits = 0
+
+            def split_words(self, sentence):
+                self.num_single_splits += 1
+                return super(BatchRecordingWordSplitter, self).split_words(sentence)
+
+            def split_words_batch(self, sentences):
+                self.batches.append(sentences)
+                return [SimpleWordSplitter.split_words(self, sentence) for sentence in sentences]
+
+        word_splitter = BatchRecordingWordSplitter()
+        # tearDown puts the default tokenizer back.
+        TextInstance.tokenizer = tokenizers['words'](Params({}))
+        TextInstance.tokenizer.word_processor.word_splitter = word_splitter
+        instances = [TextClassificationInstance("Sentence %d." % i, None) for i in range(5)]
+        batched_instances = list(TextInstance.tokenize_in_batches(instances, batch_size=2))
+        assert batched_instances == instances
+        assert word_splitter.batches == [["Sentence 0.", "Sentence 1."],
+                                         ["Sentence 2.", "Sentence 3."],
+                                         ["Sentence 4."]]
+        assert instances[3].words() == {'words': ['sentence', '3', '.']}
+        assert word_splitter.num_single_splits == 0
+
     def test_to_indexed_instance_converts_correctly(self):
         data_indexer = DataIndexer()
         sentence_index = data_indexer.add_word_to_index("sentence", namespace='words')
@@ -77,3 +109,50 @@ class TestIndexedInstance(DeepQaTestCase):
         padded = instance.pad_word_sequence(instance.word_indices,
                                             {'num_sentence_words': 5, 'num_word_characters': 4})
         assert padded == [[0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0], [1, 2, 0, 0], [3, 1, 2, 0]]
+
+    def test_pad_word_sequences_pads_and_truncates_a_batch(self):
+        sequences = [[1, 2, 3], [4], []]
+        padded = IndexedInstance.pad_word_sequences(sequences, {'num_sentence_words': 2})
+        assert padded.tolist() == [[2, 3], [0, 4], [0, 0]]
+        padded = IndexedInstance.pad_word_sequences(sequences, {'num_sentence_words': 2},
+                                                    truncate_from_right=False)
+        assert padded.tolist() == [[1, 2], [4, 0], [0, 0]]
+
+    def test_pad_word_sequences_matches_pad_word_sequence(self):
+        random = numpy.random.RandomState(13370)
+        word_sequences = [[random.randint(1, 10) for _ in range(random.randint(0, 6))]
+                          for _ in range(20)]
+        character_sequences = [[[random.randint(1, 10) for _ in range(random.randint(1, 5))]
+                                for _ in range(random.randint(0, 6))]
+                               for _ in range(20)]
+        for sequences, lengths in [(word_sequences, {'num_sentence_words': 4}),
+                                   (word_sequences, {'num_sentence_words': 8}),
+                                   (character_sequences, {'num_sentence_words': 4,
+                                                          'num_word_characters': 3}),
+                                   (character_sequences, {'num_sentence_words': 7,
+                                                          'num_word_characters': 6})]:
+            for truncate_from_right in [True, False]:
+                padded = IndexedInstance.pad_word_sequences(sequences, lengths, truncate_from_right)
+                expected = [IndexedInstance.pad_word_sequence(sequence, lengths, truncate_from_right)
+                            for sequence in sequences]
+                assert padded.tolist() == expected
+
+    def test_pad_word_sequence_lists_matches_padding_each_sequence(self):
+        random = numpy.random.RandomState(13370)
+        word_sequence_lists = [[[random.randint(1, 10) for _ in range(random.randint(0, 6))]
+                                for _ in range(random.randint(0, 5))]
+                               for _ in range(10)]
+        character_sequence_lists = [[[[random.randint(1, 10) for _ in range(random.randint(1, 5))]
+                                      for _ in range(random.randint(0, 6))]
+                                     for _ in range(random.randint(0, 5))]
+                                    for _ in range(10)]
+        for sequence_lists, lengths in [(word_sequence_lists, {'num_sentence_words': 4}),
+                                        (character_sequence_lists, {'num_sentence_words': 4,
+                                                                    'num_word_characters': 3})]:
+            original_lengths = dict(lengths)
+            padded = IndexedInstance.pad_word_sequence_lists(sequence_lists, 3, lengths)
+            expected = [[IndexedInstance.pad_word_sequence(sequence, lengths)
+                         for sequence in (sequences[:3] + [[]] * (3 - len(sequences[:3])))]
+                        for sequences in sequence_lists]
+            assert padded.tolist() == expected
+            assert lengths == original_lengths
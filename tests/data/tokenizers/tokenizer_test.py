@@ -1,5 +1,8 @@
 # pylint: disable=no-self-use,invalid-name
+import numpy
+from numpy.testing import assert_array_equal
 
+from deep_qa.data.tokenizers.word_and_character_tokenizer import WordAndCharacterTokenizer
 from deep_qa.data.tokenizers.word_tokenizer import WordTokenizer
 from deep_qa.common.params import Params
 
@@ -20,3 +23,33 @@ class TestTokenizer:
         # "Lenox Hill Hospital in New York."
         token_span = self.tokenizer.char_span_to_token_span(self.passage, (91, 123))
         assert token_span == (22, 29)
+
+    def test_char_span_to_token_span_handles_partial_and_empty_spans(self):
+        # "anuary 7", starting inside a token, so we get the whole token.
+        assert self.tokenizer.char_span_to_token_span(self.passage, (4, 12)) == (1, 3)
+        # "January 7, 20", ending inside a token.
+        assert self.tokenizer.char_span_to_token_span(self.passage, (3, 16)) == (1, 5)
+        # " January", starting on a space.
+        assert self.tokenizer.char_span_to_token_span(self.passage, (2, 10)) == (1, 2)
+        assert self.tokenizer.char_span_to_token_span(self.passage, (3, 3)) == (1, 1)
+
+    def test_token_span_to_char_span_inverts_char_span_to_token_span(self):
+        tokens, offsets = self.tokenizer.tokenize_with_offsets(self.passage)
+        assert tokens == self.tokenizer.tokenize(self.passage)
+        token_span = self.tokenizer.char_span_to_token_span(self.passage, (91, 123), offsets)
+        assert token_span == (22, 29)
+        char_span = self.tokenizer.token_span_to_char_span(offsets, token_span)
+        assert self.passage[char_span[0]:char_span[1]] == "Lenox Hill Hospital in New York."
+
+    def test_mask_words_replaces_masked_words_with_padding(self):
+        word_mask = numpy.asarray([False, False, True, False])
+        inputs = (numpy.asarray([[1, 2, 3], [2, 2, 0]]), numpy.asarray([[[3, 2], [1, 0]]]))
+        masked_inputs = self.tokenizer.mask_words(inputs, word_mask)
+        assert_array_equal(masked_inputs[0], [[1, 0, 3], [0, 0, 0]])
+        assert_array_equal(masked_inputs[1], [[[3, 0], [1, 0]]])
+        assert_array_equal(inputs[0], [[1, 2, 3], [2, 2, 0]])
+
+        # With characters, the whole word gets masked, based on the word index.
+        tokenizer = WordAndCharacterTokenizer(Params({}))
+        word_and_characters = numpy.asarray([[[2, 5, 6], [3, 2, 2]]])
+        assert_array_equal(tokenizer.mask_words(word_and_characters, word_mask), [[[0, 0, 0], [3, 2, 2]]])
@@ -18,3 +18,39 @@ class TestWordProcessor:
         expected_tokens = ["sentenc", "ha", "crazi", "punctuat"]
         tokens = word_processor.get_tokens(sentence)
         assert tokens == expected_tokens
+
+    def test_caches_tokens_and_evicts_least_recently_used(self):
+        word_processor = WordProcessor(Params({'token_cache_size': 2}))
+        calls = []
+        split_words = word_processor.word_splitter.split_words
+        word_processor.word_splitter.split_words = lambda sentence: calls.append(sentence) or split_words(sentence)
+        tokens = word_processor.get_tokens("a sentence.")
+        tokens.append("modified")
+        assert word_processor.get_tokens("a sentence.") == ["a", "sentence", "."]
+        assert calls == ["a sentence."]
+        word_processor.get_tokens("second")
+        word_processor.get_tokens("a sentence.")
+        word_processor.get_tokens("third")
+        word_processor.get_tokens("a sentence.")
+        word_processor.get_tokens("second")
+        assert calls == ["a sentence.", "second", "third", "second"]
+
+    def test_does_not_cache_pre_split_text(self):
+        word_processor = WordProcessor(Params({'word_splitter': 'no_op'}))
+        assert word_processor.get_tokens(["some", "words"]) == ["some", "words"]
+
+    def test_tokens_and_offsets_share_the_cache(self):
+        word_processor = WordProcessor(Params({'word_filter': 'stopwords'}))
+        calls = []
+        split_words = word_processor.word_splitter.split_words
+        word_processor.word_splitter.split_words = lambda sentence: calls.append(sentence) or split_words(sentence)
+        sentence = "The Cat sat."
+        assert word_processor.get_tokens(sentence) == ["cat", "sat"]
+        tokens, offsets = word_processor.get_tokens_with_offsets(sentence)
+        assert tokens == ["cat", "sat"]
+        assert [sentence[start:end] for start, end in offsets] == ["Cat", "sat"]
+        assert calls == [sentence]
+        word_processor.cache_tokens(["A dog ran."])
+        _, offsets = word_processor.get_tokens_with_offsets("A dog ran.")
+        assert offsets == [(2, 5), (6, 9)]
+        assert calls == [sentence, "A dog ran."]
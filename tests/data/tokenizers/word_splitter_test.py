@@ -1,5 +1,7 @@
 # pylint: disable=no-self-use,invalid-name
+import random
 
+from deep_qa.data.tokenizers.word_splitter import FastSimpleWordSplitter
 from deep_qa.data.tokenizers.word_splitter import SimpleWordSplitter
 from deep_qa.data.tokenizers.word_splitter import SpacyWordSplitter
 
@@ -39,6 +41,56 @@ class TestSimpleWordSplitter:
         tokens = self.word_splitter.split_words(sentence)
         assert tokens == expected_tokens
 
+    def test_split_words_with_offsets_gives_character_spans_in_the_original_sentence(self):
+        sentence = "Mr. Jones (isn't he?)  went home."
+        words, offsets = self.word_splitter.split_words_with_offsets(sentence)
+        assert words == self.word_splitter.split_words(sentence)
+        assert [sentence[start:end].lower() for start, end in offsets] == words
+        assert offsets[:3] == [(0, 3), (4, 9), (10, 11)]
+
+    def test_split_words_with_offsets_handles_characters_that_change_length_when_lower_cased(self):
+        # "İ".lower() is two characters long.
+        sentence = "İstanbul is big. The answer is Paris today."
+        words, offsets = self.word_splitter.split_words_with_offsets(sentence)
+        assert [sentence[start:end] for start, end in offsets] == ["İstanbul", "is", "big", ".", "The",
+                                                                   "answer", "is", "Paris", "today", "."]
+        assert sentence[slice(*offsets[words.index("paris")])] == "Paris"
+
+
+class TestFastSimpleWordSplitter:
+    word_splitter = FastSimpleWordSplitter()
+    reference_splitter = SimpleWordSplitter()
+
+    def test_matches_simple_word_splitter_on_squad_and_snli_text(self):
+        sentences = [
+                # SQuAD
+                "Architecturally, the school has a Catholic character. Atop the Main Building's gold "
+                "dome is a golden statue of the Virgin Mary.",
+                "What is in front of the Notre Dame Main Building?",
+                "The Normans (Norman: Nourmands; French: Normands; Latin: Normanni) were the people "
+                "who in the 10th and 11th centuries gave their name to Normandy, a region in France.",
+                "Beyoncé Giselle Knowles-Carter (/biːˈjɒnseɪ/ bee-YON-say) (born September 4, 1981) "
+                "is an American singer, songwriter, record producer and actress.",
+                "In 2011, Forbes listed her as the world's 100 most powerful celebrities—and "
+                "“the most-watched” act, with $115 million [citation needed] earned (approx.).",
+                # SNLI
+                "A person on a horse jumps over a broken down airplane.",
+                "A person is at a diner, ordering an omelette.",
+                "Children smiling and waving at camera",
+                "Two blond women are hugging one another.",
+                "The church has cracks in the ceiling... isn't that \"dangerous\"?!",
+                ]
+        for sentence in sentences:
+            assert self.word_splitter.split_words(sentence) == self.reference_splitter.split_words(sentence)
+
+    def test_matches_simple_word_splitter_on_random_punctuation(self):
+        pieces = list("\"'.,;:!?%()[]{}#$“”‘’ab ") + ["n't", "'s", "’ve", "'ll", "mr.", "mrs.", "e.g.",
+                                                     "c.f.", "etc.", "al.", " "]
+        random.seed(13370)
+        for _ in range(5000):
+            sentence = ''.join(random.choice(pieces) for _ in range(random.randint(0, 12)))
+            assert self.word_splitter.split_words(sentence) == self.reference_splitter.split_words(sentence)
+
 
 class TestSpacyWordSplitter:
     word_splitter = SpacyWordSplitter()
@@ -0,0 +1,15 @@
+# pylint: disable=no-self-use,invalid-name
+
+from deep_qa.data.tokenizers.word_stemmer import PorterStemmer
+
+
+class TestPorterStemmer:
+    def test_caches_stems_up_to_cache_size(self):
+        stemmer = PorterStemmer(cache_size=2)
+        words = ["running", "jumps", "running", "crazy", "crazy", "jumps"]
+        assert [stemmer.stem_word(word) for word in words] == ["run", "jump", "run", "crazi", "crazi", "jump"]
+        statistics = stemmer.cache_statistics()
+        assert statistics['hits'] == 2
+        assert statistics['misses'] == 4
+        assert statistics['hit_rate'] == 2 / 6
+        assert statistics['cached_words'] == 2
@@ -1,8 +1,12 @@
 # pylint: disable=no-self-use,invalid-name
 from unittest import mock
 
+import pytest
+
+from deep_qa.common.checks import ConfigurationError
 from deep_qa.common.params import Params, pop_choice
-from deep_qa.data.datasets import Dataset, SnliDataset
+from deep_qa.data import DataIndexer
+from deep_qa.data.datasets import Dataset, SnliDataset, TextDataset
 from deep_qa.layers.encoders import encoders
 from deep_qa.models.text_classification import ClassificationModel
 from deep_qa.testing.test_case import DeepQaTestCase
@@ -113,6 +117,50 @@ class TestTextTrainer(DeepQaTestCase):
         self.write_true_false_model_files()
         self.ensure_model_trains_and_loads(ClassificationModel, args)
 
+    def test_columnar_datasets_work(self):
+        args = Params({
+                'test_files': [self.TEST_FILE],
+                'embeddings': {'words': {'dimension': 4}, 'characters': {'dimension': 2}},
+                'save_models': True,
+                'tokenizer': {'type': 'words and characters'},
+                'columnar_datasets': True,
+                'data_generator': {'dynamic_padding': True},
+                'batch_size': 2,
+        })
+        self.write_true_false_model_files()
+        self.ensure_model_trains_and_loads(ClassificationModel, args)
+
+    def test_memory_mapped_arrays_work(self):
+        args = Params({
+                'test_files': [self.TEST_FILE],
+                'embeddings': {'words': {'dimension': 4}, 'characters': {'dimension': 2}},
+                'save_models': True,
+                'tokenizer': {'type': 'words and characters'},
+                'memory_mapped_arrays': True,
+                'batch_size': 2,
+        })
+        self.write_true_false_model_files()
+        self.ensure_model_trains_and_loads(ClassificationModel, args)
+
+    def test_mask_stopwords_needs_a_word_tokenizer(self):
+        self.write_true_false_model_files()
+        args = {'tokenizer': {'type': 'characters'}, 'mask_stopwords': True}
+        with pytest.raises(ConfigurationError):
+            self.get_model(ClassificationModel, args)
+
+    def test_indexed_dataset_cache_skips_fitting_and_indexing(self):
+        self.write_true_false_model_files()
+        args = {'indexed_dataset_cache': self.TEST_DIR + 'cache'}
+        model = self.get_model(ClassificationModel, args)
+        model.train()
+        cached_model = self.get_model(ClassificationModel, args)
+        with mock.patch.object(DataIndexer, 'fit_word_dictionary') as fit_word_dictionary, \
+                mock.patch.object(TextDataset, 'to_indexed_dataset') as to_indexed_dataset:
+            cached_model.train()
+        assert not fit_word_dictionary.called
+        assert not to_indexed_dataset.called
+        assert cached_model.data_indexer.fingerprint() == model.data_indexer.fingerprint()
+
     def test_pretrained_embeddings_works_correctly(self):
         self.write_true_false_model_files()
         self.write_pretrained_vector_files()